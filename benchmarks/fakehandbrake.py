@@ -0,0 +1,58 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+"""
+Stand-in for HandBrakeCLI, to be given to rip.py with --handbrakecli.
+Scans print a synthetic scan of the input, rips print progress lines then
+write the output file. Tunable with environment variables:
+
+RIPPY_FAKE_SCAN_DELAY  seconds spent scanning (default: 0)
+RIPPY_FAKE_RIP_DELAY   seconds spent ripping (default: 0)
+RIPPY_FAKE_TITLES      titles per source (default: 1)
+RIPPY_FAKE_SIZE        index of synthetic.SIZES, 0 is 1080p (default: 0)
+RIPPY_FAKE_OUTPUT      size of ripped files in bytes (default: 1024)
+RIPPY_FAKE_FAIL        rips whose output contains this string fail
+"""
+
+import os, sys, time, zlib
+from os import path
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+from benchmarks.synthetic import scanoutput, progresslines
+
+def env(name, default, convert=float):
+    return convert(os.environ.get('RIPPY_FAKE_' + name, default))
+
+def getarg(args, name):
+    return args[args.index(name) + 1] if name in args else None
+
+def main(args):
+    if '--scan' in args:
+        time.sleep(env('SCAN_DELAY', 0))
+        source = getarg(args, '--input')
+        sys.stderr.write(scanoutput(source=source, titles=env('TITLES', 1, int), seed=zlib.crc32(source) & 0xffff,
+                                    size=env('SIZE', 0, int)))
+        return 0
+    output = getarg(args, '--output')
+    if os.environ.get('RIPPY_FAKE_FAIL') and os.environ['RIPPY_FAKE_FAIL'] in output:
+        sys.stderr.write('ERROR: fake failure\n')
+        return 3
+    lines = progresslines(tasks=2 if '--two-pass' in args else 1, steps=20)
+    delay = env('RIP_DELAY', 0) / len(lines)
+    for line in lines:
+        sys.stdout.write('\r' + line)
+        sys.stdout.flush()
+        time.sleep(delay)
+    if not path.isdir(path.dirname(output)):
+        try:
+            os.makedirs(path.dirname(output))
+        except OSError:
+            pass
+    with open(output, 'wb') as fhandler:
+        fhandler.write('\0' * env('OUTPUT', 1024, int))
+    sys.stderr.write('\nEncode done!\nHandBrake has exited.\n')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,53 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+"""
+Micro-benchmark of HandbrakeOutputParser over synthetic multi-title BluRay scans.
+Usage: python -m benchmarks.parser [--titles N] [--repeat N]
+"""
+
+import time
+from argparse import ArgumentParser
+from handbrake import HandbrakeOutputParser
+from benchmarks.synthetic import scanoutput
+
+def best(func, repeat):
+    """Best wall time of repeat calls to func"""
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+def parse(buf):
+    hop = HandbrakeOutputParser(buf)
+    hop.parse()
+    return hop
+
+def feed(buf, chunksize=4096):
+    hop = HandbrakeOutputParser()
+    for i in range(0, len(buf), chunksize):
+        hop.feed(buf[i:i + chunksize])
+    hop.close()
+    return hop
+
+def main():
+    parser = ArgumentParser(description="HandbrakeOutputParser benchmark")
+    parser.add_argument("--titles", dest='titles', default=[1, 50, 500], type=int, nargs='+', help='Number of titles of each dump')
+    parser.add_argument("--repeat", dest='repeat', default=5, type=int, help='Best of REPEAT runs (default: 5)')
+    args = parser.parse_args()
+    print('%8s %10s %12s %12s %12s' % ('titles', 'size (KB)', 'parse (ms)', 'feed (ms)', 'MB/s'))
+    for titles in args.titles:
+        buf = scanoutput(titles=titles, audio=12, subtitles=30, chapters=24, main=max(1, titles // 2))
+        hop = parse(buf)
+        assert len(hop.titles) == titles and hop.title == str(max(1, titles // 2))
+        t_parse = best(lambda: parse(buf), args.repeat)
+        t_feed = best(lambda: feed(buf), args.repeat)
+        print('%8d %10d %12.2f %12.2f %12.2f' % (titles, len(buf) / 1024, t_parse * 1000, t_feed * 1000,
+                                               len(buf) / 1024.0 / 1024.0 / t_parse))
+
+if __name__ == '__main__':
+    main()
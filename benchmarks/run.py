@@ -0,0 +1,135 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+"""
+Measures rippy's own overhead with benchmarks/fakehandbrake.py in place of
+HandBrakeCLI, on synthetic libraries of several sizes.
+Usage: python -m benchmarks.run [--sizes 10 1000 10000] [--output report.json] [--compare old.json]
+
+Scenarios:
+  walk    rip.scan() over a library of SIZE sources (mkv, BluRay and DVD folders)
+  parse   HandbrakeOutputParser.parse() of SIZE scan outputs
+  hbscan  HandbrakeProcess.scan() of SIZE sources (at most --max-spawn)
+  mkvprobe  mkvprobe.probe() of the headers of SIZE mkv files
+  handle  rip.py end to end, scans and rips of SIZE sources (at most --max-spawn)
+"""
+
+import os, sys, time, json, shutil, tempfile, platform
+from os import path
+from argparse import ArgumentParser
+from subprocess import Popen, PIPE, call
+from handbrake import HandbrakeProcess, HandbrakeOutputParser
+from benchmarks.synthetic import scanoutput, makelibrary
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+FAKE = path.join(ROOT, 'benchmarks', 'fakehandbrake.py')
+SCENARIOS = ['walk', 'parse', 'hbscan', 'mkvprobe', 'handle']
+
+def getversion():
+    child = Popen(['git', 'describe', '--always', '--dirty'], cwd=ROOT, stdout=PIPE, stderr=PIPE)
+    stdout, stderr = child.communicate()
+    return stdout.strip() if child.returncode == 0 else 'unknown'
+
+def library(workdir, size):
+    """Library of size sources: 80% mkv, 15% BluRay and 5% DVD folders"""
+    root = path.join(workdir, 'library')
+    bluray = size * 15 // 100
+    dvd = size * 5 // 100
+    sources = makelibrary(root, mkv=size - bluray - dvd, bluray=bluray, dvd=dvd)
+    return root, sources
+
+def walk(workdir, size):
+    import rip
+    root, sources = library(workdir, size)
+    start = time.time()
+    found = list(rip.scan([root]))
+    elapsed = time.time() - start
+    assert len(found) == len(sources), '%d sources found instead of %d' % (len(found), len(sources))
+    return len(found), elapsed
+
+def parse(workdir, size):
+    bufs = [scanoutput(source='/media/BD/MOVIE%05d' % i, seed=i) for i in range(size)]
+    start = time.time()
+    for buf in bufs:
+        HandbrakeOutputParser(buf).parse()
+    return size, time.time() - start
+
+def hbscan(workdir, size):
+    HandbrakeProcess.setbinary(FAKE)
+    start = time.time()
+    for i in range(size):
+        hop = HandbrakeOutputParser()
+        HandbrakeProcess('/media/BD/MOVIE%05d' % i).scan(hop)
+        hop.close()
+    return size, time.time() - start
+
+def mkvprobe(workdir, size):
+    import mkvprobe
+    files = makelibrary(path.join(workdir, 'mkv'), mkv=size)
+    start = time.time()
+    for f in files:
+        mkvprobe.probe(f)
+    return size, time.time() - start
+
+def handle(workdir, size, jobs=4):
+    root, sources = library(workdir, size)
+    env = dict(os.environ)
+    env['HOME'] = path.join(workdir, 'home')
+    command = [sys.executable, path.join(ROOT, 'rip.py'), '--handbrakecli', FAKE, '--no-cache', '--duplicates', 'rip',
+               '-j', str(jobs), '--scan-jobs', str(jobs), '-d', path.join(workdir, 'dest'), root]
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        returncode = call(command, env=env, stdout=devnull)
+        elapsed = time.time() - start
+    assert returncode == 0, 'rip.py exited with code %d' % returncode
+    # Sources of the same name are ripped to the same file
+    from rip import getnewfilepath
+    expected = len(set(getnewfilepath(path.join(workdir, 'dest'), f) for f in sources))
+    ripped = len(os.listdir(path.join(workdir, 'dest')))
+    assert ripped == expected, '%d files ripped instead of %d' % (ripped, expected)
+    return size, elapsed
+
+def compare(report, old):
+    print('\n%-8s %8s %14s %14s %8s' % ('scenario', 'size', 'old (ms/item)', 'new (ms/item)', 'ratio'))
+    previous = dict(((r['scenario'], r['size']), r) for r in old['results'])
+    for r in report['results']:
+        o = previous.get((r['scenario'], r['size']))
+        if o is not None and o['per_item_ms'] > 0:
+            print('%-8s %8d %14.3f %14.3f %8.2f' % (r['scenario'], r['size'], o['per_item_ms'], r['per_item_ms'],
+                                                 r['per_item_ms'] / o['per_item_ms']))
+
+def main():
+    parser = ArgumentParser(description="Rippy benchmarks")
+    parser.add_argument("--sizes", dest='sizes', default=[10, 1000, 10000], type=int, nargs='+', help='Number of titles of each run (default: 10 1000 10000)')
+    parser.add_argument("--scenarios", dest='scenarios', default=SCENARIOS, nargs='+', choices=SCENARIOS, help='Scenarios to run (default: all)')
+    parser.add_argument("--max-spawn", dest='maxspawn', default=1000, type=int, help='Maximum size of scenarios spawning one process per title (default: 1000)')
+    parser.add_argument("--output", dest='output', help='Write the report to this JSON file')
+    parser.add_argument("--compare", dest='compare', help='JSON report of a previous version to compare with')
+    args = parser.parse_args()
+    report = {'version': getversion(), 'python': platform.python_version(), 'date': time.time(), 'results': []}
+    print('rippy %s, python %s' % (report['version'], report['python']))
+    print('%-8s %8s %8s %12s %12s' % ('scenario', 'size', 'items', 'total (s)', 'ms/item'))
+    for scenario in args.scenarios:
+        for size in args.sizes:
+            if scenario in ('hbscan', 'handle') and size > args.maxspawn:
+                continue
+            workdir = tempfile.mkdtemp(prefix='rippy-bench-')
+            try:
+                count, elapsed = globals()[scenario](workdir, size)
+            finally:
+                shutil.rmtree(workdir)
+            result = {'scenario': scenario, 'size': size, 'count': count, 'seconds': elapsed,
+                      'per_item_ms': elapsed * 1000.0 / max(1, count)}
+            report['results'].append(result)
+            print('%-8s %8d %8d %12.3f %12.3f' % (scenario, size, count, elapsed, result['per_item_ms']))
+    if args.output is not None:
+        with open(args.output, 'w') as fhandler:
+            json.dump(report, fhandler, indent=2, sort_keys=True)
+    if args.compare is not None:
+        with open(args.compare, 'r') as fhandler:
+            compare(report, json.load(fhandler))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+"""
+Synthetic HandbrakeCLI outputs, to measure rippy without real sources.
+"""
+
+import os, random, struct
+from os import path
+
+# Name, ISO 639-2/T code printed by HandbrakeCLI, ISO 639-2/B code and BCP 47 tag written by mkvmerge
+LANGUAGES = [('English', 'eng', 'eng', 'en'), ('Francais', 'fra', 'fre', 'fr-FR'), ('Deutsch', 'deu', 'ger', 'de'),
+             ('Espanol', 'spa', 'spa', 'es-ES'), ('Italiano', 'ita', 'ita', 'it'), ('Japanese', 'jpn', 'jpn', 'ja'),
+             ('Nederlands', 'nld', 'dut', 'nl'), ('Polski', 'pol', 'pol', 'pl')]
+AUDIO_CODECS = [('DTS-HD MA', '7.1 ch'), ('DTS', '5.1 ch'), ('AC3', '5.1 ch'), ('TrueHD', '7.1 ch'), ('AC3', '2.0 ch')]
+# CodecID and track name, DTS profiles being only told apart by the latter
+MKV_AUDIO_CODECS = [('A_DTS', 'DTS-HD MA 5.1'), ('A_AC3', 'Surround 5.1'), ('A_TRUEHD', 'Surround 5.1'),
+                    ('A_EAC3', 'Surround 5.1'), ('A_DTS', 'DTS 5.1')]
+SIZES = [(1920, 1080, '23.976'), (1280, 720, '23.976'), (1920, 1080, '25'), (720, 576, '25'), (720, 480, '29.970')]
+
+def hms(seconds):
+    return '%02d:%02d:%02d' % (seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+def scanoutput(source='/media/BD/MOVIE', titles=1, audio=4, subtitles=8, chapters=12, main=None, seed=0, size=None):
+    """
+    Output of `HandBrakeCLI --scan --title 0` for a source with titles titles,
+    the main feature being the one numbered main (the longest one by default).
+    size is an index of SIZES, chosen from seed by default.
+    """
+    rand = random.Random(seed)
+    width, height, fps = SIZES[(size if size is not None else seed) % len(SIZES)]
+    lines = [
+        '[10:00:00] hb_init: starting libhb thread',
+        '[10:00:00] scan: trying to open with libbluray',
+        '[10:00:01] scan: BD has %d title(s)' % titles,
+    ]
+    durations = [rand.randint(700, 3000) for i in range(titles)]
+    if main is None:
+        main = rand.randint(1, titles)
+    durations[main - 1] = rand.randint(5400, 10800)
+    for i in range(titles):
+        lines.append('[10:00:02] scan: scanning title %d' % (i + 1))
+        lines.append('[10:00:02] scan: 10 previews, %dx%d, %s fps, autocrop = 0/0/0/0, aspect 16:9, PAR 1:1' % (width, height, fps))
+    for i in range(titles):
+        lines.append('+ title %d:' % (i + 1))
+        if i + 1 == main:
+            lines.append('  + Main Feature')
+        lines.append('  + stream: %s/BDMV/PLAYLIST/%05d.mpls' % (source, i))
+        lines.append('  + duration: %s' % hms(durations[i]))
+        lines.append('  + size: %dx%d, pixel aspect: 1/1, display aspect: 1.78, %s fps' % (width, height, fps))
+        lines.append('  + autocrop: 0/0/0/0')
+        lines.append('  + chapters:')
+        for c in range(chapters):
+            lines.append('    + %d: duration %s' % (c + 1, hms(durations[i] // chapters)))
+        lines.append('  + audio tracks:')
+        for a in range(audio):
+            name, code = LANGUAGES[(a + i) % len(LANGUAGES)][:2]
+            codec, channels = AUDIO_CODECS[(a * 3 + i) % len(AUDIO_CODECS)]
+            lines.append('    + %d, %s (%s) (%s) (iso639-2: %s), 48000Hz, %dbps' %
+                         (a + 1, name, codec, channels, code, rand.choice([448000, 640000, 1536000])))
+        lines.append('  + subtitle tracks:')
+        for s in range(subtitles):
+            name, code = LANGUAGES[(s + 2 * i) % len(LANGUAGES)][:2]
+            lines.append('    + %d, %s (iso639-2: %s) (PGS)(Bitmap)' % (s + 1, name, code))
+    lines.append('HandBrake has exited.')
+    return '\n'.join(lines) + '\n'
+
+def progresslines(tasks=2, steps=100, fps=45.0):
+    """Progress lines printed on stdout by HandBrakeCLI while ripping"""
+    lines = []
+    for task in range(1, tasks + 1):
+        for step in range(steps + 1):
+            percent = 100.0 * step / steps
+            lines.append('Encoding: task %d of %d, %.2f %% (%.2f fps, avg %.2f fps, ETA 00h%02dm00s)' %
+                         (task, tasks, percent, fps, fps * 0.98, (steps - step) % 60))
+    return lines
+
+def makelibrary(root, mkv=0, bluray=0, dvd=0, depth=2, fanout=10):
+    """
+    Creates a library of sources under root: mkv files made of a header (see
+    mkvheader), empty BluRay folders (BDMV tree) and DVD folders (VIDEO_TS),
+    spread over depth levels of fanout folders.
+    Returns the list of the sources rippy should find.
+    """
+    sources = []
+    def folder(i):
+        parts = []
+        for level in range(depth):
+            parts.append('d%02d' % (i // (fanout ** level) % fanout))
+        return path.join(root, *parts)
+    def touch(filepath, data=''):
+        if not path.isdir(path.dirname(filepath)):
+            os.makedirs(path.dirname(filepath))
+        with open(filepath, 'wb') as fhandler:
+            fhandler.write(data)
+    for i in range(mkv):
+        sources.append(path.join(folder(i), 'movie%05d.mkv' % i))
+        touch(sources[-1], mkvheader(seed=i))
+    for i in range(bluray):
+        disc = path.join(folder(i), 'BLURAY%05d' % i)
+        touch(path.join(disc, 'BDMV', 'index.bdmv'))
+        touch(path.join(disc, 'BDMV', 'PLAYLIST', '00000.mpls'))
+        touch(path.join(disc, 'BDMV', 'STREAM', '00000.m2ts'))
+        sources.append(disc)
+    for i in range(dvd):
+        disc = path.join(folder(i), 'DVD%05d' % i, 'VIDEO_TS')
+        for name in ['VIDEO_TS.IFO', 'VIDEO_TS.BUP', 'VTS_01_0.IFO', 'VTS_01_1.VOB']:
+            touch(path.join(disc, name))
+        sources.append(disc)
+    return sources
+
+def element(eid, data):
+    """EBML element of id eid, data being a string or an unsigned integer"""
+    if isinstance(data, (int, long)):
+        data = struct.pack('>Q', data).lstrip('\0') or '\0'
+    size = len(data)
+    length = 1
+    while size >= (1 << (7 * length)) - 1:
+        length += 1
+    header = struct.pack('>Q', size | (1 << (7 * length)))[8 - length:]
+    return struct.pack('>I', eid).lstrip('\0') + header + data
+
+def mkvheader(audio=4, subtitles=8, chapters=12, seed=0, size=None, duration=None, ietf=False):
+    """
+    Beginning of a Matroska file, as written by mkvmerge, up to its first
+    cluster: EBML header, SeekHead, Info, Tracks, Chapters and Tags.
+    duration in seconds is chosen from seed by default. Languages are ISO
+    639-2/B codes, and also BCP 47 tags (LanguageIETF) with ietf, like
+    mkvmerge 53 and later.
+    """
+    rand = random.Random(seed)
+    width, height, fps = SIZES[(size if size is not None else seed) % len(SIZES)]
+    seconds = rand.randint(5400, 10800)
+    duration = duration if duration is not None else seconds
+    def language(i):
+        code, tag = LANGUAGES[i % len(LANGUAGES)][2:]
+        return element(0x22B59C, code) + (element(0x22B59D, tag) if ietf else '')
+    tracks = [element(0xAE, element(0xD7, 1) + element(0x73C5, 1) + element(0x83, 1) +
+                      element(0x86, 'V_MPEG4/ISO/AVC') + element(0x63A2, '\x01\x64\x00\x29') +
+                      element(0x23E383, int(round(1e9 / float(fps)))) +
+                      element(0xE0, element(0xB0, width) + element(0xBA, height)))]
+    for a in range(audio):
+        codec, name = MKV_AUDIO_CODECS[a % len(MKV_AUDIO_CODECS)]
+        tracks.append(element(0xAE, element(0xD7, a + 2) + element(0x73C5, a + 2) + element(0x83, 2) +
+                              element(0x86, codec) + element(0x536E, name) +
+                              language(a) +
+                              element(0xE1, element(0xB5, struct.pack('>d', 48000.0)) + element(0x9F, 6))))
+    for s in range(subtitles):
+        tracks.append(element(0xAE, element(0xD7, audio + s + 2) + element(0x73C5, audio + s + 2) + element(0x83, 17) +
+                              element(0x86, 'S_HDMV/PGS') + language(s)))
+    atoms = ''.join(element(0xB6, element(0x73C4, c + 1) + element(0x91, c * duration // chapters * 10 ** 9))
+                    for c in range(chapters))
+    tags = ''.join(element(0x7373, element(0x63C0, element(0x63C5, t)) +
+                           element(0x67C8, element(0x45A3, 'BPS') + element(0x4487, str(bps))))
+                   for t, bps in [(1, rand.randint(8000, 30000) * 1000)] + [(a + 2, 640000) for a in range(audio)])
+    body = [element(0x1549A966, element(0x2AD7B1, 1000000) + element(0x4489, struct.pack('>d', duration * 1000.0))),
+            element(0x1654AE6B, ''.join(tracks)),
+            element(0x1043A770, element(0x45B9, atoms)),
+            element(0x1254C367, tags)]
+    def getseekhead(offset):
+        entries = []
+        position = offset
+        for data in body:
+            entries.append(element(0x4DBB, element(0x53AB, data[:4]) + element(0x53AC, struct.pack('>Q', position))))
+            position += len(data)
+        return element(0x114D9B74, ''.join(entries))
+    # Positions are relative to the segment, which starts with the SeekHead
+    seekhead = getseekhead(len(getseekhead(0)))
+    cluster = element(0x1F43B675, element(0xE7, 0))
+    segment = seekhead + ''.join(body) + cluster
+    ebml = element(0x1A45DFA3, element(0x4286, 1) + element(0x4282, 'matroska') + element(0x4287, 4))
+    return ebml + '\x18\x53\x80\x67\x01\xff\xff\xff\xff\xff\xff\xff' + segment # segment of unknown size
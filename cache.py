@@ -0,0 +1,98 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, time, hashlib
+import cPickle as pickle
+from os import path
+from tools import getconfigdir, getreference
+
+class ScanCache:
+    """
+    Stores parsed HandbrakeCLI scans on disk, one file per source.
+    An entry is only valid as long as the source has not changed, which is
+    checked with its size and mtime (or the ones of its index file for
+    BluRay and DVD folders).
+    An entry is a header line with the version, then the pickled stamp, then
+    the pickled parser, which is only unpickled once both match.
+    """
+
+    version = 5 # Bump when HandbrakeOutputParser objects change
+    max_age = 90 * 24 * 3600 # seconds
+    max_size = 100 * 1024 * 1024 # bytes
+
+    def __init__(self, directory=None, read=True, write=True):
+        self.directory = directory if directory is not None else getconfigdir('scans')
+        self.read = read
+        self.write = write
+
+    @staticmethod
+    def getstamp(filepath):
+        """Returns what identifies the current state of a source"""
+        filepath = path.abspath(filepath)
+        ref = getreference(filepath)
+        st = os.stat(ref)
+        return (ScanCache.version, filepath, ref, st.st_size, int(st.st_mtime))
+
+    @staticmethod
+    def getheader():
+        return 'rippy scan cache %d\n' % ScanCache.version
+
+    def _entrypath(self, filepath):
+        return path.join(self.directory, hashlib.sha1(path.abspath(filepath)).hexdigest())
+
+    def get(self, filepath):
+        """Returns the cached HandbrakeOutputParser, or None"""
+        if not self.read:
+            return None
+        entry = self._entrypath(filepath)
+        try:
+            with open(entry, 'rb') as fhandler:
+                if fhandler.readline() != ScanCache.getheader():
+                    return None
+                if pickle.load(fhandler) != ScanCache.getstamp(filepath):
+                    return None
+                hop = pickle.load(fhandler)
+            os.utime(entry, None) # Used as last access time by evict()
+            return hop
+        except Exception: # Unreadable, or not unpicklable by this version: scanned again
+            return None
+
+    def put(self, filepath, hop):
+        if not self.write:
+            return
+        entry = self._entrypath(filepath)
+        tmp = '%s.%d.tmp' % (entry, os.getpid())
+        try:
+            with open(tmp, 'wb') as fhandler:
+                fhandler.write(ScanCache.getheader())
+                pickle.dump(ScanCache.getstamp(filepath), fhandler, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(hop, fhandler, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, entry)
+        except (IOError, OSError, pickle.PicklingError):
+            if path.isfile(tmp):
+                os.remove(tmp)
+
+    def evict(self, max_age=None, max_size=None):
+        """Removes entries older than max_age, then the least recently used ones above max_size"""
+        max_age = max_age if max_age is not None else ScanCache.max_age
+        max_size = max_size if max_size is not None else ScanCache.max_size
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            entry = path.join(self.directory, name)
+            try:
+                st = os.stat(entry)
+            except OSError:
+                continue
+            if now - st.st_mtime > max_age:
+                os.remove(entry)
+            else:
+                entries.append((st.st_mtime, st.st_size, entry))
+        total = sum(size for mtime, size, entry in entries)
+        for mtime, size, entry in sorted(entries):
+            if total <= max_size:
+                break
+            os.remove(entry)
+            total -= size
@@ -0,0 +1,136 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, json, hashlib
+from os import path
+from threading import Lock
+from tools import getconfigdir
+
+SAMPLES = 5 # blocks hashed per file
+BLOCKSIZE = 64 * 1024
+
+def _hashfile(sha1, filepath, size):
+    """Hashes SAMPLES blocks evenly spread over a file"""
+    with open(filepath, 'rb') as fhandler:
+        for i in range(SAMPLES):
+            fhandler.seek(max(0, (size - BLOCKSIZE) * i // (SAMPLES - 1)))
+            sha1.update(fhandler.read(BLOCKSIZE))
+
+def fingerprint(filepath):
+    """
+    Cheap fingerprint of the content of a source: size and sampled blocks of
+    a file, or for BluRay and DVD folders their type, the main playlist (or
+    IFO) and the sizes of the streams.
+    None for a folder without streams, which can't be told apart.
+    """
+    sha1 = hashlib.sha1()
+    if not path.isdir(filepath):
+        size = path.getsize(filepath)
+        sha1.update(str(size))
+        _hashfile(sha1, filepath, size)
+        return 'file:' + sha1.hexdigest()
+    if path.isdir(path.join(filepath, 'BDMV')):
+        streams = path.join(filepath, 'BDMV', 'STREAM')
+        playlists = path.join(filepath, 'BDMV', 'PLAYLIST')
+        pattern = ('.m2ts', '.mts'), ('.mpls',)
+        sha1.update('BDMV:')
+    else:
+        streams = playlists = filepath
+        pattern = ('.vob',), ('.ifo',)
+        sha1.update('VIDEO_TS:')
+    sizes = []
+    if path.isdir(streams):
+        sizes = sorted(path.getsize(path.join(streams, name)) for name in os.listdir(streams)
+                       if name.lower().endswith(pattern[0]))
+    if not sizes:
+        return None
+    sha1.update(','.join(str(size) for size in sizes))
+    if path.isdir(playlists):
+        candidates = [path.join(playlists, name) for name in os.listdir(playlists) if name.lower().endswith(pattern[1])]
+        if candidates:
+            main = max(candidates, key=path.getsize)
+            _hashfile(sha1, main, path.getsize(main))
+    return 'disc:' + sha1.hexdigest()
+
+def signature(hop):
+    """
+    Fingerprint of the main title found by the scan, the same for a disc and
+    its remux: duration, chapters and audio languages.
+    None if the title has too few chapters to be told apart.
+    """
+    for title in hop.titles:
+        if title.number == hop.title and title.duration and len(title.chapters) >= 2:
+            return 'title:%d:%s:%s' % (title.duration, ','.join(str(c) for c in title.chapters),
+                                       ','.join(sorted(a.language for a in title.audio)))
+    return None
+
+class DuplicateIndex:
+    """
+    Fingerprints of the sources already ripped, with their ripped file, stored
+    in ~/.config/rippy/fingerprints.jsonl, and of the sources being ripped.
+    A source is only stored once ripped, see register().
+    """
+
+    def __init__(self, filepath=None):
+        self.filepath = filepath if filepath is not None else path.join(getconfigdir(), 'fingerprints.jsonl')
+        self.lock = Lock()
+        self.records = {} # fingerprint -> record
+        self.pending = {} # source being ripped -> record
+        if path.isfile(self.filepath):
+            with open(self.filepath, 'r') as readhandler:
+                for line in readhandler:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    for key in record['keys']:
+                        self.records[key] = record
+
+    def check(self, source, hop, output):
+        """
+        Returns the record of the source source is a duplicate of,
+        or marks source as being ripped and returns None.
+        """
+        keys = [key for key in (fingerprint(source), signature(hop)) if key is not None]
+        if not keys:
+            return None
+        with self.lock:
+            for key in keys:
+                record = self.records.get(key)
+                # A former source only counts if its ripped file is still there
+                if record is not None and record['source'] != source and path.isfile(record['output']):
+                    return record
+                for record in self.pending.values():
+                    if key in record['keys'] and record['source'] != source:
+                        # Settled by register() or release(), see its 'waiting' key
+                        record['waiting'].append((source, output))
+                        return dict(record)
+            self.pending[source] = {'source': source, 'output': output, 'keys': keys, 'waiting': []}
+        return None
+
+    def register(self, source):
+        """
+        Stores the fingerprints of source, which has been ripped.
+        Returns the (source, output) of the duplicates found while it was being ripped.
+        """
+        with self.lock:
+            record = self.pending.pop(source, None)
+            if record is None:
+                return []
+            waiting = record.pop('waiting')
+            for key in record['keys']:
+                self.records[key] = record
+            with open(self.filepath, 'a') as fhandler:
+                fhandler.write(json.dumps(record, sort_keys=True) + '\n')
+        return waiting
+
+    def release(self, source):
+        """
+        Forgets source, which has not been ripped.
+        Returns the (source, output) of the duplicates found while it was being ripped.
+        """
+        with self.lock:
+            record = self.pending.pop(source, None)
+        return record['waiting'] if record is not None else []
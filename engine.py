@@ -0,0 +1,132 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, sys, fcntl, errno, select, traceback
+from threading import Thread
+from Queue import Queue, Empty
+from handbrake import HandbrakeProcess
+
+class RipEngine:
+    """
+    Rips the tasks of the rip queue of a pool (the Worker class of rip.py),
+    jobs of them simultaneously, from a single thread: one select() reads the
+    output of every running HandbrakeCLI, and wakes up as soon as a task is
+    queued, rips are resumed or the engine is cancelled, so nothing is polled.
+    Finished rips are handed to another thread, their bookkeeping (checksums,
+    segments appended by mkvmerge) being too slow to hold the other rips' pipes.
+    """
+
+    def __init__(self, pool, jobs=1):
+        self.pool = pool
+        self.jobs = max(1, jobs)
+        self.running = []
+        self.fds = {} # fd -> task
+        self.cancelled = False
+        self.stopped = False
+        self.finished = Queue()
+        self.wakeup, self.waker = os.pipe()
+        fcntl.fcntl(self.waker, fcntl.F_SETFL, fcntl.fcntl(self.waker, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+    def start(self):
+        self.pool.rip_queue.listeners.append(self.wake)
+        self.pool.governor.onresume = self.wake
+        for target in (self.run, self.finisher):
+            t = Thread(target=target)
+            t.start()
+
+    def wake(self):
+        """Makes the select() loop look at the queue again, from any thread"""
+        try:
+            os.write(self.waker, 'x')
+        except OSError as e:
+            if e.errno != errno.EAGAIN: # Already woken up
+                raise
+
+    def stop(self):
+        """Ends the engine once the running rips are over, cancelled ones included"""
+        self.stopped = True
+        self.wake()
+
+    def cancel(self):
+        """Interrupts the running rips, and don't start other ones"""
+        self.cancelled = True
+        for task in list(self.running):
+            task.interrupt()
+        self.wake()
+
+    def run(self):
+        while not self.stopped or self.running:
+            self.fill()
+            fds = [self.wakeup] + list(self.fds)
+            for fd in HandbrakeProcess._retry(select.select, fds, [], [])[0]:
+                if fd == self.wakeup:
+                    HandbrakeProcess._retry(os.read, fd, 4096)
+                    continue
+                task = self.fds[fd]
+                try:
+                    task.read(fd)
+                except Exception: # its log can't be written, stop it
+                    traceback.print_exc(file=sys.stderr)
+                    task.interrupt()
+                if fd not in task.pipes:
+                    del self.fds[fd]
+                if not task.pipes:
+                    self.running.remove(task)
+                    self.pool.governor.unregister(task)
+                    self.finished.put(task)
+        self.finished.put(None)
+
+    def fill(self):
+        """Starts queued tasks while there are free jobs"""
+        while len(self.running) < self.jobs and not (self.cancelled or self.stopped or self.pool.governor.paused):
+            try:
+                task = self.pool.rip_queue.get_nowait()
+            except Empty:
+                return
+            self.pool.started(task)
+            if self.pool.stager is not None:
+                self.pool.stager.claim(task)
+            try:
+                task.spawn()
+            except Exception:
+                sys.stderr.write(task.filepath + '\n')
+                traceback.print_exc(file=sys.stderr)
+                self.release(task)
+                self.pool.failed(task)
+                continue
+            self.running.append(task)
+            self.pool.governor.register(task)
+            for fd in task.pipes:
+                self.fds[fd] = task
+            if self.cancelled: # cancel() ran while it was spawned, and missed it
+                task.interrupt()
+
+    def release(self, task):
+        if self.pool.stager is not None:
+            self.pool.stager.release(task)
+
+    def finisher(self):
+        while True:
+            task = self.finished.get()
+            if task is None:
+                return
+            try:
+                try:
+                    task.wait()
+                finally:
+                    self.release(task)
+            except KeyboardInterrupt:
+                self.pool.interrupted(task)
+                self.pool.abort() # CTRL+C stops the other rips too
+                continue
+            except Exception:
+                if self.cancelled: # Killed by cancel() rather than failed
+                    self.pool.interrupted(task)
+                    continue
+                sys.stderr.write(task.filepath + '\n')
+                traceback.print_exc(file=sys.stderr)
+                self.pool.failed(task)
+                continue
+            self.pool.done(task)
@@ -0,0 +1,272 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+"""
+Encode farm: a coordinator serves its rip queue to remote workers over TCP.
+Messages are JSON objects, one per line. Paths are sent as is, so sources and
+destination must be mounted at the same place on every node.
+Workers give the secret shared with the coordinator in their hello, the other
+messages of a connection are refused until then. Messages are not encrypted,
+the farm must run on a trusted network.
+
+worker                                coordinator
+{"type": "hello", "name": ...,
+ "secret": ...}                   ->  {"type": "ok"}, or {"type": "error", ...} and closed
+{"type": "get"}                   ->  {"type": "job", "id": ..., "filepath": ..., "args": {...}}
+                                      or {"type": "wait"}, or {"type": "bye"} once finished
+{"type": "heartbeat", "id": ...,
+ "progress": ...}                     (no answer)
+{"type": "result", "id": ...,
+ "status": ..., ...}              ->  {"type": "ok"}
+"""
+
+import sys, socket, json, time, traceback, hmac
+from threading import Thread, Lock, Event
+from SocketServer import ThreadingTCPServer, StreamRequestHandler
+from Queue import Empty
+from handbrake import HandbrakeProcess
+from tools import getthreads, getchecksum
+
+def _str(value):
+    """json gives unicode objects, HandbrakeProcess expects utf-8 strings"""
+    return value.encode('utf-8') if isinstance(value, unicode) else value
+
+def getaddress(address):
+    """Parses [HOST:]PORT, HOST being localhost by default"""
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        return host, int(port)
+    return 'localhost', int(address)
+
+class FarmError(Exception):
+    pass
+
+class CoordinatorHandler(StreamRequestHandler):
+    """
+    One connection of a worker
+    """
+    def handle(self):
+        coordinator = self.server.coordinator
+        self.name = '%s:%d' % self.client_address
+        self.leases = set()
+        self.authenticated = False
+        try:
+            for line in iter(self.rfile.readline, ''):
+                reply = coordinator.dispatch(self, json.loads(line))
+                if reply is not None:
+                    self.wfile.write(json.dumps(reply) + '\n')
+                    self.wfile.flush()
+                if not self.authenticated:
+                    sys.stderr.write('%s: refused, %s\n' % (self.name, reply['error']))
+                    break
+        except (socket.error, ValueError, TypeError, KeyError):
+            pass
+        finally:
+            # Jobs of a lost worker are ripped by someone else
+            for lid in list(self.leases):
+                coordinator.requeue(lid)
+
+class Coordinator:
+    """
+    Serves the rip queue of a pool (the Worker class of rip.py) to FarmWorker
+    objects knowing secret.
+    A job is leased to a worker, and queued again if the worker does not send
+    a heartbeat for lease_timeout seconds, disconnects or is interrupted.
+    """
+
+    lease_timeout = 60
+
+    def __init__(self, address, pool, secret):
+        if not secret:
+            raise FarmError('A secret shared with the workers is needed')
+        self.pool = pool
+        self.secret = secret
+        self.leases = {} # id -> [task, deadline, handler]
+        self.lastid = 0
+        self.lock = Lock()
+        ThreadingTCPServer.allow_reuse_address = True
+        self.server = ThreadingTCPServer(address, CoordinatorHandler)
+        self.server.daemon_threads = True
+        self.server.coordinator = self
+
+    def start(self):
+        t_server = Thread(target=self.server.serve_forever)
+        t_server.daemon = True
+        t_server.start()
+        t_reaper = Thread(target=self.reaper)
+        t_reaper.daemon = True
+        t_reaper.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reaper(self):
+        while not self.pool.finished:
+            time.sleep(1)
+            now = time.time()
+            with self.lock:
+                expired = [lid for lid, lease in self.leases.items() if lease[1] < now]
+            for lid in expired:
+                self.requeue(lid)
+
+    def requeue(self, lid):
+        with self.lock:
+            lease = self.leases.pop(lid, None)
+        if lease is None:
+            return
+        task, deadline, handler = lease
+        handler.leases.discard(lid)
+        sys.stderr.write('%s: lost by %s, queued again\n' % (task.filepath, handler.name))
+        self.pool.requeued(task)
+        self.pool.rip_queue.put(task)
+        self.pool.rip_queue.task_done()
+
+    def dispatch(self, handler, msg):
+        if msg['type'] == 'hello':
+            secret = msg.get('secret')
+            if not isinstance(secret, basestring) or not hmac.compare_digest(_str(secret), self.secret):
+                handler.authenticated = False
+                return {'type': 'error', 'error': 'wrong secret'}
+            handler.authenticated = True
+            handler.name = '%s (%s)' % (msg.get('name'), handler.client_address[0])
+            return {'type': 'ok'}
+        elif not handler.authenticated:
+            return {'type': 'error', 'error': 'no hello'}
+        elif msg['type'] == 'get':
+            if self.pool.finished:
+                return {'type': 'bye'}
+            try:
+                task = self.pool.rip_queue.get(True, 3)
+            except Empty:
+                return {'type': 'wait'}
+            with self.lock:
+                self.lastid += 1
+                lid = self.lastid
+                self.leases[lid] = [task, time.time() + Coordinator.lease_timeout, handler]
+            handler.leases.add(lid)
+            self.pool.started(task, handler.name)
+            return {'type': 'job', 'id': lid, 'filepath': task.filepath, 'args': task.args, 'frames': task.frames}
+        elif msg['type'] == 'heartbeat':
+            with self.lock:
+                lease = self.leases.get(msg['id'])
+                if lease is not None:
+                    lease[1] = time.time() + Coordinator.lease_timeout
+            if lease is not None and msg.get('progress'):
+                lease[0]._handleprogress(msg['progress'] + '\n')
+            return None
+        elif msg['type'] == 'result':
+            if msg['status'] == 'interrupted':
+                self.requeue(msg['id'])
+                return {'type': 'ok'}
+            with self.lock:
+                lease = self.leases.pop(msg['id'], None)
+            if lease is None: # Expired, and already queued again
+                return {'type': 'ok'}
+            task = lease[0]
+            handler.leases.discard(msg['id'])
+            task.elapsed = msg.get('elapsed')
+            if msg['status'] == 'done':
+                self.pool.done(task, msg.get('checksum'))
+            else:
+                sys.stderr.write('%s: failed on %s: %s\n' % (task.filepath, handler.name, msg.get('error')))
+                self.pool.failed(task)
+            return {'type': 'ok'}
+        return {'type': 'error', 'error': 'Unknown message type "%s"' % msg['type']}
+
+class FarmWorker:
+    """
+    Rips the jobs served by a Coordinator, jobs of them simultaneously,
+    each one on its own connection.
+    error is set if the coordinator can't be reached or refused the secret.
+    """
+
+    heartbeat = 10 # seconds
+
+    def __init__(self, address, secret, jobs=1, governor=None):
+        self.address = address
+        self.secret = secret
+        self.jobs = max(1, jobs)
+        self.governor = governor
+        self.finished = False
+        self.error = None
+
+    def run(self):
+        threads = [Thread(target=self.connection) for i in range(self.jobs)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            while t.is_alive():
+                t.join(3)
+
+    def connection(self):
+        try:
+            sock = socket.create_connection(self.address)
+        except socket.error as e:
+            self.error = str(e)
+            self.finished = True
+            return
+        rfile = sock.makefile('r')
+        lock = Lock()
+        def send(msg):
+            with lock:
+                sock.sendall(json.dumps(msg) + '\n')
+        def call(msg):
+            send(msg)
+            line = rfile.readline()
+            return json.loads(line) if line else {'type': 'bye'}
+        try:
+            reply = call({'type': 'hello', 'name': socket.gethostname(), 'secret': self.secret})
+            if reply['type'] != 'ok':
+                self.error = reply.get('error', 'refused by the coordinator')
+                self.finished = True
+                return
+            while not self.finished:
+                if self.governor is not None:
+                    self.governor.hold(lambda: self.finished)
+                reply = call({'type': 'get'})
+                if reply['type'] == 'bye':
+                    break
+                elif reply['type'] == 'job':
+                    call(self.rip(reply, send))
+        finally:
+            sock.close()
+
+    def rip(self, job, send):
+        """Rips a job while sending heartbeats, returns the result message"""
+        proc = HandbrakeProcess(_str(job['filepath']))
+        proc.args = dict((_str(k), _str(v)) for k, v in job['args'].items())
+        proc.frames = job['frames']
+        if self.jobs > 1:
+            proc.setencopt('threads', getthreads(self.jobs))
+        stop = Event()
+        def heartbeat():
+            while not stop.wait(FarmWorker.heartbeat):
+                send({'type': 'heartbeat', 'id': job['id'],
+                      'progress': str(proc.progress) if proc.progress is not None else None})
+        t_heartbeat = Thread(target=heartbeat)
+        t_heartbeat.daemon = True
+        t_heartbeat.start()
+        result = {'type': 'result', 'id': job['id']}
+        start = time.time()
+        if self.governor is not None:
+            self.governor.register(proc)
+        try:
+            proc.rip()
+            result['status'] = 'done'
+            result['checksum'] = getchecksum(proc.args['output'])
+        except KeyboardInterrupt:
+            self.finished = True
+            result['status'] = 'interrupted'
+        except Exception as e:
+            traceback.print_exc(file=sys.stderr)
+            result['status'] = 'failed'
+            result['error'] = str(e)
+        finally:
+            stop.set()
+            if self.governor is not None:
+                self.governor.unregister(proc)
+        result['elapsed'] = time.time() - start
+        return result
@@ -0,0 +1,208 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, time, errno, signal
+from os import path
+from threading import Thread, Lock, Event
+
+class Governor:
+    """
+    Pauses running rips (SIGSTOP) and holds the next ones while the machine is
+    needed elsewhere: other processes using more than max_load of the CPU
+    time of all cores (0 to 1), less than min_memory MB available, or less
+    than min_free MB left on dest. Rips are resumed (SIGCONT) once every value
+    is back under its threshold, with some margin.
+    The load of the rips themselves is left out, as they are meant to use
+    every core: the CPU time of rippy and of the registered rips, read in
+    /proc, is subtracted from the one of the machine.
+    """
+
+    interval = 5 # seconds between two checks
+    margin = 0.9 # a paused governor resumes at 90% of max_load, 110% of the minimums
+    proc = '/proc'
+
+    def __init__(self, max_load=None, min_memory=None, min_free=None, dest=None):
+        self.max_load = max_load
+        self.min_memory = min_memory
+        self.min_free = min_free
+        self.dest = dest
+        self.lock = Lock()
+        self.running = []
+        self.paused = False
+        self.reason = None
+        self.paused_since = None
+        self.paused_time = 0 # seconds, previous pauses only
+        self.resumed = Event()
+        self.resumed.set()
+        self.stopped = Event()
+        self.onresume = None # called once rips are resumed
+        self.sample = None # (busy, total) CPU times of the machine, {pid: CPU time} of rippy and the rips
+        self.load = None # share of the CPU used by other processes between the last two samples
+
+    def enabled(self):
+        return self.max_load is not None or self.min_memory is not None or self.min_free is not None
+
+    def start(self):
+        if self.enabled():
+            t_governor = Thread(target=self.run)
+            t_governor.daemon = True
+            t_governor.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.paused:
+            self.resume()
+
+    def run(self):
+        while not self.stopped.wait(Governor.interval):
+            self.step()
+
+    def step(self):
+        """Pauses or resumes rips after a check"""
+        reason = self.check()
+        if reason is not None and not self.paused:
+            self.pause(reason)
+        elif reason is None and self.paused:
+            self.resume()
+        elif self.paused: # rips which started since the pause
+            with self.lock:
+                for proc in self.running:
+                    self._signal(proc, signal.SIGSTOP)
+
+    def check(self):
+        """Returns why rips should be paused, or None"""
+        margin = Governor.margin if self.paused else 1
+        if self.max_load is not None:
+            load = self.getload()
+            if load is not None and load > self.max_load * margin:
+                return 'load'
+        if self.min_memory is not None:
+            memory = getavailablememory()
+            if memory is not None and memory < self.min_memory / margin:
+                return 'memory'
+        if self.min_free is not None and self.dest is not None and os.path.isdir(self.dest):
+            stat = os.statvfs(self.dest)
+            if stat.f_bavail * stat.f_frsize / 1048576.0 < self.min_free / margin:
+                return 'disk'
+        return None
+
+    def getload(self):
+        """
+        Share of the CPU time of all cores used by other processes than rippy
+        and its rips since the last call, None until known
+        """
+        with self.lock:
+            pids = [os.getpid()] + [proc.pid for proc in self.running if proc.pid is not None]
+        cpu = getcputimes(Governor.proc)
+        if cpu is None:
+            return None
+        own = {}
+        for pid in pids:
+            cputime = getproctime(pid, Governor.proc)
+            if cputime is not None:
+                own[pid] = cputime
+        previous = self.sample
+        self.sample = (cpu, own)
+        if previous is None or cpu[1] <= previous[0][1]:
+            return self.load
+        if any(pid not in own for pid in previous[1]):
+            return self.load # A rip ended, the CPU time it used since the last sample is unknown
+        busy = cpu[0] - previous[0][0] - sum(t - previous[1].get(pid, 0) for pid, t in own.items())
+        self.load = max(0.0, float(busy) / (cpu[1] - previous[0][1]))
+        return self.load
+
+    def pause(self, reason):
+        with self.lock:
+            self.paused = True
+            self.reason = reason
+            self.paused_since = time.time()
+            self.resumed.clear()
+            for proc in self.running:
+                self._signal(proc, signal.SIGSTOP)
+        print('Rips paused (%s)' % reason)
+
+    def resume(self):
+        with self.lock:
+            now = time.time()
+            for proc in self.running:
+                self._signal(proc, signal.SIGCONT)
+                if proc.metrics is not None:
+                    proc.metrics.paused_time += now - max(self.paused_since, proc.started or now)
+            self.paused_time += now - self.paused_since
+            self.paused = False
+            self.reason = None
+            self.paused_since = None
+            self.resumed.set()
+        if self.onresume is not None:
+            self.onresume()
+        print('Rips resumed')
+
+    def hold(self, finished=lambda: False):
+        """Waits until rips are allowed, or finished() becomes True"""
+        while not self.resumed.wait(3) and not finished():
+            pass
+
+    def register(self, proc):
+        with self.lock:
+            self.running.append(proc)
+
+    def unregister(self, proc):
+        with self.lock:
+            if proc in self.running:
+                self.running.remove(proc)
+                if self.paused and proc.metrics is not None:
+                    proc.metrics.paused_time += time.time() - max(self.paused_since, proc.started or 0)
+
+    def gettime(self):
+        """Seconds spent paused, the current pause included"""
+        with self.lock:
+            if self.paused:
+                return self.paused_time + time.time() - self.paused_since
+            return self.paused_time
+
+    @staticmethod
+    def _signal(proc, sig):
+        """Signals the HandbrakeCLI of proc, if it is running"""
+        if proc.pid is None:
+            return
+        try:
+            os.kill(proc.pid, sig)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+
+def getcputimes(proc='/proc'):
+    """(busy, total) clock ticks of all cores since boot, None if unknown"""
+    try:
+        with open(path.join(proc, 'stat')) as fhandler:
+            for line in fhandler:
+                if line.startswith('cpu '):
+                    # user nice system idle iowait irq softirq steal (guest is counted in user)
+                    ticks = [int(v) for v in line.split()[1:9]]
+                    idle = ticks[3] + ticks[4]
+                    return sum(ticks) - idle, sum(ticks)
+    except (IOError, ValueError):
+        pass
+    return None
+
+def getproctime(pid, proc='/proc'):
+    """Clock ticks of CPU used by the process pid (all its threads), None if it is gone"""
+    try:
+        with open(path.join(proc, str(pid), 'stat')) as fhandler:
+            fields = fhandler.read().rsplit(')', 1)[1].split() # the command name may hold spaces
+        return int(fields[11]) + int(fields[12]) # utime, stime
+    except (IOError, ValueError, IndexError):
+        return None
+
+def getavailablememory():
+    """MB of memory available without swapping, None if unknown"""
+    try:
+        with open('/proc/meminfo') as fhandler:
+            for line in fhandler:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024.0
+    except IOError:
+        pass
+    return None
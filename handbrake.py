@@ -3,24 +3,37 @@
 #
 # Distributed under terms of the MIT license.
 
-import re, time, sys
+import re, time, sys, os, select, errno, signal
 from os import path
 from subprocess import Popen, PIPE
-from threading import Thread
-from tools import intduration, non_block_read
+from tools import intduration, getconfigdir
 from ask.ask import Ask
 
-class Stream:
+class Stream(object):
     """
     Abstract class representing a video-file stream
     """
-    def __init__(self, buf):
-        self.buf = buf
-        self.parse()
+    __slots__ = ()
+    re_parse = None
 
-    def parse(self):
-        """Must be overhidden by subclasses"""
-        pass
+    def __init__(self, **fields):
+        for k in self.__slots__:
+            setattr(self, k, fields.get(k))
+
+    @classmethod
+    def fromline(cls, line):
+        """Returns the stream described by a line of HandbrakeCLI, or None"""
+        matches = cls.re_parse.search(line)
+        if matches is None:
+            return None
+        return cls(**matches.groupdict())
+
+    def __getstate__(self):
+        return dict((k, getattr(self, k)) for k in self.__slots__)
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
 
     def getlanguage(self):
         pass
@@ -33,21 +46,9 @@ class AudioStream(Stream):
     """
     An audio stream representation
     """
+    __slots__ = ('position', 'language', 'type', 'codec', 'frequency', 'bitrate')
     re_parse = re.compile("\+\s(?P<position>\d+).*?\((?P<codec>.*?)\)\s\((?P<type>.*?)\)\s\(.*?\:\s(?P<language>\w+)\)(:?,\s(?P<frequency>\d+)Hz,\s(?P<bitrate>\d+)bps)?")
 
-    def parse(self):
-        matches = AudioStream.re_parse.search(self.buf)
-        if matches is not None:
-            results = matches.groupdict()
-            self.language = results['language']
-            self.type = results['type']
-            self.codec = results['codec']
-            self.frequency = results['frequency']
-            self.position = results['position']
-            self.bitrate = results['bitrate']
-            return True
-        return False
-
     def __str__(self):
         return 'AudioStream #%s (language: %s) (type: %s) (codec: %s) (frequency: %s) (bitrate: %s)' %\
             (self.position, self.language, self.type, self.codec, self.frequency, self.bitrate)
@@ -56,56 +57,116 @@ class VideoStream(Stream):
     """
     A video stream representation
     """
+    __slots__ = ('width', 'height', 'fps', 'ratio', 'codec', 'profile', 'bitrate')
     re_parse = re.compile("\+ size:\s(?P<width>\d+)x(?P<height>\d+).*?(?P<fps>\d+(?:\.\d+)?) fps")
+    # Printed by libavformat before the titles, for sources which are files
+    re_input = re.compile("Stream #\d+[:.]\d+.*?: Video: (?P<codec>\w+)(?: \((?P<profile>[^)]+)\))?")
+    re_bitrate = re.compile("(?P<bitrate>\d+) kb/s")
 
-    def parse(self):
-        matches = VideoStream.re_parse.search(self.buf)
-        if matches is not None:
-            results = matches.groupdict()
-            self.width = results['width']
-            self.height = results['height']
-            self.fps = results['fps']
+    def __init__(self, **fields):
+        Stream.__init__(self, **fields)
+        if self.ratio is None and self.width is not None:
             self.ratio = round(float(self.width)/float(self.height))
-            return True
-        return False
     
     def __str__(self):
-        return 'VideoStream (width: %s) (height: %s) (FPS: %s) (ratio: %s)' %\
-            (self.width, self.height, self.fps, self.ratio)
+        return 'VideoStream (width: %s) (height: %s) (FPS: %s) (ratio: %s) (codec: %s %s) (bitrate: %s)' %\
+            (self.width, self.height, self.fps, self.ratio, self.codec, self.profile, self.bitrate)
 
 class SubtitleStream(Stream):
     """
     A subtitle stream representation
     """
+    __slots__ = ('position', 'language', 'encoding')
     re_parse = re.compile("\+\s(?P<position>\d+).*?\(.*?\:\s(?P<language>\w+)\).*\((?P<encoding>.+)\)")
-
-    def parse(self):
-        matches = SubtitleStream.re_parse.search(self.buf)
-        if matches is not None:
-            results = matches.groupdict()
-            self.language = results['language']
-            self.position = results['position']
-            self.encoding = results['encoding']
-            return True
-        return False
     
     def __str__(self):
         return 'SubtitleStream #%s (language: %s) (encoding: %s)' %\
             (self.position, self.language, self.encoding)
-        
+
+class Title(object):
+    """
+    A title of a scanned source, with its duration, chapters and tracks
+    """
+    __slots__ = ('number', 'main', 'duration', 'chapters', 'video', 'audio', 'subtitle', 'playlist')
+
+    def __init__(self, number):
+        self.number = number
+        self.main = False # Flagged as main feature by HandbrakeCLI
+        self.playlist = None # mpls file of BluRay titles, eg. 00800.mpls
+        self.duration = None
+        self.chapters = [] # duration of each chapter
+        self.video = None
+        self.audio = []
+        self.subtitle = []
+
+    def __getstate__(self):
+        return dict((k, getattr(self, k)) for k in self.__slots__)
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+
+    def __str__(self):
+        return 'Title %s (duration: %s) (chapters: %d) (audio: %d) (subtitles: %d)%s' %\
+            (self.number, self.duration, len(self.chapters), len(self.audio), len(self.subtitle),
+             ' (main feature)' if self.main else '')
+
+class Progress:
+    """
+    A progress line of HandbrakeCLI, eg.
+    "Encoding: task 1 of 2, 12.34 % (45.67 fps, avg 44.00 fps, ETA 01h02m03s)"
+    """
+    re_parse = re.compile("Encoding: task (?P<task>\d+) of (?P<tasks>\d+), (?P<percent>\d+(?:\.\d+)?) %(?: \((?P<fps>\d+(?:\.\d+)?) fps, avg (?P<avgfps>\d+(?:\.\d+)?) fps, ETA (?P<eta>\w+)\))?")
+
+    def __init__(self, task, tasks, percent, fps=None, avgfps=None, eta=None):
+        self.task = task
+        self.tasks = tasks
+        self.percent = percent
+        self.fps = fps
+        self.avgfps = avgfps
+        self.eta = eta
+
+    @staticmethod
+    def parse(line):
+        """Returns a Progress object, or None if line is not a progress line"""
+        matches = Progress.re_parse.search(line)
+        if matches is None:
+            return None
+        results = matches.groupdict()
+        return Progress(int(results['task']), int(results['tasks']), float(results['percent']),
+            float(results['fps']) if results['fps'] is not None else None,
+            float(results['avgfps']) if results['avgfps'] is not None else None,
+            results['eta'])
+
+    def __str__(self):
+        s = 'Encoding: task %d of %d, %.2f %%' % (self.task, self.tasks, self.percent)
+        if self.fps is not None:
+            s += ' (%.2f fps, avg %.2f fps, ETA %s)' % (self.fps, self.avgfps, self.eta)
+        return s
+
 class HandbrakeOutputParser:
     """
-    Parse the output of HanbrakeCLI
+    Parse the output of HanbrakeCLI.
+    Output can be given at once, or fed by chunks while the scan is running.
+    Every title is kept, streams of the main feature are the ones returned by
+    audio(), video() and subtitle().
     """
-    re_duration = re.compile('Duration: (?P<duration>.*?), .*')
+    re_duration = re.compile('duration:? (?P<duration>\d+:\d+:\d+)', re.I)
     re_title = re.compile("\+ title (\d+)")
+    re_playlist = re.compile("(\d{5}\.mpls)", re.I)
 
-    def __init__(self, buf):
+    def __init__(self, buf=None):
         self.buf = buf
         self.streams = {'audio': [], 'video': None, 'subtitle': []}
+        self.titles = []
         self.duration = None
         self.fps = None
         self.title = None
+        self.playlist = None
+        self._input = {} # codec, profile and bitrates of the video of a file
+        self._pending = ''
+        self._current = None
+        self._block = None
 
     def summary(self, p_audio_streams, p_sub_streams):
         print('* %s' % self.streams['video'])
@@ -122,48 +183,130 @@ class HandbrakeOutputParser:
         print('Duration : %s' % self.duration)
         print('FPS : %s' % self.fps)
         print('Title : %s' % self.title)
+        if len(self.titles) > 1:
+            for t in self.titles:
+                print('%s %s' % ('*' if t.number == self.title else ' ', t))
 
     def parse(self):
-        block = None
-        intitle = False
-        for line in self.buf.split('\n'):
-            if line.startswith('+ title'):
-                if intitle:
-                    """
-                    second video track, we just need the first one, so we can exit parse.
-                    TODO: When multiple video tracks are available, ask the user to choose one.
-                    """
-                    return
-                matches = HandbrakeOutputParser.re_title.search(line)
+        self.feed(self.buf)
+        self.close()
+
+    def feed(self, chunk):
+        """Parses every complete line of chunk, the remainder waits for the next one"""
+        lines = (self._pending + chunk).split('\n')
+        self._pending = lines.pop()
+        for line in lines:
+            self._parseline(line)
+
+    def close(self):
+        """Parses the last line, then selects the main feature"""
+        if self._pending:
+            self._parseline(self._pending)
+            self._pending = ''
+        self._current = None
+        self._block = None
+        if len(self.titles) == 1 and self.titles[0].video is not None:
+            self._setinput(self.titles[0])
+        self.select(self.getmain())
+
+    def _parseline(self, line):
+        # Lines are "+ title", "  + property" or "    + track"
+        if line.startswith('+ title'):
+            matches = HandbrakeOutputParser.re_title.match(line)
+            if matches is not None:
+                self._current = Title(matches.group(1))
+                self._block = None
+                self.titles.append(self._current)
+            return
+        title = self._current
+        if title is None:
+            self._parseinput(line)
+            return
+        if line.startswith('    +'):
+            if self._block == 'audio':
+                stream = AudioStream.fromline(line)
+                if stream is not None:
+                    title.audio.append(stream)
+            elif self._block == 'subtitle':
+                stream = SubtitleStream.fromline(line)
+                if stream is not None:
+                    title.subtitle.append(stream)
+            elif self._block == 'chapters':
+                matches = HandbrakeOutputParser.re_duration.search(line)
                 if matches is not None:
-                    intitle = True
-                    self.title = matches.group(1)
-            if intitle:
-                if 'audio tracks:' in line:
-                    block = 'Audio'
-                elif 'subtitle tracks:' in line:
-                    block = 'Subtitle'
-                elif line.startswith('  +'):
-                    block = None
-                if block == 'Audio':
-                    stream = AudioStream(line)
-                    if stream.parse():
-                        self.streams['audio'].append(stream)
-                elif block == 'Subtitle':
-                    stream = SubtitleStream(line)
-                    if stream.parse():
-                        self.streams['subtitle'].append(stream)
-                elif 'size: ' in line:
-                    stream = VideoStream(line)
-                    if stream.parse():
-                        self.streams['video'] = stream
-                        if self.fps is None:
-                            self.fps = stream.fps
-                elif 'duration: ' in line:
-                    matches = HandbrakeOutputParser.re_duration.search(line)
-                    if matches is not None:
-                        self.duration = intduration(matches.groupdict()['duration'])
-
+                    title.chapters.append(intduration(matches.group('duration')))
+        elif line.startswith('  +'):
+            self._block = None
+            if line.startswith('  + size: '):
+                title.video = VideoStream.fromline(line)
+            elif line.startswith('  + duration: '):
+                matches = HandbrakeOutputParser.re_duration.search(line)
+                if matches is not None:
+                    title.duration = intduration(matches.group('duration'))
+            elif line.startswith('  + audio tracks:'):
+                self._block = 'audio'
+            elif line.startswith('  + subtitle tracks:'):
+                self._block = 'subtitle'
+            elif line.startswith('  + chapters:'):
+                self._block = 'chapters'
+            elif line.startswith('  + Main Feature'):
+                title.main = True
+            elif line.startswith('  + playlist: ') or line.startswith('  + stream: '):
+                matches = HandbrakeOutputParser.re_playlist.search(line)
+                if matches is not None:
+                    title.playlist = matches.group(1)
+        elif line and not line.startswith(' '):
+            # Log line, the title is over
+            self._current = None
+
+    def _parseinput(self, line):
+        if 'Video: ' in line and 'codec' not in self._input:
+            matches = VideoStream.re_input.search(line)
+            if matches is not None:
+                self._input['codec'] = matches.group('codec')
+                self._input['profile'] = matches.group('profile')
+                bitrate = VideoStream.re_bitrate.search(line)
+                if bitrate is not None:
+                    self._input['video'] = int(bitrate.group('bitrate'))
+        elif line.strip().startswith('Duration: ') and 'bitrate: ' in line:
+            bitrate = VideoStream.re_bitrate.search(line)
+            if bitrate is not None:
+                self._input['overall'] = int(bitrate.group('bitrate'))
+
+    def _setinput(self, title):
+        """Codec and bitrate (kbps) of the video of a file, the only title"""
+        video = title.video
+        video.codec = self._input.get('codec')
+        video.profile = self._input.get('profile')
+        video.bitrate = self._input.get('video')
+        if video.bitrate is None and 'overall' in self._input:
+            # The container only gives the overall bitrate
+            audio = sum(int(a.bitrate) for a in title.audio if a.bitrate) // 1000
+            video.bitrate = self._input['overall'] - audio if self._input['overall'] > audio else None
+
+    def getmain(self):
+        """The title flagged as main feature by HandbrakeCLI, or else the longest one"""
+        for t in self.titles:
+            if t.main:
+                return t
+        if len(self.titles) == 0:
+            return None
+        return max(self.titles, key=lambda t: t.duration or 0)
+
+    def select(self, title):
+        """Streams of title become the ones to rip"""
+        if title is None:
+            return
+        self.title = title.number
+        self.duration = title.duration
+        self.playlist = title.playlist
+        self.streams = {'audio': title.audio, 'video': title.video, 'subtitle': title.subtitle}
+        self.fps = title.video.fps if title.video is not None else None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['buf'] = None
+        return state
 
     def audio(self):
         return self.streams['audio']
@@ -181,12 +324,37 @@ class HandbrakeProcess:
 
     handbrakecli = "/usr/bin/HandBrakeCLI"
     default_args = [handbrakecli]
+    niceness = None # of the rips, see setniceness
+    ioclass = None
     NO_VALUE = -1
+    tail_size = 64 * 1024 # stderr bytes kept in memory while ripping
+    min_duration = 700 # seconds, shorter titles are not scanned
+    re_lines = re.compile('[\r\n]')
 
     def __init__(self, filepath):
         self.filepath = filepath
         self.filename = path.basename(filepath)
         self.buf = None
+        self.frames = None # Expected number of encoded frames, for throughput
+        self.started = None
+        self.elapsed = None
+        self.returncode = None
+        self.logfile = None
+        self.metrics = None
+        self.segments = None # SegmentGroup, if only a part of the title is ripped
+        self.destination = None # where output is moved once ripped, see Transfer
+        self.playlist = None # of the BluRay title, the only one staged, see Stager
+        self.priority = None
+        self.cost = None # to schedule rips, see CostModel
+        self.mode = None # two-pass, crf or one-pass
+        self.worker = None # name of the farm worker ripping it, None if ripped locally
+        self.pid = None # of the running HandbrakeCLI
+        self.pipes = {} # fd -> pipe of the running HandbrakeCLI still to be read
+        self._child = None
+        self._log = None
+        self.progress = None # Last Progress received
+        self.progress_handlers = [self._printprogress]
+        self._lastprint = 0
         self.args = {
             'audio': None, # Multivalued, separated by comma
             'subtitle': None, # Multivalued, separated by comma
@@ -197,6 +365,27 @@ class HandbrakeProcess:
             'input': self.filepath 
         }
 
+    @staticmethod
+    def setbinary(handbrakecli):
+        HandbrakeProcess.handbrakecli = handbrakecli
+        HandbrakeProcess.default_args = [handbrakecli]
+
+    @staticmethod
+    def setniceness(niceness=None, ioclass=None):
+        """CPU niceness and I/O scheduling class (ionice -c) of the rips"""
+        HandbrakeProcess.niceness = niceness
+        HandbrakeProcess.ioclass = ioclass
+
+    def copy(self):
+        """A new process with the same arguments"""
+        proc = HandbrakeProcess(self.filepath)
+        proc.args = dict(self.args)
+        proc.frames = self.frames
+        proc.mode = self.mode
+        proc.destination = self.destination
+        proc.playlist = self.playlist
+        return proc
+
     def setoption(self, k, v):
         if k is not None:
             if v is None:
@@ -204,6 +393,10 @@ class HandbrakeProcess:
             else:
                 self.args[k] = v
 
+    def unsetoption(self, k):
+        if k in self.args:
+            self.args[k] = None
+
     def setaudio(self, l):
         if l is not None:
             self.args['audio'] = ','.join(l)
@@ -228,6 +421,22 @@ class HandbrakeProcess:
         if t is not None:
             self.args['title'] = t
 
+    def setencopt(self, k, v):
+        """Set one x264 option, keeping the other encopts untouched"""
+        encopts = []
+        if self.args.get('encopts') not in (None, HandbrakeProcess.NO_VALUE):
+            encopts = [o for o in self.args['encopts'].split(':') if o.split('=', 1)[0] != k]
+        encopts.append('%s=%s' % (k, v))
+        self.args['encopts'] = ':'.join(encopts)
+
+    def setlogfile(self, f):
+        if f is not None:
+            self.logfile = f
+
+    def setframes(self, duration, fps):
+        if duration is not None and fps is not None:
+            self.frames = int(float(duration) * float(fps))
+
     def _getargs(self):
         arr = []
         for k, v in self.args.items():
@@ -237,42 +446,159 @@ class HandbrakeProcess:
                     arr.append(str(v))
         return arr
 
-    def _printbuf(self, stdout):
-        while True:
-            # Progress output eg. "Encoding: task 1 of 2, 0.01 %"
-            output = non_block_read(stdout).strip()
-            if (output):
-                Ask._print(self.filename + ': ' + output.splitlines()[-1], False)
-            time.sleep(1)
-
-    def scan(self):
+    def _printprogress(self, progress):
+        # At most one line per second, HandbrakeCLI being far more verbose
+        now = time.time()
+        if now - self._lastprint >= 1 or progress.percent >= 100:
+            self._lastprint = now
+            Ask._print(self.filename + ': ' + str(progress), False)
+
+    def _handleprogress(self, data):
+        """Dispatches complete progress lines, returns the incomplete remainder"""
+        lines = HandbrakeProcess.re_lines.split(data)
+        for line in lines[:-1]:
+            progress = Progress.parse(line)
+            if progress is not None:
+                self.progress = progress
+                for handler in self.progress_handlers:
+                    handler(progress)
+        return lines[-1]
+
+    def scan(self, parser=None, feed=None):
+        """
+        Scans every title, feeding parser with the output as it arrives,
+        through feed if given (eg. parser.feed wrapped by a Stopwatch)
+        """
         arr = list(HandbrakeProcess.default_args)
-        arr.extend(["--scan", "--title", "0", "--min-duration", "700", "--input", self.filepath])
-        self.buf = self._call(arr)
+        arr.extend(["--scan", "--title", "0", "--min-duration", str(HandbrakeProcess.min_duration), "--input", self.filepath])
+        if feed is None and parser is not None:
+            feed = parser.feed
+        self.buf = self._call(arr, on_stderr=feed)
+        if "Signal 2 received, terminating" in self.buf: # Interrupted, its output is partial
+            raise KeyboardInterrupt
 
     def rip(self):
-        arr = list(HandbrakeProcess.default_args)
-        arr.extend(self._getargs())
-        self._call(arr, handle_stdout=self._printbuf)
+        self.spawn()
+        self._pump()
+        self.wait()
 
-    def _call(self, args, handle_stdout=None, handle_stderr=None):
+    def spawn(self):
+        """Starts the rip, whose output must then be read with read() until pipes is empty"""
+        arr = []
+        # both exec HandbrakeCLI, which keeps their pid
+        if HandbrakeProcess.ioclass is not None:
+            arr.extend(['ionice', '-c', str(HandbrakeProcess.ioclass)])
+        if HandbrakeProcess.niceness is not None:
+            arr.extend(['nice', '-n', str(HandbrakeProcess.niceness)])
+        arr.extend(HandbrakeProcess.default_args)
+        arr.extend(self._getargs())
+        self._setlogfile()
+        self._spawn(arr, self.logfile, HandbrakeProcess.tail_size)
+
+    def _setlogfile(self):
+        """Default log file, named after the output"""
+        if self.logfile is None and self.args['output'] is not None:
+            self.logfile = path.join(getconfigdir('logs'), path.basename(self.args['output']) + '.log')
+
+    def wait(self):
+        """Ends a spawned rip once its output is read, raises if it failed"""
+        stderr = self._reap()
+        if "Signal 2 received, terminating" in stderr: # If process received CTRL+C
+            raise KeyboardInterrupt
+        if self.returncode != 0:
+            raise Exception('HandbrakeCLI exited with code %d, see %s' % (self.returncode, self.logfile))
+
+    def interrupt(self):
+        """Asks a running HandbrakeCLI to stop, like CTRL+C does"""
+        if self.pid is not None:
+            try:
+                os.kill(self.pid, signal.SIGINT)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+
+    @staticmethod
+    def _retry(func, *args):
+        """Retries a system call interrupted by a signal"""
+        while True:
+            try:
+                return func(*args)
+            except (OSError, IOError, select.error) as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+
+    def _call(self, args, logfile=None, tail_size=None, on_stderr=None):
+        """
+        Runs HandbrakeCLI, reading stdout and stderr as soon as data is available
+        so that the process never blocks on a full pipe.
+        Returns stderr, or only its last tail_size bytes, in which case the whole
+        of it is written to logfile. on_stderr is called with every chunk of stderr.
+        """
+        self._spawn(args, logfile, tail_size, on_stderr)
+        self._pump()
+        return self._reap()
+
+    def _spawn(self, args, logfile=None, tail_size=None, on_stderr=None):
         child = Popen(args, stderr=PIPE, stdout=PIPE)
-        threads = []
-        if handle_stdout is not None:
-            t = Thread(target=handle_stdout, args=[child.stdout])
-            threads.append(t)
-            t.daemon = True
-            t.start()
-        if handle_stderr is not None:
-            t = Thread(target=handle_stderr, args=[child.stderr])
-            threads.append(t)
-            t.daemon = True
-            t.start()
-        child.wait()
-        for t in threads:
-            t.join(timeout=1)
-        if "--scan" not in args: # If ripping 
-            if "Signal 2 received, terminating" in child.stderr.read(): # If process received CTRL+C
-                raise KeyboardInterrupt
-        return child.stderr.read()
-
+        self._child = child
+        self.pid = child.pid
+        self._stdout = child.stdout.fileno()
+        self.pipes = {self._stdout: child.stdout, child.stderr.fileno(): child.stderr}
+        self._log = open(logfile, 'w') if logfile is not None else None
+        self._tail_size = tail_size
+        self._on_stderr = on_stderr
+        self._stderr = []
+        self._stderrsize = 0
+        self._pending = ''
+        self._spawned = time.time()
+
+    def _pump(self):
+        """Reads the output of the spawned process until it closes it"""
+        try:
+            while self.pipes:
+                for fd in HandbrakeProcess._retry(select.select, list(self.pipes), [], [])[0]:
+                    self.read(fd)
+        except BaseException:
+            self._close()
+            raise
+
+    def read(self, fd):
+        """Reads the data available on one of the pipes, which is removed once closed"""
+        data = HandbrakeProcess._retry(os.read, fd, 65536)
+        if not data:
+            self.pipes.pop(fd).close()
+        elif fd == self._stdout:
+            self._pending = self._handleprogress(self._pending + data)
+        else:
+            if self._log is not None:
+                self._log.write(data)
+            if self._on_stderr is not None:
+                self._on_stderr(data)
+            self._stderr.append(data)
+            self._stderrsize += len(data)
+            if self._tail_size is not None and self._stderrsize > 2 * self._tail_size:
+                self._stderr = [''.join(self._stderr)[-self._tail_size:]]
+                self._stderrsize = len(self._stderr[0])
+
+    def _reap(self):
+        """Waits for the process whose output is read, returns its stderr"""
+        try:
+            self._handleprogress(self._pending + '\n')
+            self.returncode = self._retry(self._child.wait)
+        finally:
+            self._close()
+        stderr = ''.join(self._stderr)
+        if self._tail_size is not None:
+            stderr = stderr[-self._tail_size:]
+        return stderr
+
+    def _close(self):
+        for pipe in self.pipes.values():
+            pipe.close()
+        self.pipes = {}
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        self.pid = None
+        self._child = None
+        self.elapsed = time.time() - self._spawned
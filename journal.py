@@ -0,0 +1,108 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, time, json
+from os import path
+from collections import OrderedDict
+from threading import Lock
+from tools import getconfigdir
+
+class Journal:
+    """
+    Append-only log of the state transitions of every file of the current batch
+    (queued, scanned, ripping, done, failed, interrupted), one JSON object per line.
+    Each record is fsynced, so the journal survives a crash and --restore can
+    re-queue exactly the files that have not been ripped.
+    """
+
+    states = ('queued', 'scanned', 'ripping', 'done', 'failed', 'interrupted')
+    compact_every = 1000 # records appended between two compactions
+
+    def __init__(self, filepath=None):
+        self.filepath = filepath if filepath is not None else path.join(getconfigdir(), 'journal')
+        self.lock = Lock()
+        self.records = OrderedDict() # file -> last record
+        self.appended = 0
+        self.fd = None
+        laststate = path.join(path.dirname(self.filepath), 'last.state')
+        if not path.isfile(self.filepath) and path.isfile(laststate):
+            self._import_laststate(laststate)
+            self._compact()
+            os.remove(laststate)
+        elif self._load() > 2 * len(self.records):
+            self._compact()
+        else:
+            self._open()
+
+    def _import_laststate(self, laststate):
+        """Files of a former last.state are considered queued"""
+        with open(laststate, 'r') as readhandler:
+            for line in readhandler:
+                if line.strip():
+                    self.records[line.strip()] = {'file': line.strip(), 'state': 'queued', 'time': time.time()}
+
+    def _load(self):
+        lines = 0
+        if path.isfile(self.filepath):
+            with open(self.filepath, 'r') as readhandler:
+                for line in readhandler:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue # torn write of a crash
+                    self.records.pop(record['file'], None)
+                    self.records[record['file']] = record
+                    lines += 1
+        return lines
+
+    def _open(self):
+        self.fd = os.open(self.filepath, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _write(self, record):
+        os.write(self.fd, json.dumps(record, sort_keys=True) + '\n')
+        os.fsync(self.fd)
+
+    def record(self, filepath, state, **extra):
+        if state not in Journal.states:
+            raise Exception('Unknown state "' + state + '"')
+        record = {'file': filepath, 'state': state, 'time': time.time()}
+        record.update(extra)
+        with self.lock:
+            self._write(record)
+            self.records.pop(filepath, None)
+            self.records[filepath] = record
+            self.appended += 1
+            if self.appended >= Journal.compact_every:
+                self._compact()
+
+    def reset(self):
+        """Starts a new batch"""
+        with self.lock:
+            self.records.clear()
+            self._compact()
+
+    def _compact(self):
+        """Rewrites the journal with only the last record of each file"""
+        if self.fd is not None:
+            os.close(self.fd)
+        tmp = self.filepath + '.tmp'
+        with open(tmp, 'w') as writehandler:
+            for record in self.records.values():
+                writehandler.write(json.dumps(record, sort_keys=True) + '\n')
+            writehandler.flush()
+            os.fsync(writehandler.fileno())
+        os.rename(tmp, self.filepath)
+        self.appended = 0
+        self._open()
+
+    def unfinished(self):
+        """Files which have not been ripped, in the order they were queued"""
+        return [f for f, record in self.records.items() if record['state'] != 'done']
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
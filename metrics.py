@@ -0,0 +1,193 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, time, json
+from os import path
+from threading import Lock
+from tools import getconfigdir, getsize
+
+class JobMetrics:
+    """
+    Performance metrics of one file, from its scan to the end of its rip.
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.output = None
+        self.status = 'scanned'
+        self.scan_time = None
+        self.cached = False
+        self.queued_at = None
+        self.queue_wait = None
+        self.started = None
+        self.ended = None
+        self.passes = [] # wall time of each finished pass
+        self.pass_started = None
+        self.task = None
+        self.percent = None
+        self.fps = None # instantaneous
+        self.avgfps = None
+        self.duration = None
+        self.width = None
+        self.height = None
+        self.source_fps = None
+        self.estimate = None # seconds, from CostModel
+        self.input_bytes = None
+        self.output_bytes = None
+        self.target_bitrate = None # kbps, computed by getbitrate
+        self.achieved_bitrate = None # kbps
+        self.mode = None # two-pass, crf or one-pass
+        self.predicted_bytes = None # output size expected by --single-pass
+        self.paused_time = 0 # seconds paused by the Governor
+        self.saved = None # seconds, estimate of the encode replaced by a remux
+
+    def scanned(self, scan_time, cached=False):
+        self.scan_time = scan_time
+        self.cached = cached
+
+    def queued(self, proc, duration, video=None, estimate=None, predicted=None):
+        """predicted is the expected bitrate in kbps of the whole output, audio included"""
+        self.queued_at = time.time()
+        self.output = proc.args['output']
+        self.target_bitrate = proc.args['vb']
+        self.duration = duration
+        self.estimate = estimate
+        self.mode = proc.mode
+        if predicted is not None and duration:
+            self.predicted_bytes = int(predicted * 1000 / 8.0 * duration)
+        if video is not None:
+            self.width = int(video.width)
+            self.height = int(video.height)
+            self.source_fps = float(video.fps)
+
+    def start(self):
+        self.started = time.time()
+        self.pass_started = self.started
+        self.passes = []
+        self.task = None
+        self.status = 'ripping'
+        if self.queued_at is not None:
+            self.queue_wait = self.started - self.queued_at
+
+    def onprogress(self, progress):
+        """Progress handler of HandbrakeProcess"""
+        now = time.time()
+        if self.task is not None and progress.task != self.task:
+            self.passes.append(now - self.pass_started)
+            self.pass_started = now
+        self.task = progress.task
+        self.percent = progress.percent
+        if progress.fps is not None:
+            self.fps = progress.fps
+            self.avgfps = progress.avgfps
+
+    def finish(self, status):
+        self.ended = time.time()
+        self.status = status
+        if self.pass_started is not None:
+            self.passes.append(self.ended - self.pass_started)
+        if self.mode == 'remux' and self.estimate is not None and self.started is not None:
+            self.saved = max(0, self.estimate - (self.ended - self.started))
+        self.input_bytes = getsize(self.filepath)
+        if self.output is not None and path.isfile(self.output):
+            self.output_bytes = path.getsize(self.output)
+            if self.duration:
+                self.achieved_bitrate = int(round(self.output_bytes * 8 / 1000.0 / self.duration))
+
+    def todict(self):
+        d = dict(self.__dict__)
+        del d['pass_started']
+        return d
+
+class MetricsExporter:
+    """
+    Appends finished jobs to a JSONL history file, and optionally exposes
+    running jobs as gauges in a node-exporter textfile.
+    """
+    interval = 5 # Minimal delay in seconds between two textfile writes
+
+    def __init__(self, history=None, textfile=None, governor=None):
+        self.history = history if history is not None else path.join(getconfigdir(), 'history.jsonl')
+        self.textfile = textfile
+        self.governor = governor
+        self.lock = Lock()
+        self.running = []
+        self.finished = {}
+        self.encoded_bytes = 0
+        self._lastwrite = 0
+
+    def start(self, job):
+        job.start()
+        with self.lock:
+            self.running.append(job)
+        self.update(force=True)
+
+    def progress(self, job):
+        """Returns a progress handler which feeds job and refreshes the gauges"""
+        def handler(progress):
+            job.onprogress(progress)
+            self.update()
+        return handler
+
+    def finish(self, job, status):
+        job.finish(status)
+        with self.lock:
+            if job in self.running:
+                self.running.remove(job)
+            self.finished[status] = self.finished.get(status, 0) + 1
+            self.encoded_bytes += job.output_bytes or 0
+            with open(self.history, 'a') as fhandler:
+                fhandler.write(json.dumps(job.todict(), sort_keys=True) + '\n')
+        self.update(force=True)
+
+    def update(self, force=False):
+        if self.textfile is None:
+            return
+        with self.lock:
+            now = time.time()
+            if not force and now - self._lastwrite < MetricsExporter.interval:
+                return
+            self._lastwrite = now
+            lines = [
+                '# HELP rippy_jobs_running Number of files being ripped',
+                '# TYPE rippy_jobs_running gauge',
+                'rippy_jobs_running %d' % len(self.running),
+                '# HELP rippy_jobs_finished_total Number of finished rips by status',
+                '# TYPE rippy_jobs_finished_total counter',
+            ]
+            for status, count in sorted(self.finished.items()):
+                lines.append('rippy_jobs_finished_total{status="%s"} %d' % (status, count))
+            lines.extend([
+                '# HELP rippy_encoded_bytes_total Size of all ripped files',
+                '# TYPE rippy_encoded_bytes_total counter',
+                'rippy_encoded_bytes_total %d' % self.encoded_bytes,
+            ])
+            if self.governor is not None:
+                lines.extend([
+                    '# HELP rippy_governor_paused Whether rips are paused by the governor, by reason',
+                    '# TYPE rippy_governor_paused gauge',
+                    'rippy_governor_paused{reason="%s"} %d' % (self.governor.reason or '', self.governor.paused),
+                    '# HELP rippy_governor_paused_seconds_total Time rips spent paused by the governor',
+                    '# TYPE rippy_governor_paused_seconds_total counter',
+                    'rippy_governor_paused_seconds_total %.1f' % self.governor.gettime(),
+                ])
+            for name, attr, helptext in [('rippy_job_progress_percent', 'percent', 'Progress of the current pass'),
+                                         ('rippy_job_pass', 'task', 'Current pass'),
+                                         ('rippy_job_fps', 'fps', 'Instantaneous encoder FPS'),
+                                         ('rippy_job_avg_fps', 'avgfps', 'Average encoder FPS of the current pass'),
+                                         ('rippy_job_target_bitrate_kbps', 'target_bitrate', 'Bitrate given to HandbrakeCLI')]:
+                lines.append('# HELP %s %s' % (name, helptext))
+                lines.append('# TYPE %s gauge' % name)
+                for job in self.running:
+                    value = getattr(job, attr)
+                    if value is not None:
+                        lines.append('%s{file="%s"} %s' % (name, MetricsExporter._escape(job.filepath), value))
+            tmp = self.textfile + '.tmp'
+            with open(tmp, 'w') as fhandler:
+                fhandler.write('\n'.join(lines) + '\n')
+            os.rename(tmp, self.textfile)
+
+    @staticmethod
+    def _escape(label):
+        return label.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
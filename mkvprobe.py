@@ -0,0 +1,329 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+"""
+Reads the tracks of a Matroska file from its header, instead of scanning it
+with HandbrakeCLI. Only the EBML header, the SeekHead, Info, Tracks, Chapters
+and Tags elements are read, by bounded reads: the clusters are never read.
+"""
+
+import os, struct
+from handbrake import HandbrakeProcess, HandbrakeOutputParser, Title, AudioStream, VideoStream, SubtitleStream
+
+EBML = 0x1A45DFA3
+DOCTYPE = 0x4282
+SEGMENT = 0x18538067
+SEEKHEAD, SEEK, SEEKID, SEEKPOSITION = 0x114D9B74, 0x4DBB, 0x53AB, 0x53AC
+INFO, TIMECODESCALE, DURATION = 0x1549A966, 0x2AD7B1, 0x4489
+TRACKS, TRACKENTRY = 0x1654AE6B, 0xAE
+TRACKUID, TRACKTYPE, CODECID, CODECPRIVATE, LANGUAGE, DEFAULTDURATION = 0x73C5, 0x83, 0x86, 0x63A2, 0x22B59C, 0x23E383
+LANGUAGEIETF = 0x22B59D
+NAME = 0x536E
+VIDEO, PIXELWIDTH, PIXELHEIGHT = 0xE0, 0xB0, 0xBA
+AUDIO, SAMPLINGFREQUENCY, CHANNELS = 0xE1, 0xB5, 0x9F
+CHAPTERS, EDITIONENTRY, CHAPTERATOM, CHAPTERTIMESTART = 0x1043A770, 0x45B9, 0xB6, 0x91
+TAGS, TAG, TARGETS, TAGTRACKUID, SIMPLETAG, TAGNAME, TAGSTRING = 0x1254C367, 0x7373, 0x63C0, 0x63C5, 0x67C8, 0x45A3, 0x4487
+CLUSTER = 0x1F43B675
+
+VIDEO_CODECS = {'V_MPEG4/ISO/AVC': 'h264', 'V_MPEGH/ISO/HEVC': 'hevc', 'V_MPEG2': 'mpeg2video',
+                'V_MPEG1': 'mpeg1video', 'V_VP8': 'vp8', 'V_VP9': 'vp9', 'V_AV1': 'av1', 'V_MS/VFW/FOURCC': 'vfw'}
+AVC_PROFILES = {66: 'Baseline', 77: 'Main', 88: 'Extended', 100: 'High', 110: 'High 10',
+                122: 'High 4:2:2', 244: 'High 4:4:4 Predictive'}
+# Names given by HandbrakeCLI, compared to the audio-codec preference
+AUDIO_CODECS = {'A_AC3': 'AC3', 'A_EAC3': 'E-AC3', 'A_TRUEHD': 'TrueHD', 'A_AAC': 'AAC', 'A_FLAC': 'FLAC',
+                'A_MPEG/L3': 'MP3', 'A_MPEG/L2': 'MP2', 'A_PCM': 'PCM', 'A_OPUS': 'Opus', 'A_VORBIS': 'Vorbis',
+                'A_DTS/LOSSLESS': 'DTS-HD MA', 'A_DTS/EXPRESS': 'DTS Express'}
+# A_DTS is used for every DTS profile, told apart by the track name (see getdts)
+DTS_NAMES = [('MASTER AUDIO', 'DTS-HD MA'), ('DTS-HD MA', 'DTS-HD MA'), ('HIGH RES', 'DTS-HD HRA'),
+             ('DTS-HD HRA', 'DTS-HD HRA'), ('DTS-HD', None), ('DTS-ES', 'DTS-ES'), ('DTS', 'DTS')]
+# Matroska writes the bibliographic ISO 639-2 codes, HandbrakeCLI and the preset the terminology ones
+ISO639_2B = {'alb': 'sqi', 'arm': 'hye', 'baq': 'eus', 'bur': 'mya', 'chi': 'zho', 'cze': 'ces', 'dut': 'nld',
+             'fre': 'fra', 'geo': 'kat', 'ger': 'deu', 'gre': 'ell', 'ice': 'isl', 'mac': 'mkd', 'mao': 'mri',
+             'may': 'msa', 'per': 'fas', 'rum': 'ron', 'slo': 'slk', 'tib': 'bod', 'wel': 'cym'}
+# ISO 639-1 codes of the BCP 47 tags of LanguageIETF
+ISO639_1 = dict(code.split(':') for code in '''
+    aa:aar ab:abk ae:ave af:afr ak:aka am:amh an:arg ar:ara as:asm av:ava ay:aym az:aze ba:bak be:bel bg:bul
+    bh:bih bi:bis bm:bam bn:ben bo:bod br:bre bs:bos ca:cat ce:che ch:cha co:cos cr:cre cs:ces cu:chu cv:chv
+    cy:cym da:dan de:deu dv:div dz:dzo ee:ewe el:ell en:eng eo:epo es:spa et:est eu:eus fa:fas ff:ful fi:fin
+    fj:fij fo:fao fr:fra fy:fry ga:gle gd:gla gl:glg gn:grn gu:guj gv:glv ha:hau he:heb hi:hin ho:hmo hr:hrv
+    ht:hat hu:hun hy:hye hz:her ia:ina id:ind ie:ile ig:ibo ii:iii ik:ipk io:ido is:isl it:ita iu:iku ja:jpn
+    jv:jav ka:kat kg:kon ki:kik kj:kua kk:kaz kl:kal km:khm kn:kan ko:kor kr:kau ks:kas ku:kur kv:kom kw:cor
+    ky:kir la:lat lb:ltz lg:lug li:lim ln:lin lo:lao lt:lit lu:lub lv:lav mg:mlg mh:mah mi:mri mk:mkd ml:mal
+    mn:mon mr:mar ms:msa mt:mlt my:mya na:nau nb:nob nd:nde ne:nep ng:ndo nl:nld nn:nno no:nor nr:nbl nv:nav
+    ny:nya oc:oci oj:oji om:orm or:ori os:oss pa:pan pi:pli pl:pol ps:pus pt:por qu:que rm:roh rn:run ro:ron
+    ru:rus rw:kin sa:san sc:srd sd:snd se:sme sg:sag si:sin sk:slk sl:slv sm:smo sn:sna so:som sq:sqi sr:srp
+    ss:ssw st:sot su:sun sv:swe sw:swa ta:tam te:tel tg:tgk th:tha ti:tir tk:tuk tl:tgl tn:tsn to:ton tr:tur
+    ts:tso tt:tat tw:twi ty:tah ug:uig uk:ukr ur:urd uz:uzb ve:ven vi:vie vo:vol wa:wln wo:wol xh:xho yi:yid
+    yo:yor za:zha zh:zho zu:zul'''.split())
+CHANNELS_TYPES = {1: '1.0 ch', 2: '2.0 ch', 3: '2.1 ch', 6: '5.1 ch', 7: '6.1 ch', 8: '7.1 ch'}
+max_element = 16 * 1024 * 1024 # bytes of the largest element read
+
+class MkvError(Exception):
+    pass
+
+def readvint(data, pos, mask=True):
+    """(value, length) of the variable size integer at pos, value being None if unknown"""
+    if pos >= len(data):
+        raise MkvError('Truncated element')
+    first = ord(data[pos])
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8 or pos + length > len(data):
+        raise MkvError('Invalid variable size integer')
+    value = first & (0xFF >> length) if mask else first
+    for c in data[pos + 1:pos + length]:
+        value = (value << 8) | ord(c)
+    if mask and value == (1 << (7 * length)) - 1:
+        value = None # all ones: unknown size
+    return value, length
+
+def readheader(data, pos):
+    """(id, size, position of the data) of the element at pos"""
+    eid, idlength = readvint(data, pos, False)
+    size, sizelength = readvint(data, pos + idlength)
+    return eid, size, pos + idlength + sizelength
+
+def children(data, start=0, end=None):
+    """(id, data) of each element between start and end"""
+    end = len(data) if end is None else end
+    pos = start
+    while pos < end:
+        eid, size, datapos = readheader(data, pos)
+        if size is None or datapos + size > end:
+            raise MkvError('Element 0x%X overflows its parent' % eid)
+        yield eid, data[datapos:datapos + size]
+        pos = datapos + size
+
+def uint(data):
+    value = 0
+    for c in data:
+        value = (value << 8) | ord(c)
+    return value
+
+def floating(data):
+    if len(data) == 4:
+        return struct.unpack('>f', data)[0]
+    if len(data) == 8:
+        return struct.unpack('>d', data)[0]
+    raise MkvError('Invalid float of %d bytes' % len(data))
+
+def string(data):
+    return data.rstrip('\0')
+
+class MkvReader:
+    """
+    Reads the top level elements of the segment of a Matroska file.
+    Elements before the first cluster are read in order, the others are
+    found through the SeekHead.
+    """
+
+    wanted = (INFO, TRACKS, CHAPTERS, TAGS)
+
+    def __init__(self, fhandler):
+        self.f = fhandler
+        self.filesize = os.fstat(fhandler.fileno()).st_size
+        self.elements = {} # id -> data
+
+    def read(self, pos, size):
+        if size is None or pos + size > self.filesize:
+            raise MkvError('Truncated file')
+        if size > max_element:
+            raise MkvError('Element of %d bytes at %d is too large' % (size, pos))
+        self.f.seek(pos)
+        data = self.f.read(size)
+        if len(data) != size:
+            raise MkvError('Truncated file')
+        return data
+
+    def header(self, pos):
+        """(id, size, position of the data) of the element at pos of the file"""
+        head = self.read(pos, max(0, min(12, self.filesize - pos)))
+        eid, size, datapos = readheader(head, 0)
+        return eid, size, pos + datapos
+
+    def load(self):
+        eid, size, datapos = self.header(0)
+        if eid != EBML:
+            raise MkvError('Not an EBML file')
+        doctype = dict(children(self.read(datapos, size))).get(DOCTYPE)
+        if doctype is None or string(doctype) not in ('matroska', 'webm'):
+            raise MkvError('Not a Matroska file')
+        eid, size, segment = self.header(datapos + size)
+        if eid != SEGMENT:
+            raise MkvError('No segment')
+        end = segment + size if size is not None else self.filesize
+        seeks = {}
+        pos = segment
+        while pos < end:
+            eid, size, datapos = self.header(pos)
+            if eid == CLUSTER or size is None:
+                break
+            if eid == SEEKHEAD:
+                for seekid, seek in children(self.read(datapos, size)):
+                    if seekid == SEEK:
+                        fields = dict(children(seek))
+                        if SEEKID in fields and SEEKPOSITION in fields:
+                            seeks.setdefault(uint(fields[SEEKID]), segment + uint(fields[SEEKPOSITION]))
+            elif eid in MkvReader.wanted:
+                self.elements[eid] = self.read(datapos, size)
+            pos = datapos + size
+        for eid in MkvReader.wanted:
+            if eid not in self.elements and eid in seeks and seeks[eid] < end:
+                found, size, datapos = self.header(seeks[eid])
+                if found == eid and size is not None:
+                    self.elements[eid] = self.read(datapos, size)
+        if INFO not in self.elements or TRACKS not in self.elements:
+            raise MkvError('No Info or Tracks element')
+
+def probe(filepath):
+    """
+    HandbrakeOutputParser of a Matroska file, as if scanned by HandbrakeCLI.
+    Raises MkvError if it can't be read, in which case HandbrakeCLI must scan it.
+    """
+    with open(filepath, 'rb') as fhandler:
+        reader = MkvReader(fhandler)
+        reader.load()
+    info = dict(children(reader.elements[INFO]))
+    scale = uint(info[TIMECODESCALE]) if TIMECODESCALE in info else 1000000
+    if DURATION not in info:
+        raise MkvError('No duration')
+    seconds = floating(info[DURATION]) * scale / 1e9
+    if seconds < HandbrakeProcess.min_duration: # Not a title for HandbrakeCLI either
+        return HandbrakeOutputParser()
+    title = Title('1')
+    title.main = True
+    title.duration = int(seconds)
+    title.chapters = getchapters(reader.elements.get(CHAPTERS), seconds)
+    bitrates = getbitrates(reader.elements.get(TAGS))
+    for eid, entry in children(reader.elements[TRACKS]):
+        if eid == TRACKENTRY:
+            addtrack(title, dict(children(entry)), bitrates)
+    if title.video is None:
+        raise MkvError('No video track')
+    if title.video.bitrate is None and seconds > 0 and all(a.bitrate for a in title.audio):
+        # The file size gives the overall bitrate
+        overall = reader.filesize * 8 / seconds / 1000
+        audio = sum(int(a.bitrate) for a in title.audio) / 1000
+        if overall > audio:
+            title.video.bitrate = int(overall - audio)
+    hop = HandbrakeOutputParser()
+    hop.titles.append(title)
+    hop.select(title)
+    return hop
+
+def addtrack(title, fields, bitrates):
+    tracktype = uint(fields.get(TRACKTYPE, ''))
+    codecid = string(fields.get(CODECID, ''))
+    language = getlanguage(fields)
+    bitrate = bitrates.get(uint(fields.get(TRACKUID, '')))
+    if tracktype == 1 and title.video is None:
+        video = dict(children(fields.get(VIDEO, '')))
+        fps = None
+        if DEFAULTDURATION in fields:
+            fps = '%g' % round(1e9 / uint(fields[DEFAULTDURATION]), 3)
+        title.video = VideoStream(width=str(uint(video.get(PIXELWIDTH, ''))), height=str(uint(video.get(PIXELHEIGHT, ''))),
+                                  fps=fps, codec=VIDEO_CODECS.get(codecid, codecid.lower()),
+                                  profile=getprofile(codecid, fields.get(CODECPRIVATE)),
+                                  bitrate=int(bitrate) // 1000 if bitrate else None)
+        if fps is None:
+            raise MkvError('No frame rate')
+    elif tracktype == 2:
+        audio = dict(children(fields.get(AUDIO, '')))
+        channels = uint(audio[CHANNELS]) if CHANNELS in audio else 1
+        if codecid == 'A_DTS':
+            codec = getdts(string(fields.get(NAME, '')))
+        else:
+            codec = AUDIO_CODECS.get(codecid)
+        if codec is None:
+            codec = AUDIO_CODECS.get(codecid.split('/')[0], codecid)
+        title.audio.append(AudioStream(position=str(len(title.audio) + 1), language=language,
+                                       type=CHANNELS_TYPES.get(channels, '%d ch' % channels), codec=codec,
+                                       frequency='%d' % floating(audio[SAMPLINGFREQUENCY]) if SAMPLINGFREQUENCY in audio else None,
+                                       bitrate=bitrate))
+    elif tracktype == 17:
+        encoding = 'UTF-8' if codecid.startswith('S_TEXT') else 'Bitmap'
+        title.subtitle.append(SubtitleStream(position=str(len(title.subtitle) + 1), language=language, encoding=encoding))
+
+def getlanguage(fields):
+    """
+    ISO 639-2/T code of a track, as printed by HandbrakeCLI: from LanguageIETF
+    when its language is known, else from Language (eng by default)
+    """
+    if LANGUAGEIETF in fields:
+        primary = string(fields[LANGUAGEIETF]).split('-')[0].lower()
+        if len(primary) == 2 and primary in ISO639_1:
+            return ISO639_1[primary]
+        if len(primary) == 3:
+            return ISO639_2B.get(primary, primary)
+    language = string(fields[LANGUAGE]).lower() if LANGUAGE in fields else 'eng' # Matroska default
+    return ISO639_2B.get(language, language)
+
+def getdts(name):
+    """
+    Name of a DTS profile given by HandbrakeCLI, from the track name written
+    by the muxer (eg. 'DTS-HD MA 5.1'). Raises MkvError without one, DTS
+    and DTS-HD being told apart by the audio preferences.
+    """
+    name = name.upper()
+    for pattern, codec in DTS_NAMES:
+        if pattern in name:
+            if codec is None:
+                break
+            return codec
+    raise MkvError('DTS track of unknown profile')
+
+def getprofile(codecid, private):
+    """Profile of an h264 stream, from its AVCDecoderConfigurationRecord"""
+    if codecid != 'V_MPEG4/ISO/AVC' or private is None or len(private) < 4:
+        return None
+    profile = AVC_PROFILES.get(ord(private[1]))
+    if profile == 'Baseline' and ord(private[2]) & 0x40: # constraint_set1_flag
+        profile = 'Constrained Baseline'
+    return profile
+
+def getchapters(chapters, duration):
+    """
+    Durations in seconds of the chapters of the first edition, truncated as
+    HandbrakeCLI prints them (hh:mm:ss), so that dedup.signature is the same
+    whichever way the file was scanned
+    """
+    if chapters is None:
+        return []
+    for eid, edition in children(chapters):
+        if eid != EDITIONENTRY:
+            continue
+        starts = []
+        for aid, atom in children(edition):
+            if aid == CHAPTERATOM:
+                fields = dict(children(atom))
+                if CHAPTERTIMESTART in fields:
+                    starts.append(uint(fields[CHAPTERTIMESTART])) # ns
+        starts.sort()
+        ends = starts[1:] + [int(duration * 1e9)]
+        return [int((end - start) // 1000000000) for start, end in zip(starts, ends)]
+    return []
+
+def getbitrates(tags):
+    """Track uid -> BPS tag written by mkvmerge, in bits per second"""
+    bitrates = {}
+    if tags is None:
+        return bitrates
+    for eid, tag in children(tags):
+        if eid != TAG:
+            continue
+        uids = []
+        bps = None
+        for tid, field in children(tag):
+            if tid == TARGETS:
+                uids = [uint(v) for k, v in children(field) if k == TAGTRACKUID]
+            elif tid == SIMPLETAG:
+                simple = dict(children(field))
+                if string(simple.get(TAGNAME, '')) == 'BPS' and TAGSTRING in simple:
+                    bps = string(simple[TAGSTRING])
+        if bps is not None and bps.isdigit():
+            for uid in uids:
+                bitrates[uid] = bps
+    return bitrates
@@ -0,0 +1,158 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, sys, json, heapq
+from os import path
+from threading import Lock
+
+class Planner:
+    """
+    Collects the estimates of every scanned title with --plan: output size from
+    the computed bitrate and the duration, rip time from the speed of former
+    rips of the same width (see CostModel). The report sums them up, by
+    destination folder for the disk space, and for jobs simultaneous rips.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.titles = []
+
+    def add(self, source, output, duration, width, height, mode, bitrate, audio, seconds):
+        """bitrate and audio in kbps, None if unknown, seconds None without history"""
+        size = None
+        if bitrate is not None and duration:
+            size = int((bitrate + audio) * 1000 / 8.0 * duration)
+        with self.lock:
+            self.titles.append({'source': source, 'output': output, 'duration': duration, 'width': width,
+                                'height': height, 'mode': mode, 'bitrate': bitrate, 'audio_bitrate': audio,
+                                'bytes': size, 'seconds': seconds})
+
+    def getdestinations(self):
+        """
+        Bytes to write in each destination folder, and bytes free there. Folders
+        on the same filesystem share its free space: filesystem_bytes is what
+        all of them need.
+        """
+        required = {}
+        for title in self.titles:
+            folder = path.dirname(title['output'])
+            required[folder] = required.get(folder, 0) + (title['bytes'] or 0)
+        devices = {} # folder -> st_dev of its filesystem
+        shared = {} # st_dev -> bytes to write on it
+        for folder, size in required.items():
+            devices[folder] = getdevice(folder)
+            shared[devices[folder]] = shared.get(devices[folder], 0) + size
+        destinations = []
+        for folder, size in sorted(required.items()):
+            free = getfree(folder)
+            total = shared[devices[folder]] if devices[folder] is not None else size
+            destinations.append({'folder': folder, 'bytes': size, 'free': free, 'filesystem_bytes': total,
+                                 'enough': free is None or free >= total})
+        return destinations
+
+    def gettotals(self, jobs):
+        """Sums of every title, seconds and wall being None if no rip time is known"""
+        known = [t['seconds'] for t in self.titles if t['seconds'] is not None]
+        return {'titles': len(self.titles),
+                'bytes': sum(t['bytes'] or 0 for t in self.titles),
+                'duration': sum(t['duration'] or 0 for t in self.titles),
+                'seconds': sum(known) if known else None,
+                'remuxed': len([t for t in self.titles if t['mode'] == 'remux']),
+                'unknown_size': len([t for t in self.titles if t['bytes'] is None]),
+                'unknown_time': len([t for t in self.titles if t['seconds'] is None and t['mode'] != 'remux']),
+                'jobs': jobs,
+                'wall': getmakespan(known, jobs) if known else None}
+
+    def todict(self, jobs):
+        return {'titles': sorted(self.titles, key=lambda t: t['source']),
+                'destinations': self.getdestinations(),
+                'totals': self.gettotals(jobs)}
+
+    def report(self, jobs, jsonfile=None):
+        """Prints the plan as a table, and writes it as JSON to jsonfile ('-' for stdout)"""
+        plan = self.todict(jobs)
+        if jsonfile == '-':
+            json.dump(plan, sys.stdout, indent=2, sort_keys=True)
+            sys.stdout.write('\n')
+            return
+        if jsonfile is not None:
+            with open(jsonfile, 'w') as fhandler:
+                json.dump(plan, fhandler, indent=2, sort_keys=True)
+        print('%-50s %10s %9s %-8s %8s %10s %10s' % ('source', 'size', 'duration', 'mode', 'kbps', 'output', 'rip time'))
+        for title in plan['titles']:
+            print('%-50s %10s %9s %-8s %8s %10s %10s' % (
+                getshortname(title['source'], 50), '%sx%s' % (title['width'], title['height']), gethms(title['duration']),
+                title['mode'], title['bitrate'] if title['bitrate'] is not None else '?',
+                getgb(title['bytes']), gethms(title['seconds']) if title['mode'] != 'remux' else '-'))
+        print('\n%-50s %10s %10s' % ('destination', 'required', 'free'))
+        for destination in plan['destinations']:
+            warning = ''
+            if not destination['enough'] and destination['filesystem_bytes'] != destination['bytes']:
+                warning = '  NOT ENOUGH SPACE, %s with the other destinations of its filesystem' % getgb(destination['filesystem_bytes'])
+            elif not destination['enough']:
+                warning = '  NOT ENOUGH SPACE'
+            print('%-50s %10s %10s%s' % (getshortname(destination['folder'], 50), getgb(destination['bytes']),
+                                         getgb(destination['free']), warning))
+        totals = plan['totals']
+        print('\n%d title(s), %s of video, %s to write, %d of them remuxed' %
+              (totals['titles'], gethms(totals['duration']), getgb(totals['bytes']), totals['remuxed']))
+        print('Rip time : %s, about %s with %d job(s)' % (gethms(totals['seconds']), gethms(totals['wall']), jobs))
+        if totals['unknown_size']:
+            print('%d title(s) without size: bits*(pixels/frame) unknown for their width' % totals['unknown_size'])
+        if totals['unknown_time']:
+            print('%d title(s) without rip time: no former rip of their width in history.jsonl' % totals['unknown_time'])
+        if jsonfile is not None:
+            print('Plan written to %s' % jsonfile)
+
+def getmakespan(durations, jobs):
+    """Time jobs simultaneous rips take, the longest ones started first"""
+    ends = [0.0] * max(1, jobs)
+    for duration in sorted(durations, reverse=True):
+        heapq.heapreplace(ends, ends[0] + duration)
+    return max(ends)
+
+def getexisting(folder):
+    """The folder itself or its nearest existing parent, where it will be created"""
+    while folder and not path.isdir(folder):
+        parent = path.dirname(folder)
+        if parent == folder:
+            return None
+        folder = parent
+    return folder or '.'
+
+def getfree(folder):
+    """Bytes free on the filesystem folder will be created in"""
+    existing = getexisting(folder)
+    if existing is None:
+        return None
+    try:
+        st = os.statvfs(existing)
+    except OSError:
+        return None
+    return st.f_bavail * st.f_frsize
+
+def getdevice(folder):
+    """st_dev of the filesystem folder will be created in, None if unknown"""
+    existing = getexisting(folder)
+    if existing is None:
+        return None
+    try:
+        return os.stat(existing).st_dev
+    except OSError:
+        return None
+
+def gethms(seconds):
+    if seconds is None:
+        return '?'
+    seconds = int(round(seconds))
+    return '%d:%02d:%02d' % (seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+def getgb(size):
+    if size is None:
+        return '?'
+    return '%.2f GB' % (size / 1024.0 ** 3)
+
+def getshortname(name, width):
+    return name if len(name) <= width else '...' + name[-(width - 3):]
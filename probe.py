@@ -0,0 +1,86 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, sys, shutil, tempfile
+from os import path
+from handbrake import HandbrakeProcess
+from cache import ScanCache
+from tools import getbitrate, getconfigdir
+
+class ComplexityProbe:
+    """
+    Rates how hard a source is to encode: a few short constant quality encodes,
+    cut like --sample does, give the bitrate x264 needs for this source, which
+    is compared to the one the bpf model gives to an average source.
+    Measured bitrates are cached per source, like scans, and evicted the same
+    way (see evict).
+    """
+
+    samples = 3
+    length = 10 # seconds of each sample
+    quality = 20
+    reference = 1.5 # CRF bitrate / model bitrate of an average source
+    bounds = (0.6, 1.3)
+    skipped_options = ['two-pass', 'turbo', 'vb', 'quality']
+
+    def __init__(self, preset, cache=True):
+        self.preset = preset
+        self.cache = ScanCache(getconfigdir('probes'), read=cache, write=cache)
+
+    def evict(self):
+        """Removes the bitrates of sources not probed for ScanCache.max_age"""
+        self.cache.evict()
+
+    def measure(self, filepath, hop):
+        """Returns the median bitrate in kbps of the sample encodes, or None"""
+        bitrate = self.cache.get(filepath)
+        if bitrate is not None:
+            return bitrate
+        if hop.video() is None or not hop.duration or hop.duration < 2 * self.length:
+            return None
+        tmpdir = tempfile.mkdtemp(prefix='rippy-probe-')
+        try:
+            bitrates = []
+            for i in range(ComplexityProbe.samples):
+                start = hop.duration * (i + 1) // (ComplexityProbe.samples + 1)
+                bitrates.append(self.encode(filepath, hop, start, path.join(tmpdir, '%d.mkv' % i)))
+        except Exception as e:
+            sys.stderr.write('%s: probe failed, %s\n' % (filepath, e))
+            return None
+        finally:
+            shutil.rmtree(tmpdir)
+        bitrate = sorted(bitrates)[len(bitrates) // 2]
+        self.cache.put(filepath, bitrate)
+        return bitrate
+
+    def rate(self, filepath, hop):
+        """Returns the factor to apply to the bpf of filepath, 1 meaning average"""
+        video = hop.video()
+        if video is None:
+            return None
+        model = getbitrate(video.width, video.height, video.fps)
+        if model is None:
+            return None
+        measured = self.measure(filepath, hop)
+        if measured is None:
+            return None
+        low, high = ComplexityProbe.bounds
+        return round(min(max(measured / (model * ComplexityProbe.reference), low), high), 3)
+
+    def encode(self, filepath, hop, start, output):
+        """Encodes length seconds of video only from start, returns the bitrate in kbps"""
+        proc = HandbrakeProcess(filepath)
+        for k, v in self.preset.getoptions():
+            if k not in ComplexityProbe.skipped_options:
+                proc.setoption(k, v)
+        proc.settitle(hop.title)
+        proc.setoption('audio', 'none')
+        proc.setoption('quality', ComplexityProbe.quality)
+        proc.setoption('start-at', 'duration:%d' % start)
+        proc.setoption('stop-at', 'duration:%d' % ComplexityProbe.length)
+        proc.setoutput(output)
+        proc.setlogfile(os.devnull)
+        proc.rip()
+        return path.getsize(output) * 8 / 1000.0 / ComplexityProbe.length
@@ -0,0 +1,175 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import math, threading, cProfile, pstats
+from threading import Lock
+from tools import getmonotonic
+
+# Phases of a file, in pipeline order, and whether they are spent in another process
+PHASES = [('walk', False), ('cache', False), ('mkvprobe', False), ('scan', True), ('parse', False),
+          ('questions', False), ('ask', False), ('rip_queue', False), ('encode', True), ('remux', True),
+          ('bookkeeping', False), ('transfer', False)]
+
+class Timer:
+    """
+    Context manager adding the time spent in its block to a phase
+    """
+    def __init__(self, profiler, phase):
+        self.profiler = profiler
+        self.phase = phase
+        self.start = None
+
+    def __enter__(self):
+        self.start = getmonotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.phase, getmonotonic() - self.start)
+        return False
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class Stopwatch:
+    """
+    Sums the time spent in the functions it wraps, eg. the parser fed by chunks
+    """
+    def __init__(self):
+        self.elapsed = 0.0
+
+    def wrap(self, func):
+        def timed(*args, **kwargs):
+            start = getmonotonic()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.elapsed += getmonotonic() - start
+        return timed
+
+class Profiler:
+    """
+    Times each phase of every file with a monotonic clock (see PHASES) and
+    counts events, to print a breakdown by phase once the run is over.
+    A disabled profiler, the default, records nothing.
+    With dumpfile, rippy's threads are also run under cProfile, their
+    statistics being merged into dumpfile (see pstats).
+    """
+
+    null_timer = NullTimer()
+
+    def __init__(self, enabled=False, dumpfile=None):
+        self.enabled = enabled
+        self.dumpfile = dumpfile
+        self.lock = Lock()
+        self.samples = {} # phase -> seconds of each file
+        self.counters = {}
+        self.pending = {} # (phase, key) -> start, see begin()
+        self.profiles = []
+        self.started = getmonotonic()
+
+    def start(self):
+        """Profiles the calling thread and the threads started from now on"""
+        if self.dumpfile is None:
+            return
+        threading.setprofile(self._bootstrap)
+        self._profile()
+
+    def _bootstrap(self, frame, event, arg):
+        # First event of a new thread: cProfile replaces this hook
+        self._profile()
+
+    def _profile(self):
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def timer(self, phase):
+        if not self.enabled:
+            return Profiler.null_timer
+        return Timer(self, phase)
+
+    def iterate(self, phase, iterable):
+        """Yields the items of iterable, the time to get each one being a sample of phase"""
+        iterator = iter(iterable)
+        while True:
+            start = getmonotonic()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.add(phase, getmonotonic() - start)
+            yield item
+
+    def add(self, phase, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.samples.setdefault(phase, []).append(seconds)
+
+    def begin(self, phase, key):
+        """Starts a phase which ends in another function, or another thread, see end()"""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.pending[(phase, key)] = getmonotonic()
+
+    def end(self, phase, key):
+        if not self.enabled:
+            return
+        with self.lock:
+            start = self.pending.pop((phase, key), None)
+        if start is not None:
+            self.add(phase, getmonotonic() - start)
+
+    def count(self, counter, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def report(self):
+        """Prints the breakdown by phase, and writes the cProfile dump"""
+        if not self.enabled:
+            return
+        wall = getmonotonic() - self.started
+        print('\n%-12s %8s %11s %10s %10s %10s' % ('phase', 'files', 'total (s)', 'p50 (ms)', 'p95 (ms)', 'max (ms)'))
+        external = internal = 0.0
+        for phase, spawned in PHASES:
+            samples = sorted(self.samples.get(phase, []))
+            if not samples:
+                continue
+            total = sum(samples)
+            if spawned:
+                external += total
+            elif phase not in ('questions', 'rip_queue', 'transfer'): # waits, or in the background
+                internal += total
+            print('%-12s %8d %11.3f %10.1f %10.1f %10.1f' % (phase, len(samples), total, getpercentile(samples, 50) * 1000,
+                                                              getpercentile(samples, 95) * 1000, samples[-1] * 1000))
+        print('Wall time : %.3fs, spent by HandbrakeCLI and mkvmerge : %.3fs, by rippy : %.3fs' % (wall, external, internal))
+        if self.counters:
+            print('Counters : %s' % ', '.join('%s=%d' % item for item in sorted(self.counters.items())))
+        self.dump()
+
+    def dump(self):
+        if self.dumpfile is None or not self.profiles:
+            return
+        threading.setprofile(None)
+        with self.lock:
+            profiles = list(self.profiles)
+        for profile in profiles:
+            profile.disable()
+        stats = pstats.Stats(*profiles)
+        stats.dump_stats(self.dumpfile)
+        print('cProfile statistics of %d thread(s) written to %s, see python -m pstats' % (len(profiles), self.dumpfile))
+
+def getpercentile(samples, percent):
+    """Nearest-rank percentile of sorted samples"""
+    rank = int(math.ceil(percent / 100.0 * len(samples))) - 1
+    return samples[min(max(rank, 0), len(samples) - 1)]
@@ -0,0 +1,75 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, re, json
+from os import path
+from subprocess import Popen, PIPE
+from handbrake import HandbrakeProcess, Progress
+from segments import SegmentGroup
+
+class RemuxProcess(HandbrakeProcess):
+    """
+    Copies the streams of a source whose video already meets the target
+    (see canremux) with mkvmerge instead of encoding it, keeping only the
+    prefered audio and subtitle tracks. Queued and ripped like a HandbrakeProcess.
+    """
+
+    profiles = ['Constrained Baseline', 'Baseline', 'Main', 'High']
+    re_progress = re.compile('(?P<percent>\d+)%')
+
+    def __init__(self, filepath):
+        HandbrakeProcess.__init__(self, filepath)
+        self.mode = 'remux'
+
+    def spawn(self):
+        source = self.args['input']
+        audioids, subtitleids = RemuxProcess.gettracks(source)
+        # HandbrakeCLI numbers audio and subtitle tracks from 1, in the order of the container
+        audio = [str(audioids[int(p) - 1]) for p in self._getlist('audio')]
+        subtitle = [str(subtitleids[int(p) - 1]) for p in self._getlist('subtitle')]
+        arr = [SegmentGroup.mkvmerge, '--output', self.args['output']]
+        arr.extend(['--audio-tracks', ','.join(audio)] if audio else ['--no-audio'])
+        arr.extend(['--subtitle-tracks', ','.join(subtitle)] if subtitle else ['--no-subtitles'])
+        arr.append(source)
+        arr.extend(self._getlist('srt-file'))
+        if not path.isdir(path.dirname(self.args['output'])):
+            os.makedirs(path.dirname(self.args['output']))
+        self._setlogfile()
+        self._spawn(arr, self.logfile, HandbrakeProcess.tail_size)
+
+    def wait(self):
+        self._reap()
+        if self.returncode not in (0, 1): # 1 means warnings
+            raise Exception('mkvmerge exited with code %d, see %s' % (self.returncode, self.logfile))
+
+    def _getlist(self, key):
+        value = self.args.get(key)
+        return value.split(',') if value else []
+
+    def _handleprogress(self, data):
+        lines = HandbrakeProcess.re_lines.split(data)
+        for line in lines[:-1]:
+            matches = RemuxProcess.re_progress.search(line)
+            if matches is not None:
+                self.progress = Progress(1, 1, float(matches.group('percent')))
+                for handler in self.progress_handlers:
+                    handler(self.progress)
+        return lines[-1]
+
+    @staticmethod
+    def gettracks(source):
+        """mkvmerge ids of the audio tracks and of the subtitle tracks of source"""
+        child = Popen([SegmentGroup.mkvmerge, '-J', source], stdout=PIPE, stderr=PIPE)
+        stdout, stderr = child.communicate()
+        if child.returncode != 0:
+            raise Exception('mkvmerge -J %s exited with code %d: %s' % (source, child.returncode, stderr.strip()))
+        tracks = json.loads(stdout)['tracks']
+        return ([t['id'] for t in tracks if t['type'] == 'audio'],
+                [t['id'] for t in tracks if t['type'] == 'subtitles'])
+
+def canremux(video, bitrate):
+    """True if the video of a source can be kept as is, bitrate being the one of a rip"""
+    return video is not None and video.codec == 'h264' and video.profile in RemuxProcess.profiles \
+        and video.bitrate is not None and bitrate is not None and video.bitrate <= bitrate
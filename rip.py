@@ -11,17 +11,37 @@ to generate lightweight x264 HD Videos (720p/1080p) without quality loss.
 
 from argparse import ArgumentParser
 import xml.etree.ElementTree as ET
+import os
 import os.path as path
-from os import walk, makedirs, remove, rename
-import sys, traceback, errno, signal
+import sys, traceback, signal, time
+from copy import copy
 from handbrake import AudioStream, HandbrakeProcess, HandbrakeOutputParser
-from threading import Thread
+from threading import Thread, Lock
 from tools import getbitrate
-from Queue import Queue, Empty
+from Queue import Queue
 from ask.ask import Ask
 from ask.question import Choices, YesNo, Text, Path, Float
-from tools import getbpf
-from os.path import expanduser
+from tools import getbpf, getthreads, getchecksum, getreference, getmonotonic
+from walker import LibraryWalker
+from cache import ScanCache
+from metrics import JobMetrics, MetricsExporter
+from journal import Journal
+from dedup import DuplicateIndex
+from rules import Rules
+from scheduler import CostModel, ScheduledQueue
+from probe import ComplexityProbe
+from governor import Governor
+from engine import RipEngine
+from transfer import Transfer
+from staging import Stager
+from remux import RemuxProcess, canremux
+from profiler import Profiler, Stopwatch
+from planner import Planner
+from watcher import Watcher
+import segments
+import mkvprobe
+import farm
+from farm import Coordinator, FarmWorker
 
 class Preference:
     """
@@ -80,50 +100,304 @@ class Preset:
     def getpreference(self, key):
         return self.preferences[key]
 
+class Throughput:
+    """
+    Aggregates encoded frames and wall time of every rip,
+    so that several --jobs values can be compared.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.frames = 0
+        self.elapsed = 0.0
+        self.count = 0
+        self.remuxed = 0
+        self.saved = 0.0 # seconds, estimated
+        self.start = None
+        self.end = None
+        self.workers = set() # farm workers which ripped files, see Coordinator
+
+    def add(self, proc):
+        with self.lock:
+            if proc.worker is not None:
+                self.workers.add(proc.worker)
+            if self.start is None or proc.started < self.start:
+                self.start = proc.started
+            self.end = max(self.end, time.time())
+            self.count += 1
+            if proc.mode == 'remux':
+                self.remuxed += 1
+                if proc.metrics is not None and proc.metrics.estimate is not None:
+                    self.saved += max(0, proc.metrics.estimate - (proc.elapsed or 0.0))
+                return
+            self.elapsed += proc.elapsed or 0.0
+            if proc.frames is not None:
+                self.frames += proc.frames
+
+    def report(self, jobs):
+        if self.count == 0:
+            return
+        wall = max(self.end - self.start, 0.001)
+        if self.workers:
+            print('%d file(s) ripped by %d farm worker(s) in %ds : %s' % (self.count, len(self.workers), wall,
+                                                                         ', '.join(sorted(self.workers))))
+        else:
+            print('%d file(s) ripped by %d job(s) in %ds' % (self.count, jobs, wall))
+        if self.remuxed > 0 and self.saved > 0:
+            print('%d of them remuxed instead of encoded, saving about %ds' % (self.remuxed, self.saved))
+        elif self.remuxed > 0: # Nothing ripped yet to estimate it
+            print('%d of them remuxed instead of encoded' % self.remuxed)
+        if self.frames == 0:
+            return
+        print('Aggregate throughput : %.2f fps' % (self.frames / wall))
+        if self.elapsed > 0:
+            print('Average per job : %.2f fps' % (self.frames / self.elapsed))
+
 class Worker:
 
+    scan_queue = Queue()
     questions_queue = Queue()
-    rip_queue = Queue()
+    rip_queue = ScheduledQueue()
     finished = False
+    jobs = 1
+    throughput = Throughput()
+    scan_cache = None
+    metrics = None
+    journal = None
+    duplicates = None
+    rules = None
+    costs = None
+    probe = None
+    governor = Governor()
+    engine = None # RipEngine, unless files are ripped by a farm
+    transfer = None # Transfer, with --scratch
+    stager = None # Stager, with --stage
+    profiler = Profiler() # enabled by --profile
+    planner = None # Planner, with --plan
+    scan_jobs = 1
+    stopped = False
+    bpf_answers = {} # width -> bpf answered during this run
+    print_lock = Lock()
+
+    @staticmethod
+    def scan_worker():
+        while True:
+            s = Worker.scan_queue.get()
+            try:
+                if s is None: # stop(), once per scan thread
+                    return
+                handle_scan(s['args'], s['f'], s['preset'])
+            except KeyboardInterrupt:
+                # Its HandbrakeCLI received CTRL+C: it stays queued, for --restore
+                Worker.abort()
+            except Exception:
+                sys.stderr.write(s['f'] + '\n')
+                traceback.print_exc(file=sys.stderr)
+                if not (s['args'].summary or s['args'].plan):
+                    Worker.released(s['f'])
+                    Worker.journal.record(s['f'], 'failed')
+            finally:
+                Worker.scan_queue.task_done()
 
     @staticmethod
     def q_worker():
-        while not Worker.finished:
+        while True:
+            q = Worker.questions_queue.get()
             try:
-                q = Worker.questions_queue.get(True, 3)
-                handle_ask(q['args'], q['f'], q['dest'], q['hop'], q['preset'])
+                if q is None:
+                    return
+                Worker.profiler.end('questions', q['f'])
+                with Worker.profiler.timer('ask'):
+                        handle_ask(q['args'], q['f'], q['dest'], q['hop'], q['preset'], q['answers'], q['questions'], q['metrics'])
+            finally:
                 Worker.questions_queue.task_done()
-            except Empty:
-                pass
 
     @staticmethod
-    def rip_worker():
-        while not Worker.finished:
+    def started(task, worker=None):
+        """Bookkeeping of a rip which is starting, locally or on a remote worker"""
+        task.started = time.time()
+        Worker.profiler.end('rip_queue', task)
+        Worker.profiler.begin(getphase(task), task)
+        Worker.metrics.start(task.metrics)
+        # Replaces the handler of a former lease of a requeued task
+        task.progress_handlers[1:] = [Worker.metrics.progress(task.metrics)]
+        task.worker = worker
+        Worker.journal.record(task.filepath, 'ripping', output=task.args['output'], worker=worker)
+
+    @staticmethod
+    def requeued(task):
+        """Bookkeeping of a rip lost by a remote worker, before it is queued again"""
+        Worker.profiler.end(getphase(task), task)
+        Worker.profiler.count('requeued')
+        Worker.profiler.begin('rip_queue', task)
+        Worker.metrics.finish(task.metrics, 'requeued')
+        Worker.journal.record(task.filepath, 'scanned', output=task.args['output'])
+
+    @staticmethod
+    def done(task, checksum=None):
+        """
+        Bookkeeping of a successful rip, then marks it as done in rip_queue.
+        Never raises: a file whose bookkeeping fails (checksum, segments
+        appended by mkvmerge, journal) is journaled as failed instead.
+        """
+        Worker.profiler.end(getphase(task), task)
+        Worker.profiler.count('done')
+        try:
+            with Worker.profiler.timer('bookkeeping'):
+                Worker._done(task, checksum)
+        except Exception:
+            sys.stderr.write('%s: ripped, but its bookkeeping failed\n' % task.filepath)
+            traceback.print_exc(file=sys.stderr)
             try:
-                task = Worker.rip_queue.get(True, 3)
-                try:
-                    task.rip()
-                    Worker.rip_queue.task_done()
-                    delete_from_file(task.filepath)
-                except KeyboardInterrupt:
-                    Worker.finished = True
-                    Worker.rip_queue.task_done()
-                    with Worker.rip_queue.mutex:
-                        Worker.rip_queue.queue.clear()
-                        Worker.rip_queue.all_tasks_done.notify_all()
-            except Empty:
-                pass
+                Worker.released(task.filepath)
+                Worker.journal.record(task.filepath, 'failed', output=task.args['output'])
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
+        finally:
+            Worker.rip_queue.task_done()
+
+    @staticmethod
+    def _done(task, checksum):
+        Worker.throughput.add(task)
+        Worker.metrics.finish(task.metrics, 'done')
+        # The last segment of a title appends all of them into the final file
+        if task.segments is None or task.segments.done(task):
+            output = task.segments.output if task.segments is not None else task.args['output']
+            if task.destination is not None:
+                def moved(checksum):
+                    Worker.profiler.end('transfer', task)
+                    Worker.journal.record(task.filepath, 'done', output=task.destination, checksum=checksum)
+                    Worker.registered(task.filepath, task.destination)
+                def kept(output):
+                    Worker.profiler.end('transfer', task)
+                    Worker.released(task.filepath)
+                    Worker.journal.record(task.filepath, 'failed', output=output)
+                Worker.profiler.begin('transfer', task)
+                Worker.transfer.put(output, task.destination, moved, kept)
+                return
+            if checksum is None or task.segments is not None:
+                checksum = getchecksum(output)
+            Worker.journal.record(task.filepath, 'done', output=output, checksum=checksum)
+            Worker.registered(task.filepath, output)
+
+    @staticmethod
+    def failed(task):
+        Worker.profiler.end(getphase(task), task)
+        Worker.profiler.count('failed')
+        try:
+            if task.segments is not None:
+                task.segments.failed(task)
+            Worker.metrics.finish(task.metrics, 'failed')
+            Worker.released(task.filepath)
+            Worker.journal.record(task.filepath, 'failed', output=task.args['output'])
+        finally:
+            Worker.rip_queue.task_done()
+
+    @staticmethod
+    def interrupted(task):
+        """
+        Bookkeeping of a rip stopped by CTRL+C, then marks it as done in
+        rip_queue. Its partial output is removed, and it is ripped again by --restore.
+        """
+        Worker.profiler.end(getphase(task), task)
+        Worker.profiler.count('interrupted')
+        try:
+            if task.segments is not None:
+                task.segments.failed(task)
+            if path.isfile(task.args['output']):
+                os.remove(task.args['output'])
+            Worker.metrics.finish(task.metrics, 'interrupted')
+            Worker.released(task.filepath)
+            Worker.journal.record(task.filepath, 'interrupted', output=task.args['output'])
+        finally:
+            Worker.rip_queue.task_done()
+
+    @staticmethod
+    def registered(filepath, output):
+        """Fingerprints filepath, which has been ripped, and its duplicates found meanwhile are done"""
+        for source, link in Worker.duplicates.register(filepath):
+            Worker.journal.record(source, 'done', output=output, duplicate_of=filepath)
+
+    @staticmethod
+    def released(filepath):
+        """
+        Forgets the fingerprints of filepath, which has not been ripped. Its
+        duplicates found meanwhile fail, to be ripped with --restore.
+        """
+        for source, link in Worker.duplicates.release(filepath):
+            if path.islink(link):
+                os.remove(link)
+            sys.stderr.write('%s: duplicate of %s, which failed, see --restore\n' % (source, filepath))
+            Worker.journal.record(source, 'failed', duplicate_of=filepath)
+
+    @staticmethod
+    def join(queue):
+        """Queue.join() which can be interrupted by CTRL+C"""
+        with queue.all_tasks_done:
+            while queue.unfinished_tasks:
+                queue.all_tasks_done.wait(3)
+
+    @staticmethod
+    def _drop(queue):
+        """Empty a queue, but the sentinels of stop(), and release its join()"""
+        with queue.mutex:
+            kept = [task for task in queue.queue if task is None]
+            dropped = len(queue.queue) - len(kept)
+            while queue.queue:
+                queue.queue.pop()
+            queue.queue.extend(kept)
+            queue.unfinished_tasks = max(0, queue.unfinished_tasks - dropped)
+            queue.all_tasks_done.notify_all()
 
     @staticmethod
-    def launch():
-        t_rip = Thread(target=Worker.rip_worker)
-        t_rip.start()
+    def abort():
+        """
+        Drop pending scans, questions and rips, and interrupt the running rips,
+        which the engine reaps (see interrupted()).
+        Called by handle() on CTRL+C, and by the engine for each rip whose
+        HandbrakeCLI received it.
+        """
+        Worker.finished = True
+        Worker._drop(Worker.scan_queue)
+        Worker._drop(Worker.questions_queue)
+        Worker._drop(Worker.rip_queue)
+        if Worker.engine is not None:
+            Worker.engine.cancel()
+
+    @staticmethod
+    def launch(jobs=1, scan_jobs=1):
+        """Starts the workers, jobs being 0 if files are ripped by a farm"""
+        Worker.jobs = max(1, jobs)
+        Worker.scan_jobs = max(1, scan_jobs)
+        for i in range(Worker.scan_jobs):
+            t_scan = Thread(target=Worker.scan_worker)
+            t_scan.start()
         t_q = Thread(target=Worker.q_worker)
         t_q.start()
+        if jobs > 0:
+            Worker.engine = RipEngine(Worker, jobs)
+            Worker.engine.start()
 
     @staticmethod
     def setfinished(b):
         Worker.finished = b
+        if b:
+            Worker.stop()
+
+    @staticmethod
+    def stop():
+        """Ends the threads started by launch(), once their current task is done"""
+        if Worker.stopped:
+            return
+        Worker.stopped = True
+        for i in range(Worker.scan_jobs):
+            Worker.scan_queue.put(None)
+        Worker.questions_queue.put(None)
+        if Worker.engine is not None:
+            Worker.engine.stop()
+        if Worker.transfer is not None:
+            Worker.transfer.stop()
+        if Worker.stager is not None:
+            Worker.stager.stop()
 
 class Q:
     """
@@ -141,6 +415,8 @@ class Answers:
     def __init__(self):
         self.subtitles_path = []
         self.bpf = None
+        self.complexity = None # bpf factor measured by ComplexityProbe
+        self.crf_bitrate = None # kbps of the constant quality samples
 
 def loadpreset():
     preset = Preset()
@@ -155,98 +431,297 @@ def loadpreset():
         preset.addpreference(Preference(child.get('key'), child.get('required', False), child.get('multivalued', False), child.get('separator'), child.get('value')))
     return preset
 
-def get_restore_filepath():
-    home = expanduser("~")
-    filedir = path.join(home, '.config', 'rippy')
-    try:
-        makedirs(filedir)
-    except OSError as exc:
-        if exc.errno == errno.EEXIST and path.isdir(filedir):
-            pass
-        else: raise
-    return path.join(filedir, 'last.state')
-
-def save_file_list(filelist):
-    filepath = get_restore_filepath()
-    with open(filepath, 'w') as fhandler:
-        for onefile in filelist:
-            fhandler.write(onefile + '\n')
-
-def delete_from_file(deletefile):
-    filepath = get_restore_filepath()
-    filepathtmp = filepath + '.tmp'
-    if path.isfile(filepath):
-        with open(filepathtmp, 'w') as writehandler:
-            with open(filepath, 'r') as readhandler:
-                for line in readhandler:
-                    if line != deletefile:
-                        writehandler.write(line)
-    remove(filepath)
-    rename(filepathtmp, filepath)
-
-def get_restored_files():
-    filepath = get_restore_filepath()
-    if path.isfile(filepath):
-        with open(filepath, 'r') as readhandler:
-            for line in readhandler:
-                yield line.strip()
-
 def handle(args, preset):
     """
-    Called by main
+    Called by main, returns the exit status
     """
-    Worker.launch()
+    Worker.profiler = Profiler(args.profile or args.profile_dump is not None, args.profile_dump)
+    Worker.profiler.start()
+    Worker.scan_cache = ScanCache(read=not (args.nocache or args.rescan), write=not args.nocache)
+    Worker.scan_cache.evict()
+    Worker.governor = getgovernor(args)
+    Worker.metrics = MetricsExporter(textfile=args.textfile, governor=Worker.governor)
+    Worker.journal = Journal()
+    Worker.duplicates = DuplicateIndex()
+    Worker.rules = Rules.load(args.rules)
+    Worker.costs = CostModel()
+    Worker.probe = ComplexityProbe(preset, not args.nocache)
+    Worker.probe.evict()
+    Worker.rip_queue.policy = args.schedule
+    Worker.governor.start()
+    if args.scratch is not None:
+        if not path.isdir(args.scratch):
+            os.makedirs(args.scratch)
+        Worker.transfer = Transfer(args.transfer_jobs)
+        Worker.transfer.start()
+    coordinator = None
+    if args.plan:
+        Worker.planner = Planner()
+        Worker.launch(0, args.scan_jobs) # Nothing is ripped
+    elif args.coordinator is not None:
+        coordinator = Coordinator(farm.getaddress(args.coordinator), Worker, args.farm_secret)
+        coordinator.start()
+        Worker.launch(0, args.scan_jobs)
+    else:
+        if args.stage is not None:
+            Worker.stager = Stager(Worker.rip_queue, args.stage, int(args.stage_size * 1024 ** 3), args.stage_ahead)
+            Worker.stager.start()
+        Worker.launch(args.jobs, args.scan_jobs)
     files = []
     if args.restore:
-        files = get_restored_files()
+        files = Worker.journal.unfinished()
+    elif not (args.summary or args.plan):
+        files = args.files
+        Worker.journal.reset()
     else:
         files = args.files
-        save_file_list(files)
 
-    for f in scan(files):
-        hp = HandbrakeProcess(f)
-        hp.scan()
-        hop = HandbrakeOutputParser(hp.buf)
-        hop.parse()
-        try:
-            width = hop.video().width
-            height = hop.video().height
-            bitrate = getbitrate(width, height, hop.fps)
-        except:
-            sys.stderr.write(f+'\n')
-            traceback.print_exc(file=sys.stderr)
-        if args.summary:
-            audio_streams, subtitle_streams = get_prefered(hop, preset)
-            hop.summary(audio_streams, subtitle_streams)
-        else:
-            Worker.questions_queue.put({'f': f, 'dest': args.dest, 'hop': hop, 'preset': preset, 'args': args})
+    status = 0
     try:
-        Worker.rip_queue.join()
+        walker = LibraryWalker.default(args.include, args.exclude)
+        for f in Worker.profiler.iterate('walk', scan(files, walker)):
+            enqueue(args, f, preset)
+        if args.watch is not None:
+            watch(args, preset) # Until CTRL+C
+        # Each stage only feeds the next one, so joining them in order is enough
+        Worker.join(Worker.scan_queue)
+        Worker.join(Worker.questions_queue)
+        Worker.join(Worker.rip_queue)
+        if Worker.transfer is not None:
+            Worker.join(Worker.transfer.queue)
         Worker.setfinished(True)
+        Worker.throughput.report(Worker.jobs)
+        Worker.profiler.report()
+        if Worker.planner is not None:
+            Worker.planner.report(args.jobs, args.plan_json)
+        Worker.journal.close()
     except KeyboardInterrupt:
+        Worker.abort()
+        Worker.setfinished(True)
         print("\nKeyboard interrupt received. Aborting.")
+        status = 130
+    Worker.governor.stop()
+    if coordinator is not None:
+        coordinator.stop()
+    return status
+
+
+def enqueue(args, f, preset):
+    """Sends a source found by the walk, or by the watcher, to the scan workers"""
+    if not (args.summary or args.restore or args.force) and isripped(args.dest, f):
+        print('%s: already ripped, skipped' % f)
+        return
+    if not (args.summary or args.plan):
+        Worker.journal.record(f, 'queued')
+    Worker.scan_queue.put({'f': f, 'preset': preset, 'args': args})
+
+def watch(args, preset):
+    """
+    Called by handle with --watch: sources copied into the watched folders are
+    scanned and ripped as soon as their copy is over, until CTRL+C or SIGTERM
+    """
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, terminate)
+    def found(f):
+        with Worker.print_lock:
+            print('%s: copy settled, queued' % f)
+        enqueue(args, f, preset)
+    Watcher(args.watch, found, args.settle, args.poll_interval, args.include, args.exclude).run()
+
+def handle_worker(args, preset):
+    """
+    Called by main with --worker, the preset being the one of the coordinator
+    """
+    governor = getgovernor(args)
+    governor.start()
+    worker = FarmWorker(farm.getaddress(args.worker), args.farm_secret, args.jobs, governor)
+    try:
+        worker.run()
+    finally:
+        governor.stop()
+    if worker.error is not None:
+        sys.stderr.write('%s: %s\n' % (args.worker, worker.error))
+        return 1
+    return 0
+
+def getphase(task):
+    """Profiler phase of a running task"""
+    return 'remux' if task.mode == 'remux' else 'encode'
+
+def getgovernor(args):
+    """Governor of the thresholds given on the command line"""
+    return Governor(args.max_load, args.min_memory, args.min_free, args.dest)
+
+def handle_scan(args, f, preset):
+    """
+    Scans one file, then prints its summary or sends it to the questions queue.
+    Called by the scan workers, several files can be scanned simultaneously.
+    """
+    metrics = JobMetrics(f)
+    start = time.time()
+    with Worker.profiler.timer('cache'):
+        hop = Worker.scan_cache.get(f)
+    if hop is None:
+        if not args.nomkvprobe and path.isfile(f) and f.lower().endswith('.mkv'):
+            try:
+                with Worker.profiler.timer('mkvprobe'):
+                    hop = mkvprobe.probe(f)
+                Worker.profiler.count('mkvprobe')
+            except (mkvprobe.MkvError, IOError, OSError) as e:
+                sys.stderr.write('%s: %s, scanned by HandbrakeCLI\n' % (f, e))
+        if hop is None:
+            hp = HandbrakeProcess(f)
+            hop = HandbrakeOutputParser()
+            parsing = Stopwatch()
+            scan_start = getmonotonic()
+            hp.scan(hop, parsing.wrap(hop.feed))
+            parsing.wrap(hop.close)()
+            Worker.profiler.add('scan', getmonotonic() - scan_start - parsing.elapsed)
+            Worker.profiler.add('parse', parsing.elapsed)
+            Worker.profiler.count('hbscan')
+        Worker.scan_cache.put(f, hop)
+        metrics.scanned(time.time() - start)
+    else:
+        Worker.profiler.count('cached')
+        metrics.scanned(time.time() - start, True)
+    try:
+        width = hop.video().width
+        height = hop.video().height
+        bitrate = getbitrate(width, height, hop.fps)
+    except:
+        sys.stderr.write(f+'\n')
+        traceback.print_exc(file=sys.stderr)
+    if args.summary:
+        audio_streams, subtitle_streams = get_prefered(hop, preset)
+        with Worker.print_lock:
+            hop.summary(audio_streams, subtitle_streams)
+    elif args.plan:
+        handle_plan(args, f, hop, preset)
+    elif not Worker.finished:
+        Worker.journal.record(f, 'scanned')
+        if args.duplicates != 'rip' and not args.sample and handle_duplicate(args, f, hop):
+            return
+        answers, questions = handle_answers(args, f, hop, preset)
+        if questions is None:
+            return
+        if args.probe and not args.sample:
+            answers.complexity = Worker.probe.rate(f, hop)
+        if args.singlepass and not args.sample:
+            answers.crf_bitrate = Worker.probe.measure(f, hop)
+        if len(questions) == 0: # Nothing to ask, straight to the rip queue
+            handle_rip(args, f, args.dest, hop, preset, answers, metrics)
+        else:
+            Worker.profiler.begin('questions', f)
+            Worker.questions_queue.put({'f': f, 'dest': args.dest, 'hop': hop, 'preset': preset, 'args': args,
+                                        'answers': answers, 'questions': questions, 'metrics': metrics})
 
+def handle_plan(args, f, hop, preset):
+    """
+    Estimates the output size and the rip time of a scanned file, for the
+    --plan report. Answers come from the rules file and the bpf model only,
+    files they don't cover are reported without a size.
+    """
+    video = hop.video()
+    if video is None:
+        sys.stderr.write('%s: no title found, not planned\n' % f)
+        return
+    bpf = Worker.rules.getbpf(video.width, False)
+    if bpf is None and getbpf(video.width, video.height) is None:
+        bpf = Worker.rules.getbpf(video.width)
+        if bpf is None:
+            Worker.planner.add(f, getnewfilepath(args.dest, f), hop.duration, int(video.width), int(video.height),
+                               'unknown', None, 0, None)
+            return
+    audio_streams, subtitle_streams = get_prefered(hop, preset)
+    audio = sum(int(a.bitrate) for a in audio_streams.values() if a.bitrate) / 1000.0
+    bitrate = getbitrate(video.width, video.height, video.fps, bpf)
+    seconds = None
+    if not args.noremux and canremux(video, bitrate):
+        mode = 'remux'
+        bitrate = video.bitrate
+    else:
+        mode = 'one-pass' if args.singlepass else 'two-pass'
+        seconds = Worker.costs.estimate(video.width, video.height, video.fps, hop.duration)
+    Worker.planner.add(f, getnewfilepath(args.dest, f), hop.duration, int(video.width), int(video.height),
+                       mode, bitrate, audio, seconds)
 
-def handle_ask(args, f, dest, hop, preset):
+def handle_duplicate(args, f, hop):
     """
-    Handles question asking and answering.
-    All questions are queued and asked one at a time.
+    Returns True if f has the same content as a source already ripped (or being
+    ripped). With --duplicates link, its ripped file becomes a link to the existing one.
+    """
+    newfilepath = getnewfilepath(args.dest, f)
+    original = Worker.duplicates.check(f, hop, newfilepath)
+    if original is None:
+        return False
+    with Worker.print_lock:
+        if args.duplicates == 'link' and newfilepath != original['output'] and not path.lexists(newfilepath):
+            if not path.isdir(path.dirname(newfilepath)):
+                os.makedirs(path.dirname(newfilepath))
+            os.symlink(original['output'], newfilepath)
+            print('%s: duplicate of %s, linked to %s' % (f, original['source'], original['output']))
+        else:
+            print('%s: duplicate of %s, skipped' % (f, original['source']))
+    if 'waiting' not in original: # Else done once the original is ripped, see Worker.registered
+        Worker.journal.record(f, 'done', output=original['output'], duplicate_of=original['source'])
+    return True
+
+def handle_answers(args, f, hop, preset):
+    """
+    Answers what can be answered without asking the user, from the rules file
+    or from former answers.
+    Returns the answers and the list of questions still to ask ('srt', 'bpf'),
+    or None for questions if the file can't be ripped unattended.
     """
     answers = Answers()
+    questions = []
     ''' subtitles '''
     prefered_sub = preset.getpreference('subtitle-language')
     prefered_sub_present = prefered_sub[0] in [sub.language for sub in hop.subtitle()]
     if not prefered_sub_present:
+        answers.subtitles_path = Worker.rules.getsrt(f)
+        if len(answers.subtitles_path) == 0 and not args.unattended:
+            questions.append('srt')
+    ''' bpf '''
+    width = hop.video().width
+    answers.bpf = Worker.rules.getbpf(width, False)
+    if answers.bpf is None and getbpf(width, hop.video().height) is None:
+        answers.bpf = Worker.rules.getbpf(width)
+        if answers.bpf is None:
+            answers.bpf = Worker.bpf_answers.get(width)
+        if answers.bpf is None:
+            if args.unattended:
+                sys.stderr.write('%s: bits*(pixels/frame) unknown for width %s, skipped\n' % (f, width))
+                Worker.released(f)
+                Worker.journal.record(f, 'failed', reason='bpf')
+                return answers, None
+            questions.append('bpf')
+    return answers, questions
+
+def handle_ask(args, f, dest, hop, preset, answers, questions, metrics=None):
+    """
+    Handles question asking and answering.
+    All questions are queued and asked one at a time, files which need no
+    answer being ripped meanwhile. A bpf answer is reused for every file of
+    the same width.
+    """
+    if 'srt' in questions:
+        Ask._print('%s: %s subtitles missing' % (f, preset.getpreference('subtitle-language')[0]))
         a = Ask()
         answer = a.ask(Q.ask_srt_yn)
         while answer:
             answers.subtitles_path.append(answer)
             answer = a.ask(Q.ask_srt_yn_bis)
-    ''' bpf '''
-    if getbpf(hop.video().width) is None:
-        a = Ask()
-        answers.bpf = a.ask(Q.ask_bpf)
-    handle_rip(args, f, dest, hop, preset, answers)
+    if 'bpf' in questions:
+        width = hop.video().width
+        answers.bpf = Worker.bpf_answers.get(width) # Answered while this file was queued
+        if answers.bpf is None:
+            Ask._print('%s: width %s' % (f, width))
+            a = Ask()
+            answers.bpf = a.ask(Q.ask_bpf)
+            Worker.bpf_answers[width] = answers.bpf
+    handle_rip(args, f, dest, hop, preset, answers, metrics)
 
 def getnewfilepath(dest, filepath):
     """
@@ -297,48 +772,99 @@ def get_prefered(hop, preset):
     return audio_streams, subtitle_streams
   
 
-def handle_rip(args, filepath, dest, hop, preset, answers=None):
+def handle_rip(args, filepath, dest, hop, preset, answers=None, metrics=None):
     """
     Handles ripping with HandbrakeCLI with the help of a queue.
     """
     bpf = answers.bpf if answers is not None else None
-    proc = HandbrakeProcess(filepath)
+    video = hop.video()
     audio_streams, subtitle_streams = get_prefered(hop, preset)
     
-    bitrate = getbitrate(hop.video().width, hop.video().height, hop.video().fps, bpf)
+    bitrate = getbitrate(video.width, video.height, video.fps, bpf,
+                         answers.complexity if answers is not None else None)
+    # Remuxes need mkvmerge on the node which rips
+    if not (args.noremux or args.sample) and Worker.engine is not None and canremux(video, bitrate):
+        proc = RemuxProcess(filepath)
+        with Worker.print_lock:
+            print('%s: %s (%s) at %d kbps, target %d kbps, remuxed' % (filepath, video.codec, video.profile, video.bitrate, bitrate))
+    else:
+        proc = HandbrakeProcess(filepath)
     proc.setaudio([audio.position for audio in audio_streams.values()])
     proc.setsubtitle([sub.position for sub in subtitle_streams])
     if answers is not None:
         proc.setsrtfile(answers.subtitles_path)
-    proc.setoutput(getnewfilepath(dest, filepath))
+    newfilepath = getnewfilepath(dest, filepath)
+    if Worker.transfer is not None and Worker.engine is not None:
+        # Ripped locally, then moved to newfilepath by Worker.transfer
+        proc.setoutput(path.join(args.scratch, path.basename(newfilepath)))
+        proc.destination = newfilepath
+    else:
+        proc.setoutput(newfilepath)
     proc.setbitrate(bitrate)
     proc.settitle(hop.title)
+    proc.playlist = hop.playlist
     # Sample generation if necessary
     if args.sample:
         proc.setoption('start-at', 'duration:%d' % args.startfrom)
-        proc.setoption('stop-at', 'duration:%d' % (args.startfrom + 30))
+        proc.setoption('stop-at', 'duration:30') # relative to start-at
     for k, v in preset.getoptions():
         proc.setoption(k, v)
-    Worker.rip_queue.put(proc)
-
-
-def scan(files):
+    predicted = None
+    if args.singlepass and proc.mode != 'remux':
+        predicted = setsinglepass(proc, bitrate, answers.crf_bitrate if answers is not None else None)
+        predicted += sum(int(a.bitrate) for a in audio_streams.values() if a.bitrate) / 1000.0
+    elif proc.mode is None:
+        proc.mode = 'two-pass' if proc.args.get('two-pass') is not None else 'one-pass'
+    # Share cores between concurrent rips
+    if Worker.jobs > 1:
+        proc.setencopt('threads', getthreads(Worker.jobs))
+    duration = 30 if args.sample else hop.duration
+    proc.setframes(duration, hop.fps)
+    procs = [proc]
+    if args.segments > 1 and not args.sample and duration and proc.mode != 'remux':
+        procs = segments.split(proc, duration, hop.fps, args.segments)
+    if metrics is None:
+        metrics = JobMetrics(filepath)
+    for p in procs:
+        p.metrics = metrics if len(procs) == 1 else copy(metrics)
+        pduration = p.frames / float(hop.fps) if p.frames else duration
+        p.priority = Worker.rules.getpriority(filepath)
+        p.cost = Worker.costs.cost(video.width, video.height, video.fps, pduration) if p.mode != 'remux' else 0
+        p.metrics.queued(p, pduration, video, Worker.costs.estimate(video.width, video.height, video.fps, pduration), predicted)
+        Worker.profiler.begin('rip_queue', p)
+        Worker.rip_queue.put(p)
+
+def setsinglepass(proc, bitrate, crf_bitrate):
+    """
+    Rips in one pass: at constant quality if the samples say it fits in bitrate,
+    else at bitrate. Returns the predicted video bitrate.
+    """
+    proc.unsetoption('two-pass')
+    proc.unsetoption('turbo')
+    if crf_bitrate is not None and crf_bitrate <= bitrate:
+        proc.unsetoption('vb')
+        proc.setoption('quality', ComplexityProbe.quality)
+        proc.mode = 'crf'
+        return crf_bitrate
+    proc.mode = 'one-pass'
+    return bitrate
+
+
+def scan(files, walker=None):
     """
     Yields all files to be ripped !
     """
-    for f in files:
-        absfile = path.abspath(f)
-        if path.isdir(absfile):
-            for root, dirs, files in walk(absfile):
-                for name in files:
-                    if '.' in name and name.rsplit('.', 1)[1].lower() in ['mkv']:
-                        yield path.join(root, name)
-                if 'BDMV' in (adir.upper() for adir in dirs): # BluRay folder
-                    yield(root)
-                if 'VIDEO_TS.BUP' in (afile.upper() for afile in files): # DVD folder
-                    yield(root)
-        else:
-            yield absfile
+    if walker is None:
+        walker = LibraryWalker()
+    for f in walker.walk(files):
+        yield f
+
+def isripped(dest, filepath):
+    """
+    True if the file ripped from filepath exists and is newer than its source
+    """
+    newfilepath = getnewfilepath(dest, filepath)
+    return path.isfile(newfilepath) and path.getmtime(newfilepath) >= path.getmtime(getreference(filepath))
 
 def main():
     parser = ArgumentParser(description="Rippy")
@@ -348,12 +874,64 @@ def main():
     parser.add_argument("files", nargs='*', help='List of files or folders that will be ripped recursively')
     parser.add_argument("-r", "--restore", action='store_true', dest='restore', help='Will rip files that have not been ripped the last time')
     parser.add_argument("--summary", action='store_true', dest='summary', help='Print a summary the operations, then exits')
+    parser.add_argument("--plan", action='store_true', dest='plan', help='Rip nothing, but print the size and the rip time expected for every title, and the disk space needed by each destination')
+    parser.add_argument("--plan-json", dest='plan_json', metavar='FILE', help='Also write the plan as JSON to FILE, - for stdout only (implies --plan)')
+    parser.add_argument("-j", "--jobs", dest='jobs', default=1, type=int, help='Number of files ripped simultaneously, cores are split between them (default: 1)')
+    parser.add_argument("--schedule", dest='schedule', default='fifo', choices=ScheduledQueue.policies, help='Order of the rips: scan order, longest first (shortest batch), shortest first, or priorities of the rules file (default: fifo)')
+    parser.add_argument("--probe", action='store_true', dest='probe', help='Adapt the bitrate of each source to its complexity, measured by a few short encodes')
+    parser.add_argument("--single-pass", action='store_true', dest='singlepass', help='Rip in one pass, at constant quality when short samples show it stays under the computed bitrate')
+    parser.add_argument("--no-remux", action='store_true', dest='noremux', help='Encode sources whose h264 video is already under the computed bitrate, instead of copying it')
+    parser.add_argument("--segments", dest='segments', default=1, type=int, help='Split each title in this number of parts ripped simultaneously, then appended by mkvmerge (default: 1)')
+    parser.add_argument("--metrics-textfile", dest='textfile', help='node-exporter textfile where live metrics of running rips are written')
+    parser.add_argument("--profile", action='store_true', dest='profile', help='Time each phase of every file (walk, scan, queues, encode, bookkeeping) and print a breakdown at exit')
+    parser.add_argument("--profile-dump", dest='profile_dump', metavar='FILE', help='Also run rippy under cProfile and write its statistics to FILE (implies --profile)')
+    parser.add_argument("--include", dest='include', action='append', metavar='PATTERN', help='Only rip sources matching this pattern (path or name, can be repeated)')
+    parser.add_argument("--exclude", dest='exclude', action='append', metavar='PATTERN', help='Skip sources and folders matching this pattern (path or name, can be repeated)')
+    parser.add_argument("--force", action='store_true', dest='force', help='Rip sources even if their ripped file exists and is newer')
+    parser.add_argument("--duplicates", dest='duplicates', default='skip', choices=['skip', 'link', 'rip'], help='What to do with sources whose content has already been ripped: report and skip them, link their ripped file to the existing one, or rip them anyway (default: skip)')
+    parser.add_argument("--rules", dest='rules', help='Rules file answering questions up front (default: ~/.config/rippy/rules.xml)')
+    parser.add_argument("--unattended", action='store_true', dest='unattended', help='Never ask anything: no subtitles are added, files whose bpf is unknown are skipped')
+    parser.add_argument("--no-cache", action='store_true', dest='nocache', help='Neither read nor store scans in ~/.config/rippy/scans')
+    parser.add_argument("--rescan", action='store_true', dest='rescan', help='Scan files again even if they are cached, and refresh the cache')
+    parser.add_argument("--no-mkv-probe", action='store_true', dest='nomkvprobe', help='Scan mkv files with HandbrakeCLI instead of reading their header')
+    parser.add_argument("--scan-jobs", dest='scan_jobs', default=2, type=int, help='Number of files scanned simultaneously while ripping (default: 2)')
+    parser.add_argument("--scratch", dest='scratch', metavar='DIR', help='Rip into this local folder, then move finished files to the destination in the background')
+    parser.add_argument("--transfer-jobs", dest='transfer_jobs', default=1, type=int, help='Number of files moved simultaneously from the scratch folder (default: 1)')
+    parser.add_argument("--stage", dest='stage', metavar='DIR', help='Copy the sources of the next rips into this local folder while ripping')
+    parser.add_argument("--stage-size", dest='stage_size', default=50, type=float, metavar='GB', help='Size of the copies kept in the --stage folder, least recently used first removed (default: 50)')
+    parser.add_argument("--stage-ahead", dest='stage_ahead', default=2, type=int, metavar='K', help='Number of queued rips whose sources are copied in advance (default: 2)')
+    parser.add_argument("--nice", dest='nice', type=int, help='Niceness of HandBrakeCLI while ripping')
+    parser.add_argument("--ionice", dest='ionice', choices=['idle', 'best-effort'], help='I/O scheduling class of HandBrakeCLI while ripping')
+    parser.add_argument("--max-load", dest='max_load', type=float, metavar='LOAD', help='Pause rips while other processes use more than LOAD (0 to 1) of the CPU time of all cores, the rips being left out')
+    parser.add_argument("--min-memory", dest='min_memory', type=int, metavar='MB', help='Pause rips while less than MB of memory is available')
+    parser.add_argument("--min-free", dest='min_free', type=int, metavar='MB', help='Pause rips while less than MB are free in the destination folder')
+    parser.add_argument("--watch", dest='watch', action='append', metavar='DIR', help='Keep running, and rip the sources copied into this folder once their copy is over (can be repeated, implies --unattended)')
+    parser.add_argument("--settle", dest='settle', default=10, type=int, metavar='SECONDS', help='Time the size of a watched source must stay the same before it is ripped (default: 10)')
+    parser.add_argument("--poll-interval", dest='poll_interval', default=10, type=int, metavar='SECONDS', help='Time between two listings of the watched folders where inotify is unavailable (default: 10)')
+    parser.add_argument("--coordinator", dest='coordinator', metavar='[HOST:]PORT', help='Do not rip, but serve the files to rip to workers started with --worker (HOST defaults to localhost)')
+    parser.add_argument("--worker", dest='worker', metavar='HOST:PORT', help='Rip files served by a coordinator, -j of them simultaneously')
+    parser.add_argument("--farm-secret", dest='farm_secret', default=os.environ.get('RIPPY_FARM_SECRET'), metavar='SECRET', help='Secret shared by the coordinator and its workers (default: $RIPPY_FARM_SECRET)')
+    parser.add_argument("--handbrakecli", dest='handbrakecli', help='Path of HandBrakeCLI (default: %s)' % HandbrakeProcess.handbrakecli)
+    parser.add_argument("--mkvmerge", dest='mkvmerge', help='Path of mkvmerge, which appends segments and remuxes (default: %s)' % segments.SegmentGroup.mkvmerge)
     parser.set_defaults(func=handle)
     args = parser.parse_args()
-    if not args.restore and len(args.files) == 0:
+    if args.plan_json is not None:
+        args.plan = True
+    if args.watch is not None:
+        args.unattended = True # Nobody to answer
+    if (args.coordinator is not None or args.worker is not None) and not args.farm_secret:
+        parser.error('--coordinator and --worker need --farm-secret')
+    if args.worker is not None:
+        args.func = handle_worker
+    elif not args.restore and len(args.files) == 0 and args.watch is None:
         parser.error('At least -r option or one file must be specified')
+    if args.handbrakecli is not None:
+        HandbrakeProcess.setbinary(args.handbrakecli)
+    if args.mkvmerge is not None:
+        segments.SegmentGroup.setbinary(args.mkvmerge)
+    HandbrakeProcess.setniceness(args.nice, {'idle': 3, 'best-effort': 2, None: None}[args.ionice])
     preset = loadpreset()
-    args.func(args, preset)
+    sys.exit(args.func(args, preset))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,77 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import re, glob
+import xml.etree.ElementTree as ET
+from os import path
+from fnmatch import fnmatch
+from tools import getconfigdir
+
+def escape(pathname):
+    """pathname matching itself as a glob pattern ([, * and ? being between brackets)"""
+    return re.sub(r'([*?[])', r'[\1]', pathname)
+
+class Rules:
+    """
+    Answers given up front in a rules file (see presets/rules.example.xml),
+    so that files can be ripped without asking anything.
+    """
+
+    # Where subtitles of /a/Movie.mkv are looked for when no <srt> rule matches
+    default_srt = ['{dir}/{name}.srt', '{dir}/{name}.*.srt']
+
+    def __init__(self):
+        self.bpf = {} # width -> bpf, None being the default
+        self.srt = [] # (pattern, templates)
+        self.priority = [] # (pattern, priority)
+
+    @staticmethod
+    def load(filepath=None):
+        """Loads filepath, or ~/.config/rippy/rules.xml if it exists"""
+        rules = Rules()
+        if filepath is None:
+            filepath = path.join(getconfigdir(), 'rules.xml')
+            if not path.isfile(filepath):
+                return rules
+        root = ET.parse(filepath).getroot()
+        for child in root.findall('bpf'):
+            width = child.get('width')
+            rules.bpf[int(width) if width not in (None, '*') else None] = float(child.get('value'))
+        for child in root.findall('srt'):
+            rules.srt.append((child.get('pattern', '*'), [child.get('path')]))
+        for child in root.findall('priority'):
+            rules.priority.append((child.get('pattern', '*'), int(child.get('value'))))
+        return rules
+
+    def getbpf(self, width, fallback=True):
+        """bpf for this width, or the default one if fallback, or None"""
+        if fallback:
+            return self.bpf.get(int(width), self.bpf.get(None))
+        return self.bpf.get(int(width))
+
+    def getpriority(self, filepath):
+        """Priority of the first matching rule, 0 by default"""
+        filename = path.basename(filepath)
+        for pattern, priority in self.priority:
+            if fnmatch(filepath, pattern) or fnmatch(filename, pattern):
+                return priority
+        return 0
+
+    def getsrt(self, filepath):
+        """Existing subtitles files for filepath"""
+        dirname, filename = path.split(filepath)
+        name = path.splitext(filename)[0]
+        if path.isdir(filepath): # BluRay or DVD folder, subtitles are next to it
+            dirname, name = path.split(filepath.rstrip('/'))
+        templates = Rules.default_srt
+        for pattern, paths in self.srt:
+            if fnmatch(filepath, pattern) or fnmatch(filename, pattern):
+                templates = paths
+                break
+        found = []
+        values = dict(dir=escape(dirname), name=escape(name), filename=escape(filename))
+        for template in templates:
+            found.extend(sorted(glob.glob(template.format(**values))))
+        return found
@@ -0,0 +1,123 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import json, heapq
+from os import path
+from Queue import Queue
+from tools import getconfigdir
+
+class CostModel:
+    """
+    Estimates how long a rip takes from the pixels it encodes
+    (duration x width x height x fps) and the speed, in pixels per second,
+    of the former rips of the same width found in history.jsonl.
+    """
+
+    def __init__(self, history=None):
+        self.history = history if history is not None else path.join(getconfigdir(), 'history.jsonl')
+        self.speeds = {} # width -> pixels/s
+        self.default = None # median speed of all widths
+        self.load()
+
+    @staticmethod
+    def _median(values):
+        values = sorted(values)
+        return values[len(values) // 2]
+
+    def load(self):
+        speeds = {}
+        if path.isfile(self.history):
+            with open(self.history, 'r') as readhandler:
+                for line in readhandler:
+                    try:
+                        job = json.loads(line)
+                    except ValueError:
+                        continue
+                    if job.get('status') != 'done' or not job.get('width') or not job.get('passes') \
+                            or job.get('mode') == 'remux':
+                        continue
+                    pixels = CostModel.pixels(job['width'], job['height'], job['source_fps'], job['duration'])
+                    if pixels and sum(job['passes']) > 0:
+                        speeds.setdefault(int(job['width']), []).append(pixels / sum(job['passes']))
+        self.speeds = dict((width, CostModel._median(s)) for width, s in speeds.items())
+        if self.speeds:
+            self.default = CostModel._median([v for s in speeds.values() for v in s])
+
+    @staticmethod
+    def pixels(width, height, fps, duration):
+        if None in (width, height, fps, duration):
+            return None
+        return float(width) * float(height) * float(fps) * float(duration)
+
+    def getspeed(self, width):
+        """Pixels/s measured for this width, or for every width, or None"""
+        if width is not None and int(width) in self.speeds:
+            return self.speeds[int(width)]
+        return self.default
+
+    def estimate(self, width, height, fps, duration):
+        """Seconds needed to rip, or None without history"""
+        pixels = CostModel.pixels(width, height, fps, duration)
+        speed = self.getspeed(width)
+        if pixels is None or speed is None:
+            return None
+        return pixels / speed
+
+    def cost(self, width, height, fps, duration):
+        """Estimated seconds, or pixels when nothing is known about the speed, to compare rips"""
+        pixels = CostModel.pixels(width, height, fps, duration)
+        if pixels is None:
+            return 0
+        speed = self.getspeed(width)
+        return pixels / speed if speed is not None else pixels
+
+class ScheduledQueue(Queue):
+    """
+    A Queue of HandbrakeProcess objects, got in the order of a policy:
+    fifo: in scan order
+    lpt: longest first, which minimises the time the last rip ends
+    spt: shortest first, for fast feedback
+    priority: highest priority first (given by the rules file), then fifo
+    Priorities always come first, policies only order rips of the same priority.
+    """
+
+    policies = ['fifo', 'lpt', 'spt', 'priority']
+
+    def __init__(self, policy='fifo'):
+        Queue.__init__(self)
+        self.policy = policy
+        self.listeners = [] # called once a task is queued
+
+    def put(self, task, block=True, timeout=None):
+        Queue.put(self, task, block, timeout)
+        for listener in self.listeners:
+            listener()
+
+    def peek(self, count):
+        """The next count tasks, left in the queue"""
+        with self.mutex:
+            return [entry[2] for entry in heapq.nsmallest(count, self.queue)]
+
+    def _init(self, maxsize):
+        self.queue = []
+        self.seq = 0
+
+    def _qsize(self, len=len):
+        return len(self.queue)
+
+    def _put(self, task):
+        self.seq += 1
+        heapq.heappush(self.queue, (self.key(task), self.seq, task))
+
+    def _get(self):
+        return heapq.heappop(self.queue)[2]
+
+    def key(self, task):
+        priority = -(task.priority or 0)
+        if self.policy == 'lpt':
+            return (priority, -(task.cost or 0))
+        elif self.policy == 'spt':
+            return (priority, task.cost or 0)
+        return (priority,)
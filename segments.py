@@ -0,0 +1,117 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os
+from os import path
+from subprocess import Popen, PIPE
+from distutils.spawn import find_executable
+from threading import Lock
+
+class SegmentGroup:
+    """
+    The segments of one title, ripped in parallel by several HandbrakeProcess,
+    then appended into the final file by mkvmerge without re-encoding.
+    If one of them fails, the title is failed, and its parts are removed once
+    the others are over.
+    """
+
+    mkvmerge = find_executable('mkvmerge') or "/usr/bin/mkvmerge" # see --mkvmerge
+    keyint = 250 # GOP length forced on segments, boundaries are multiples of it
+
+    def __init__(self, output, count):
+        self.output = output
+        self.outputs = ['%s.part%d.mkv' % (path.splitext(output)[0], i) for i in range(count)]
+        self.remaining = count
+        self.failures = 0
+        self.lock = Lock()
+
+    @staticmethod
+    def setbinary(mkvmerge):
+        SegmentGroup.mkvmerge = mkvmerge
+
+    def done(self, proc):
+        """
+        Called when a segment has been ripped.
+        Returns True once the last one is done and the final file is written,
+        False while others are running, or if one of them failed.
+        """
+        with self.lock:
+            self.remaining -= 1
+            if self.remaining > 0:
+                return False
+            failed = self.failures > 0
+        if failed:
+            self.clean()
+            return False
+        self.concat()
+        return True
+
+    def failed(self, proc):
+        """Called when a segment failed, the title can't be appended"""
+        with self.lock:
+            self.remaining -= 1
+            self.failures += 1
+            if self.remaining > 0:
+                return
+        self.clean()
+
+    def clean(self):
+        """Removes the parts of a failed title"""
+        for o in self.outputs:
+            if path.isfile(o):
+                os.remove(o)
+
+    def concat(self):
+        """Appends the parts, which are kept if mkvmerge fails"""
+        args = [SegmentGroup.mkvmerge, '--output', self.output, self.outputs[0]]
+        for o in self.outputs[1:]:
+            args.extend(['+', o])
+        try:
+            child = Popen(args, stdout=PIPE, stderr=PIPE)
+            stdout, stderr = child.communicate()
+        except OSError as e:
+            raise Exception('%s: %s, parts kept: %s' % (SegmentGroup.mkvmerge, e, ' '.join(self.outputs)))
+        if child.returncode not in (0, 1): # 1 means warnings
+            if path.isfile(self.output):
+                os.remove(self.output)
+            raise Exception('mkvmerge exited with code %d, parts kept: %s: %s' %
+                            (child.returncode, ' '.join(self.outputs), (stdout + stderr).strip()))
+        for o in self.outputs:
+            os.remove(o)
+
+def getboundaries(duration, fps, count, keyint=SegmentGroup.keyint):
+    """
+    Splits a title in at most count ranges of frames (start, length),
+    each of them starting on a GOP boundary. The last one has no length.
+    """
+    frames = int(float(duration) * float(fps))
+    gops = frames // keyint
+    count = max(1, min(count, gops))
+    boundaries = []
+    for i in range(count):
+        start = (gops * i // count) * keyint
+        if i == count - 1:
+            boundaries.append((start, None))
+        else:
+            boundaries.append((start, (gops * (i + 1) // count) * keyint - start))
+    return boundaries
+
+def split(proc, duration, fps, count):
+    """Returns one HandbrakeProcess per segment of proc"""
+    boundaries = getboundaries(duration, fps, count)
+    group = SegmentGroup(proc.args['output'], len(boundaries))
+    procs = []
+    frames = int(float(duration) * float(fps))
+    for (start, length), output in zip(boundaries, group.outputs):
+        p = proc.copy()
+        p.segments = group
+        p.setoutput(output)
+        p.setencopt('keyint', SegmentGroup.keyint)
+        p.setoption('start-at', 'frame:%d' % start)
+        if length is not None:
+            p.setoption('stop-at', 'frame:%d' % length)
+        p.frames = length if length is not None else frames - start
+        procs.append(p)
+    return procs
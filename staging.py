@@ -0,0 +1,249 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, sys, json, time, struct, shutil, hashlib, traceback
+from os import path
+from threading import Thread, Lock, Event
+from tools import getreference
+
+class Stager:
+    """
+    Copies the sources of the next rips of a queue into a local folder while
+    the current ones are ripped, so that HandbrakeCLI reads a local disk.
+    Only the title to rip of a BluRay folder is copied: its index, playlists,
+    clip infos and the m2ts clips of its playlist.
+    Copies are kept within budget bytes, the least recently used ones being
+    removed first. A rip whose source is not staged yet reads the original.
+    """
+
+    blocksize = 8 * 1024 * 1024
+    marker = '.staged' # written once a copy is complete
+
+    def __init__(self, queue, directory, budget, ahead=2):
+        self.queue = queue
+        self.directory = directory
+        self.budget = budget
+        self.ahead = ahead
+        self.lock = Lock()
+        self.entries = {} # key -> {'source', 'input', 'stamp', 'size', 'used', 'pins'}
+        self.skipped = set() # keys of sources larger than the budget
+        self.current = None # source being copied
+        self.abandon = False # its rip started without it
+        self.event = Event()
+        self.stopped = False
+        self.load()
+
+    def load(self):
+        """Keeps the complete copies of former runs, removes the others"""
+        if not path.isdir(self.directory):
+            os.makedirs(self.directory)
+        for key in os.listdir(self.directory):
+            entrydir = path.join(self.directory, key)
+            try:
+                with open(path.join(entrydir, Stager.marker)) as fhandler:
+                    entry = json.load(fhandler)
+                entry['stamp'] = tuple(entry['stamp'])
+                entry['used'] = path.getmtime(path.join(entrydir, Stager.marker))
+                entry['pins'] = 0
+                self.entries[key] = entry
+            except (IOError, OSError, ValueError, KeyError):
+                Stager._remove(entrydir)
+
+    def start(self):
+        self.queue.listeners.append(self.wake)
+        t_stager = Thread(target=self.run)
+        t_stager.daemon = True # an unfinished copy is removed at next start
+        t_stager.start()
+
+    def stop(self):
+        self.stopped = True
+        self.abandon = True
+        self.event.set()
+
+    def wake(self):
+        self.event.set()
+
+    def run(self):
+        while True:
+            self.event.wait()
+            self.event.clear()
+            for task in self.queue.peek(self.ahead):
+                if self.stopped:
+                    return
+                try:
+                    self.stage(task)
+                except Exception:
+                    sys.stderr.write('%s: staging failed, the original is ripped\n' % task.filepath)
+                    traceback.print_exc(file=sys.stderr)
+            if self.stopped:
+                return
+
+    def stage(self, task):
+        """Copies the source of task, unless it is already done"""
+        key = Stager.getkey(task.filepath)
+        stamp = Stager.getstamp(task.filepath)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry['stamp'] == stamp or key in self.skipped:
+                return
+            if entry is not None and entry['pins'] > 0:
+                return # outdated, but being ripped
+        if entry is not None:
+            self._evict(key)
+        files = Stager.getfiles(task.filepath, task.playlist)
+        size = sum(path.getsize(source) for relative, source in files)
+        if size > self.budget:
+            self.skipped.add(key)
+            return
+        self.makeroom(size)
+        tmpdir = path.join(self.directory, '.%s.tmp' % key)
+        entrydir = path.join(self.directory, key)
+        Stager._remove(tmpdir)
+        with self.lock:
+            self.current = task.filepath
+            self.abandon = False
+        try:
+            for relative, source in files:
+                if not self.copy(source, path.join(tmpdir, relative)):
+                    Stager._remove(tmpdir)
+                    return
+            entry = {'source': task.filepath, 'input': path.join(entrydir, path.basename(task.filepath.rstrip(os.sep))),
+                     'stamp': stamp, 'size': size}
+            with open(path.join(tmpdir, Stager.marker), 'w') as fhandler:
+                json.dump(entry, fhandler)
+            os.rename(tmpdir, entrydir)
+        except BaseException:
+            Stager._remove(tmpdir)
+            raise
+        finally:
+            with self.lock:
+                self.current = None
+        entry.update({'used': time.time(), 'pins': 0})
+        with self.lock:
+            self.entries[key] = entry
+
+    def copy(self, source, destination):
+        """Sequential copy, returns False if abandoned on the way"""
+        if not path.isdir(path.dirname(destination)):
+            os.makedirs(path.dirname(destination))
+        with open(source, 'rb') as fsource:
+            with open(destination, 'wb') as fdestination:
+                block = fsource.read(Stager.blocksize)
+                while block:
+                    if self.abandon:
+                        return False
+                    fdestination.write(block)
+                    block = fsource.read(Stager.blocksize)
+        return True
+
+    def makeroom(self, size):
+        """Removes the least recently used copies until size bytes fit in the budget"""
+        while True:
+            with self.lock:
+                used = sum(e['size'] for e in self.entries.values())
+                if used + size <= self.budget:
+                    return
+                unpinned = [(e['used'], k) for k, e in self.entries.items() if e['pins'] == 0]
+                if not unpinned:
+                    return # copies being ripped, the budget is exceeded until they are done
+                key = min(unpinned)[1]
+            self._evict(key)
+
+    def _evict(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+        Stager._remove(path.join(self.directory, key))
+
+    def claim(self, task):
+        """
+        Called before task is ripped: its input becomes the staged copy if it
+        is complete, else the copy in progress is abandoned.
+        """
+        key = Stager.getkey(task.filepath)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry['stamp'] == Stager.getstamp(task.filepath):
+                entry['pins'] += 1
+                entry['used'] = time.time()
+                task.setoption('input', entry['input'])
+            elif self.current == task.filepath:
+                self.abandon = True
+        self.wake() # the next ones can be staged
+
+    def release(self, task):
+        """Called once task is ripped"""
+        if task.args['input'] == task.filepath:
+            return
+        with self.lock:
+            entry = self.entries.get(Stager.getkey(task.filepath))
+            if entry is not None:
+                entry['pins'] -= 1
+                entry['used'] = time.time()
+        self.wake()
+
+    @staticmethod
+    def getkey(filepath):
+        return hashlib.sha1(path.abspath(filepath)).hexdigest()
+
+    @staticmethod
+    def getstamp(filepath):
+        st = os.stat(getreference(filepath))
+        return (st.st_size, int(st.st_mtime))
+
+    @staticmethod
+    def getfiles(filepath, playlist=None):
+        """(path relative to the staged copy, source path) of every file to copy"""
+        name = path.basename(filepath.rstrip(os.sep))
+        if not path.isdir(filepath):
+            return [(name, filepath)]
+        files = []
+        bdmv = path.join(filepath, 'BDMV')
+        clips = None
+        if path.isdir(bdmv) and playlist is not None:
+            try:
+                clips = getclips(path.join(bdmv, 'PLAYLIST', getcasedname(path.join(bdmv, 'PLAYLIST'), playlist)))
+            except (IOError, OSError, ValueError, struct.error):
+                clips = None # every clip is copied
+        for root, dirs, filenames in os.walk(filepath):
+            dirs.sort()
+            for filename in sorted(filenames):
+                if clips is not None and path.basename(root) == 'STREAM' and path.splitext(filename)[0] not in clips:
+                    continue
+                source = path.join(root, filename)
+                files.append((path.join(name, path.relpath(source, filepath)), source))
+        return files
+
+    @staticmethod
+    def _remove(p):
+        if path.isdir(p):
+            shutil.rmtree(p, True)
+
+def getcasedname(directory, filename):
+    """filename as it is written in directory, whatever its case"""
+    for f in os.listdir(directory):
+        if f.lower() == filename.lower():
+            return f
+    raise IOError('%s not found in %s' % (filename, directory))
+
+def getclips(mplsfile):
+    """Names of the clips (m2ts files without extension) played by a BluRay playlist"""
+    with open(mplsfile, 'rb') as fhandler:
+        data = fhandler.read()
+    if data[:4] != 'MPLS':
+        raise ValueError('%s is not a playlist' % mplsfile)
+    start = struct.unpack('>I', data[8:12])[0]
+    count = struct.unpack('>H', data[start + 6:start + 8])[0]
+    pos = start + 10
+    clips = []
+    for i in range(count):
+        length = struct.unpack('>H', data[pos:pos + 2])[0]
+        flags = struct.unpack('>H', data[pos + 11:pos + 13])[0]
+        if flags & 0x10: # multi-angle, the other angles are listed further
+            raise ValueError('%s has several angles' % mplsfile)
+        clip = data[pos + 2:pos + 7]
+        if clip not in clips:
+            clips.append(clip)
+        pos += 2 + length
+    return clips
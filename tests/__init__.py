@@ -0,0 +1,60 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+"""
+Tests of rippy, run from the root of the repository with
+python -m unittest discover tests
+HandbrakeCLI is replaced by benchmarks/fakehandbrake.py.
+"""
+
+import os, sys, shutil, tempfile, unittest
+from os import path
+from subprocess import Popen
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+FAKE = path.join(ROOT, 'benchmarks', 'fakehandbrake.py')
+
+class TempTestCase(unittest.TestCase):
+    """
+    A test case with a temporary folder, self.tmp, removed after each test
+    """
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='rippy-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, data=''):
+        """Writes a file in self.tmp, creating its folders, and returns its path"""
+        filepath = path.join(self.tmp, name)
+        if not path.isdir(path.dirname(filepath)):
+            os.makedirs(path.dirname(filepath))
+        with open(filepath, 'wb') as fhandler:
+            fhandler.write(data)
+        return filepath
+
+    def spawn(self, *args, **env):
+        """
+        Starts rip.py unattended, with the fake HandbrakeCLI and self.tmp/home
+        as HOME. env are the RIPPY_FAKE_* variables of fakehandbrake.py, without
+        the prefix. Returns its Popen object.
+        """
+        environ = dict(os.environ)
+        environ['HOME'] = path.join(self.tmp, 'home')
+        environ.pop('RIPPY_FARM_SECRET', None)
+        for name, value in env.items():
+            environ['RIPPY_FAKE_' + name] = str(value)
+        command = [sys.executable, path.join(ROOT, 'rip.py'), '--handbrakecli', FAKE, '--unattended',
+                   '--no-cache', '--duplicates', 'rip'] + list(args)
+        with open(os.devnull, 'w') as devnull:
+            return Popen(command, env=environ, stdout=devnull, stderr=devnull)
+
+    def rip(self, *args, **env):
+        """Runs rip.py like spawn, returns its exit status"""
+        return self.spawn(*args, **env).wait()
+
+    def getjournal(self):
+        from journal import Journal
+        return Journal(path.join(self.tmp, 'home', '.config', 'rippy', 'journal'))
@@ -0,0 +1,95 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, time, unittest
+import cPickle as pickle
+from os import path
+from tests import TempTestCase
+from cache import ScanCache
+from handbrake import HandbrakeOutputParser
+from benchmarks.synthetic import scanoutput
+
+class Changed(object):
+    """Stands for a parser pickled by another version, which can't be unpickled"""
+
+    loaded = 0
+
+    def __setstate__(self, state):
+        Changed.loaded += 1
+        raise AttributeError("'HandbrakeOutputParser' object has no attribute 'buf'")
+
+class ScanCacheTest(TempTestCase):
+
+    def setUp(self):
+        TempTestCase.setUp(self)
+        Changed.loaded = 0
+        self.cache = ScanCache(path.join(self.tmp, 'scans'))
+        os.makedirs(self.cache.directory)
+        self.source = self.write('movie.mkv', 'data')
+        self.hop = HandbrakeOutputParser(scanoutput(titles=3))
+        self.hop.parse()
+
+    def test_get(self):
+        self.assertEqual(self.cache.get(self.source), None)
+        self.cache.put(self.source, self.hop)
+        hop = self.cache.get(self.source)
+        self.assertEqual(len(hop.titles), 3)
+        self.assertEqual(hop.title, self.hop.title)
+        self.assertEqual([a.language for a in hop.audio()], [a.language for a in self.hop.audio()])
+
+    def test_changed_source(self):
+        self.cache.put(self.source, self.hop)
+        self.write('movie.mkv', 'other data')
+        self.assertEqual(self.cache.get(self.source), None)
+
+    def test_disabled(self):
+        ScanCache(self.cache.directory, write=False).put(self.source, self.hop)
+        self.assertEqual(os.listdir(self.cache.directory), [])
+        self.cache.put(self.source, self.hop)
+        self.assertEqual(ScanCache(self.cache.directory, read=False).get(self.source), None)
+
+    def test_former_version(self):
+        # Entries of the first version were a pickled (stamp, parser) tuple
+        stamp = ScanCache.getstamp(self.source)
+        with open(self.cache._entrypath(self.source), 'wb') as fhandler:
+            pickle.dump((stamp, Changed()), fhandler, pickle.HIGHEST_PROTOCOL)
+        self.assertEqual(self.cache.get(self.source), None)
+        self.assertEqual(Changed.loaded, 0)
+
+    def test_other_version(self):
+        self.cache.put(self.source, Changed())
+        version = ScanCache.version
+        ScanCache.version += 1
+        try:
+            self.assertEqual(self.cache.get(self.source), None)
+        finally:
+            ScanCache.version = version
+        self.assertEqual(Changed.loaded, 0)
+        # Stamps don't protect from a version which was not bumped
+        self.assertEqual(self.cache.get(self.source), None)
+        self.assertEqual(Changed.loaded, 1)
+
+    def test_corrupted(self):
+        self.cache.put(self.source, self.hop)
+        entry = self.cache._entrypath(self.source)
+        with open(entry, 'rb') as fhandler:
+            data = fhandler.read()
+        with open(entry, 'wb') as fhandler:
+            fhandler.write(data[:len(data) // 2])
+        self.assertEqual(self.cache.get(self.source), None)
+
+    def test_evict(self):
+        sources = [self.write('movie%d.mkv' % i, 'data') for i in range(4)]
+        for source in sources:
+            self.cache.put(source, self.hop)
+        size = os.path.getsize(self.cache._entrypath(sources[0]))
+        now = time.time()
+        for i, source in enumerate(sources):
+            os.utime(self.cache._entrypath(source), (now - i * 3600, now - i * 3600))
+        self.cache.evict(max_age=2.5 * 3600, max_size=size * 2)
+        self.assertEqual([self.cache.get(source) is not None for source in sources], [True, True, False, False])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, unittest
+from os import path
+from tests import TempTestCase
+from dedup import fingerprint, signature, DuplicateIndex
+from handbrake import HandbrakeOutputParser
+from benchmarks.synthetic import scanoutput
+
+class FingerprintTest(TempTestCase):
+
+    def bluray(self, name, sizes, playlist='MPLS0200'):
+        for i, size in enumerate(sizes):
+            self.write('%s/BDMV/STREAM/%05d.m2ts' % (name, i), '\0' * size)
+        self.write('%s/BDMV/PLAYLIST/00000.mpls' % name, playlist)
+        return path.join(self.tmp, name)
+
+    def dvd(self, name, sizes, ifo='DVDVIDEO-VTS'):
+        for i, size in enumerate(sizes):
+            self.write('%s/VIDEO_TS/VTS_01_%d.VOB' % (name, i + 1), '\0' * size)
+        self.write('%s/VIDEO_TS/VTS_01_0.IFO' % name, ifo)
+        self.write('%s/VIDEO_TS/VIDEO_TS.BUP' % name)
+        return path.join(self.tmp, name, 'VIDEO_TS')
+
+    def test_file(self):
+        a = self.write('a.mkv', 'x' * 300000)
+        b = self.write('b/a copy.mkv', 'x' * 300000)
+        c = self.write('c.mkv', 'x' * 299999 + 'y')
+        self.assertTrue(fingerprint(a).startswith('file:'))
+        self.assertEqual(fingerprint(a), fingerprint(b))
+        self.assertNotEqual(fingerprint(a), fingerprint(c))
+
+    def test_bluray(self):
+        a = self.bluray('A', [1000, 3000])
+        self.assertTrue(fingerprint(a).startswith('disc:'))
+        self.assertEqual(fingerprint(a), fingerprint(self.bluray('B', [3000, 1000])))
+        self.assertNotEqual(fingerprint(a), fingerprint(self.bluray('C', [1000, 3001])))
+
+    def test_disc_type(self):
+        # Same stream sizes, and same content of the main playlist or IFO
+        self.assertNotEqual(fingerprint(self.bluray('A', [1000], 'same')), fingerprint(self.dvd('B', [1000], 'same')))
+
+    def test_no_streams(self):
+        self.write('A/BDMV/index.bdmv')
+        self.assertEqual(fingerprint(path.join(self.tmp, 'A')), None)
+        self.write('B/VIDEO_TS/VIDEO_TS.IFO')
+        self.assertEqual(fingerprint(path.join(self.tmp, 'B', 'VIDEO_TS')), None)
+
+    def test_signature(self):
+        hop = HandbrakeOutputParser(scanoutput(chapters=4, audio=2))
+        hop.parse()
+        self.assertTrue(signature(hop).startswith('title:%d:' % hop.duration))
+        hop = HandbrakeOutputParser(scanoutput(chapters=1))
+        hop.parse()
+        self.assertEqual(signature(hop), None)
+
+class DuplicateIndexTest(TempTestCase):
+
+    def setUp(self):
+        TempTestCase.setUp(self)
+        self.hop = HandbrakeOutputParser(scanoutput(chapters=1)) # no signature, the fingerprint only
+        self.hop.parse()
+        self.a = self.write('a.mkv', 'x' * 1000)
+        self.b = self.write('b.mkv', 'x' * 1000)
+        self.filepath = path.join(self.tmp, 'fingerprints.jsonl')
+
+    def test_registered_once_ripped(self):
+        index = DuplicateIndex(self.filepath)
+        self.assertEqual(index.check(self.a, self.hop, self.write('out/a.mkv')), None)
+        self.assertFalse(path.isfile(self.filepath))
+        # Being ripped: b waits for it
+        record = index.check(self.b, self.hop, path.join(self.tmp, 'out', 'b.mkv'))
+        self.assertEqual(record['source'], self.a)
+        self.assertEqual(index.register(self.a), [(self.b, path.join(self.tmp, 'out', 'b.mkv'))])
+        self.assertTrue(path.isfile(self.filepath))
+        index = DuplicateIndex(self.filepath)
+        self.assertEqual(index.check(self.b, self.hop, path.join(self.tmp, 'out', 'b.mkv'))['source'], self.a)
+
+    def test_released(self):
+        index = DuplicateIndex(self.filepath)
+        self.assertEqual(index.check(self.a, self.hop, path.join(self.tmp, 'out', 'a.mkv')), None)
+        self.assertEqual(index.check(self.b, self.hop, path.join(self.tmp, 'out', 'b.mkv'))['source'], self.a)
+        self.assertEqual(index.release(self.a), [(self.b, path.join(self.tmp, 'out', 'b.mkv'))])
+        self.assertEqual(index.register(self.a), [])
+        self.assertFalse(path.isfile(self.filepath))
+        self.assertEqual(index.check(self.b, self.hop, path.join(self.tmp, 'out', 'b.mkv')), None)
+
+    def test_output_removed(self):
+        index = DuplicateIndex(self.filepath)
+        output = self.write('out/a.mkv')
+        index.check(self.a, self.hop, output)
+        index.register(self.a)
+        self.assertEqual(DuplicateIndex(self.filepath).check(self.b, self.hop, 'b.mkv')['source'], self.a)
+        os.remove(output)
+        self.assertEqual(DuplicateIndex(self.filepath).check(self.b, self.hop, 'b.mkv'), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, time, json, signal, unittest
+from os import path
+from threading import Lock
+from tests import TempTestCase, FAKE
+from engine import RipEngine
+from governor import Governor
+from scheduler import ScheduledQueue
+from handbrake import HandbrakeProcess
+from benchmarks.synthetic import makelibrary
+
+class Pool(object):
+    """The part of the Worker class of rip.py used by the engine"""
+
+    def __init__(self):
+        self.rip_queue = ScheduledQueue()
+        self.governor = Governor()
+        self.stager = None
+        self.lock = Lock()
+        self.engine = None
+        self.running = 0 # started, and not bookkept yet
+        self.most = 0 # HandbrakeCLI running simultaneously
+        self.results = {}
+
+    def started(self, task):
+        with self.lock:
+            self.running += 1
+            self.most = max(self.most, len(self.engine.running) + 1)
+
+    def finish(self, task, status):
+        with self.lock:
+            self.running -= 1
+            self.results[path.basename(task.filepath)] = status
+        self.rip_queue.task_done()
+
+    def done(self, task):
+        self.finish(task, 'done')
+
+    def failed(self, task):
+        self.finish(task, 'failed')
+
+    def interrupted(self, task):
+        self.finish(task, 'interrupted')
+
+class EngineTest(TempTestCase):
+
+    def setUp(self):
+        TempTestCase.setUp(self)
+        self.handbrakecli = HandbrakeProcess.handbrakecli
+        HandbrakeProcess.setbinary(FAKE)
+        self.environ = dict(os.environ)
+
+    def tearDown(self):
+        HandbrakeProcess.setbinary(self.handbrakecli)
+        os.environ.clear()
+        os.environ.update(self.environ)
+        TempTestCase.tearDown(self)
+
+    def task(self, name):
+        proc = HandbrakeProcess(self.write(name))
+        proc.setoutput(path.join(self.tmp, 'dest', name))
+        proc.setlogfile(path.join(self.tmp, name + '.log'))
+        proc.progress_handlers = []
+        return proc
+
+    def test_jobs(self):
+        os.environ['RIPPY_FAKE_RIP_DELAY'] = '0.3'
+        os.environ['RIPPY_FAKE_FAIL'] = 'c.mkv'
+        pool = Pool()
+        pool.engine = engine = RipEngine(pool, 2)
+        engine.start()
+        for name in 'abcde':
+            pool.rip_queue.put(self.task(name + '.mkv'))
+        pool.rip_queue.join()
+        engine.stop()
+        self.assertEqual(pool.most, 2)
+        self.assertEqual(pool.results, {'a.mkv': 'done', 'b.mkv': 'done', 'c.mkv': 'failed', 'd.mkv': 'done',
+                                        'e.mkv': 'done'})
+        self.assertEqual(sorted(os.listdir(path.join(self.tmp, 'dest'))), ['a.mkv', 'b.mkv', 'd.mkv', 'e.mkv'])
+
+    def test_cancel(self):
+        os.environ['RIPPY_FAKE_RIP_DELAY'] = '30'
+        pool = Pool()
+        pool.engine = engine = RipEngine(pool, 2)
+        engine.start()
+        for name in 'abc':
+            pool.rip_queue.put(self.task(name + '.mkv'))
+        while pool.running < 2:
+            time.sleep(0.05)
+        start = time.time()
+        engine.cancel()
+        while len(pool.results) < 2:
+            time.sleep(0.05)
+        engine.stop()
+        self.assertTrue(time.time() - start < 10)
+        self.assertEqual(pool.results, {'a.mkv': 'interrupted', 'b.mkv': 'interrupted'})
+        self.assertEqual(pool.rip_queue.qsize(), 1) # not started
+
+class InterruptTest(TempTestCase):
+
+    def getstates(self, journalfile):
+        """Last state of each file, read without compacting the journal rip.py writes to"""
+        states = {}
+        with open(journalfile, 'r') as readhandler:
+            for line in readhandler:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue # being written
+                states[record['file']] = record['state']
+        return states
+
+    def test_interrupt(self):
+        sources = makelibrary(path.join(self.tmp, 'library'), mkv=4)
+        dest = path.join(self.tmp, 'dest')
+        handler = signal.signal(signal.SIGINT, signal.default_int_handler) # not ignored by rip.py
+        try:
+            rip = self.spawn('-j', '2', '-d', dest, path.join(self.tmp, 'library'), RIP_DELAY=30)
+        finally:
+            signal.signal(signal.SIGINT, handler)
+        try:
+            deadline = time.time() + 30
+            journalfile = path.join(self.tmp, 'home', '.config', 'rippy', 'journal')
+            while time.time() < deadline:
+                if not path.isfile(journalfile):
+                    time.sleep(0.1)
+                    continue
+                if self.getstates(journalfile).values().count('ripping') == 2:
+                    break
+                time.sleep(0.1)
+            rip.send_signal(signal.SIGINT)
+            start = time.time()
+            self.assertEqual(rip.wait(), 130)
+            self.assertTrue(time.time() - start < 10)
+        finally:
+            if rip.poll() is None:
+                rip.kill()
+                rip.wait()
+        journal = self.getjournal()
+        states = sorted(journal.records[source]['state'] for source in sources)
+        journal.close()
+        self.assertEqual(states[:2], ['interrupted', 'interrupted'])
+        self.assertTrue(all(state in ('queued', 'scanned', 'interrupted') for state in states))
+        self.assertFalse(path.isdir(dest) and os.listdir(dest))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, json, time, socket, unittest
+from os import path
+from Queue import Queue
+from tests import TempTestCase
+import farm
+from farm import Coordinator, FarmError
+from benchmarks.synthetic import makelibrary
+
+class Task(object):
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.args = {'output': filepath + '.out'}
+        self.frames = 100
+
+class Pool(object):
+    """The part of the Worker class of rip.py used by the coordinator"""
+
+    def __init__(self, *filepaths):
+        self.finished = False
+        self.rip_queue = Queue()
+        for filepath in filepaths:
+            self.rip_queue.put(Task(filepath))
+        self.events = []
+
+    def started(self, task, worker=None):
+        self.events.append(('started', task.filepath))
+
+    def done(self, task, checksum=None):
+        self.events.append(('done', task.filepath))
+        self.rip_queue.task_done()
+
+    def failed(self, task):
+        self.events.append(('failed', task.filepath))
+        self.rip_queue.task_done()
+
+    def requeued(self, task):
+        self.events.append(('requeued', task.filepath))
+
+class CoordinatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = Pool('/a.mkv')
+        self.coordinator = Coordinator(('localhost', 0), self.pool, 's3cret')
+        self.coordinator.start()
+        self.sockets = []
+
+    def tearDown(self):
+        self.pool.finished = True
+        for sock in self.sockets:
+            sock.close()
+        self.coordinator.stop()
+
+    def connect(self):
+        sock = socket.create_connection(self.coordinator.server.server_address)
+        sock.settimeout(10)
+        self.sockets.append(sock)
+        rfile = sock.makefile('r')
+        def call(msg):
+            sock.sendall(json.dumps(msg) + '\n')
+            line = rfile.readline()
+            return json.loads(line) if line else None
+        return call
+
+    def test_address(self):
+        self.assertEqual(farm.getaddress('7000'), ('localhost', 7000))
+        self.assertEqual(farm.getaddress('0.0.0.0:7000'), ('0.0.0.0', 7000))
+        self.assertEqual(self.coordinator.server.server_address[0], '127.0.0.1')
+        self.assertRaises(FarmError, Coordinator, ('localhost', 0), self.pool, None)
+
+    def test_secret(self):
+        for hello in [{'type': 'hello', 'name': 'node'}, {'type': 'hello', 'name': 'node', 'secret': 'secret'},
+                      {'type': 'hello', 'name': 'node', 'secret': ['s3cret']}]:
+            call = self.connect()
+            self.assertEqual(call(hello)['type'], 'error')
+            self.assertEqual(call({'type': 'get'}), None) # closed
+        self.assertEqual(self.pool.events, [])
+
+    def test_no_hello(self):
+        call = self.connect()
+        self.assertEqual(call({'type': 'result', 'id': 1, 'status': 'done'}), {'type': 'error', 'error': 'no hello'})
+        self.assertEqual(call({'type': 'get'}), None)
+        self.assertEqual(self.pool.events, [])
+
+    def test_job(self):
+        call = self.connect()
+        self.assertEqual(call({'type': 'hello', 'name': 'node', 'secret': 's3cret'}), {'type': 'ok'})
+        job = call({'type': 'get'})
+        self.assertEqual((job['type'], job['filepath']), ('job', '/a.mkv'))
+        self.assertEqual(call({'type': 'result', 'id': job['id'], 'status': 'done'}), {'type': 'ok'})
+        self.assertEqual(self.pool.events, [('started', '/a.mkv'), ('done', '/a.mkv')])
+
+class FarmRipTest(TempTestCase):
+
+    def getport(self):
+        sock = socket.socket()
+        sock.bind(('localhost', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        return port
+
+    def test_farm(self):
+        makelibrary(path.join(self.tmp, 'library'), mkv=3)
+        dest = path.join(self.tmp, 'dest')
+        address = 'localhost:%d' % self.getport()
+        coordinator = self.spawn('--coordinator', address, '--farm-secret', 's3cret', '-d', dest,
+                                 path.join(self.tmp, 'library'))
+        try:
+            for i in range(100):
+                try:
+                    socket.create_connection(farm.getaddress(address)).close()
+                    break
+                except socket.error:
+                    time.sleep(0.1)
+            self.assertEqual(self.rip('--worker', address, '--farm-secret', 'other', '-j', '2'), 1)
+            self.assertFalse(path.isdir(dest))
+            self.assertEqual(self.rip('--worker', address, '--farm-secret', 's3cret', '-j', '2'), 0)
+            self.assertEqual(coordinator.wait(), 0)
+        finally:
+            if coordinator.poll() is None:
+                coordinator.kill()
+                coordinator.wait()
+        self.assertEqual(sorted(os.listdir(dest)), ['movie00000.mkv', 'movie00001.mkv', 'movie00002.mkv'])
+
+    def test_unreachable(self):
+        self.assertEqual(self.rip('--worker', 'localhost:%d' % self.getport(), '--farm-secret', 's3cret'), 1)
+
+    def test_no_secret(self):
+        self.assertEqual(self.rip('--coordinator', str(self.getport()), path.join(self.tmp, 'library')), 2)
+        self.assertEqual(self.rip('--worker', 'localhost:%d' % self.getport()), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, time, signal, unittest
+from os import path
+from subprocess import Popen
+from tests import TempTestCase
+from governor import Governor, getcputimes, getproctime
+
+class Proc(object):
+    """The attributes of a HandbrakeProcess read by the governor"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.metrics = None
+        self.started = time.time()
+
+def getstate(pid):
+    with open('/proc/%d/stat' % pid) as fhandler:
+        return fhandler.read().rsplit(')', 1)[1].split()[0]
+
+class GovernorTest(TempTestCase):
+
+    def setUp(self):
+        TempTestCase.setUp(self)
+        self.proc = Governor.proc
+        Governor.proc = path.join(self.tmp, 'proc')
+
+    def tearDown(self):
+        Governor.proc = self.proc
+        TempTestCase.tearDown(self)
+
+    def sample(self, busy, idle, pids):
+        """Writes the CPU times of the machine and of pids (pid -> ticks) in the fake /proc"""
+        self.write('proc/stat', 'cpu  %d 0 0 %d 0 0 0 0 0 0\ncpu0 0 0 0 0 0 0 0 0 0 0\n' % (busy, idle))
+        for pid, ticks in pids.items():
+            self.write('proc/%d/stat' % pid, '%d (Handbrake CLI) R 1 1 1 0 -1 0 0 0 0 0 %d %d 0 0 20 0 8 0 1' %
+                       (pid, ticks - ticks // 4, ticks // 4))
+
+    def test_proc(self):
+        self.sample(300, 700, {12: 100})
+        self.assertEqual(getcputimes(Governor.proc), (300, 1000))
+        self.assertEqual(getproctime(12, Governor.proc), 100)
+        self.assertEqual(getproctime(13, Governor.proc), None)
+        self.assertEqual(getcputimes(path.join(self.tmp, 'nowhere')), None)
+        self.assertTrue(getcputimes() is not None and getproctime(os.getpid()) is not None)
+
+    def test_load(self):
+        # The CPU used by rippy and its rips is not load
+        governor = Governor(max_load=0.5)
+        governor.register(Proc(12))
+        me = os.getpid()
+        self.sample(0, 0, {me: 0, 12: 0})
+        self.assertEqual(governor.getload(), None)
+        self.sample(900, 100, {me: 10, 12: 790})
+        self.assertAlmostEqual(governor.getload(), 0.1)
+        governor.register(Proc(13)) # started between two samples
+        self.sample(1900, 100, {me: 20, 12: 1490, 13: 200})
+        self.assertAlmostEqual(governor.getload(), 0.09)
+        governor.running = [] # 12 and 13 ended: their last CPU time is unknown
+        self.sample(2400, 600, {me: 30})
+        self.assertAlmostEqual(governor.getload(), 0.09)
+        self.sample(3300, 700, {me: 40})
+        self.assertAlmostEqual(governor.getload(), 0.89)
+
+    def test_hysteresis(self):
+        governor = Governor(max_load=0.5)
+        loads = iter([0.4, 0.6, 0.48, 0.46, 0.44, 0.6])
+        governor.getload = lambda: next(loads)
+        states = []
+        for i in range(6):
+            governor.step()
+            states.append(governor.paused)
+        # Paused above 0.5, resumed under 0.45
+        self.assertEqual(states, [False, True, True, True, False, True])
+        self.assertEqual(governor.reason, 'load')
+        self.assertFalse(governor.resumed.is_set())
+        governor.stop()
+        self.assertFalse(governor.paused)
+        self.assertTrue(governor.resumed.is_set())
+
+    def test_pause(self):
+        child = Popen(['sleep', '30'])
+        try:
+            governor = Governor(min_free=10 ** 12, dest=self.tmp)
+            governor.register(Proc(child.pid))
+            governor.step()
+            self.assertEqual((governor.paused, governor.reason), (True, 'disk'))
+            time.sleep(0.1)
+            self.assertEqual(getstate(child.pid), 'T')
+            started = Proc(None) # spawned while paused
+            governor.register(started)
+            started.pid = child.pid
+            os.kill(child.pid, signal.SIGCONT)
+            governor.step()
+            time.sleep(0.1)
+            self.assertEqual(getstate(child.pid), 'T')
+            governor.min_free = 1
+            governor.step()
+            time.sleep(0.1)
+            self.assertEqual(getstate(child.pid), 'S')
+            self.assertTrue(governor.gettime() > 0.2)
+        finally:
+            child.kill()
+            child.wait()
+
+if __name__ == '__main__':
+    unittest.main()
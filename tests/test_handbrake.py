@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import unittest
+from handbrake import HandbrakeOutputParser, Progress
+from benchmarks.synthetic import scanoutput, progresslines
+
+INPUT = """Input #0, matroska,webm, from '/media/movie.mkv':
+  Duration: 01:40:00.00, start: 0.000000, bitrate: 9000 kb/s
+    Stream #0:0(eng): Video: h264 (High), yuv420p, 1920x1080, SAR 1:1 DAR 16:9, 23.98 fps, 23.98 tbr, 1k tbn (default)
+    Stream #0:1(fre): Audio: ac3, 48000 Hz, 5.1(side), fltp, 640 kb/s (default)
+"""
+
+def parse(buf):
+    hop = HandbrakeOutputParser(buf)
+    hop.parse()
+    return hop
+
+class ParserTest(unittest.TestCase):
+
+    def test_titles(self):
+        hop = parse(scanoutput(titles=5, audio=3, subtitles=4, chapters=6, main=4))
+        self.assertEqual([t.number for t in hop.titles], ['1', '2', '3', '4', '5'])
+        self.assertEqual([t.main for t in hop.titles], [False, False, False, True, False])
+        self.assertEqual(hop.title, '4')
+        self.assertEqual(hop.playlist, '00003.mpls')
+        main = hop.titles[3]
+        self.assertEqual(hop.duration, main.duration)
+        self.assertEqual(len(main.chapters), 6)
+        self.assertEqual(len(hop.audio()), 3)
+        self.assertEqual([s.language for s in hop.subtitle()], ['nld', 'pol', 'eng', 'fra'])
+        self.assertEqual((hop.video().width, hop.video().height, hop.fps), ('1920', '1080', '23.976'))
+        # Every title keeps its own streams
+        self.assertEqual([s.language for s in hop.titles[0].subtitle], ['eng', 'fra', 'deu', 'spa'])
+
+    def test_feed(self):
+        buf = scanoutput(titles=20, audio=6, subtitles=10, main=7)
+        expected = parse(buf)
+        for chunksize in (1, 7, 4096):
+            hop = HandbrakeOutputParser()
+            for i in range(0, len(buf), chunksize):
+                hop.feed(buf[i:i + chunksize])
+            hop.close()
+            self.assertEqual([str(t) for t in hop.titles], [str(t) for t in expected.titles])
+            self.assertEqual(hop.title, '7')
+
+    def test_longest(self):
+        buf = scanoutput(titles=3, main=2).replace('  + Main Feature\n', '')
+        hop = parse(buf)
+        self.assertEqual(hop.title, str(max(hop.titles, key=lambda t: t.duration).number))
+        self.assertEqual(parse('HandBrake has exited.\n').video(), None)
+
+    def test_file(self):
+        hop = parse(INPUT + scanoutput(titles=1))
+        video = hop.video()
+        self.assertEqual((video.codec, video.profile), ('h264', 'High'))
+        self.assertEqual(video.bitrate, 9000 - sum(int(a.bitrate) for a in hop.audio()) // 1000)
+        # Only files have an input, titles of discs don't get one
+        self.assertEqual(parse(INPUT + scanoutput(titles=2)).video().codec, None)
+
+    def test_progress(self):
+        line = 'Encoding: task 1 of 2, 12.34 % (45.67 fps, avg 44.00 fps, ETA 01h02m03s)'
+        progress = Progress.parse('\r' + line)
+        self.assertEqual((progress.task, progress.tasks, progress.percent), (1, 2, 12.34))
+        self.assertEqual((progress.fps, progress.avgfps, progress.eta), (45.67, 44.0, '01h02m03s'))
+        self.assertEqual(str(progress), line)
+        self.assertEqual(str(Progress.parse('Encoding: task 2 of 2, 5.00 %')), 'Encoding: task 2 of 2, 5.00 %')
+        self.assertEqual(Progress.parse('Muxing: this may take awhile...'), None)
+        self.assertEqual(len(filter(None, map(Progress.parse, progresslines(tasks=2, steps=10)))), 22)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, unittest
+from os import path
+from tests import TempTestCase
+from journal import Journal
+from benchmarks.synthetic import makelibrary
+
+class JournalTest(TempTestCase):
+
+    def test_unfinished(self):
+        journal = Journal(path.join(self.tmp, 'journal'))
+        for f, state in [('a', 'done'), ('b', 'failed'), ('c', 'ripping'), ('d', 'interrupted'), ('e', 'queued')]:
+            journal.record(f, 'queued')
+            journal.record(f, state)
+        journal.close()
+        journal = Journal(path.join(self.tmp, 'journal'))
+        self.assertEqual(journal.unfinished(), ['b', 'c', 'd', 'e'])
+        journal.close()
+
+    def test_torn_write(self):
+        journal = Journal(path.join(self.tmp, 'journal'))
+        journal.record('a', 'ripping')
+        journal.close()
+        with open(path.join(self.tmp, 'journal'), 'a') as fhandler:
+            fhandler.write('{"file": "a", "sta')
+        journal = Journal(path.join(self.tmp, 'journal'))
+        self.assertEqual(journal.unfinished(), ['a'])
+        journal.close()
+
+    def test_unknown_state(self):
+        journal = Journal(path.join(self.tmp, 'journal'))
+        self.assertRaises(Exception, journal.record, 'a', 'lost')
+        journal.close()
+
+class RestoreTest(TempTestCase):
+
+    def test_restore(self):
+        sources = makelibrary(path.join(self.tmp, 'library'), mkv=3)
+        dest = path.join(self.tmp, 'dest')
+        self.assertEqual(self.rip('-d', dest, path.join(self.tmp, 'library'), FAIL='movie00001'), 0)
+        journal = self.getjournal()
+        self.assertEqual(journal.unfinished(), [sources[1]])
+        journal.close()
+        self.assertEqual(sorted(os.listdir(dest)), ['movie00000.mkv', 'movie00002.mkv'])
+        self.assertEqual(self.rip('-r', '-d', dest), 0)
+        journal = self.getjournal()
+        self.assertEqual(journal.unfinished(), [])
+        self.assertEqual(journal.records[sources[1]]['output'], path.join(dest, 'movie00001.mkv'))
+        journal.close()
+        self.assertEqual(sorted(os.listdir(dest)), ['movie00000.mkv', 'movie00001.mkv', 'movie00002.mkv'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import unittest
+from tests import TempTestCase
+import mkvprobe
+from mkvprobe import MkvError
+from benchmarks.synthetic import mkvheader, element
+
+class ProbeTest(TempTestCase):
+
+    def test_header(self):
+        hop = mkvprobe.probe(self.write('movie.mkv', mkvheader(audio=5, subtitles=3, duration=7205)))
+        self.assertEqual(len(hop.titles), 1)
+        self.assertEqual(hop.title, '1')
+        self.assertEqual(hop.duration, 7205)
+        video = hop.video()
+        self.assertEqual((video.width, video.height, video.fps), ('1920', '1080', '23.976'))
+        self.assertEqual((video.codec, video.profile), ('h264', 'High'))
+        self.assertTrue(video.bitrate >= 8000)
+        self.assertEqual([a.codec for a in hop.audio()], ['DTS-HD MA', 'AC3', 'TrueHD', 'E-AC3', 'DTS'])
+        self.assertEqual([a.language for a in hop.audio()], ['eng', 'fra', 'deu', 'spa', 'ita'])
+        self.assertEqual([a.type for a in hop.audio()], ['5.1 ch'] * 5)
+        self.assertEqual([s.encoding for s in hop.subtitle()], ['Bitmap'] * 3)
+
+    def test_languages(self):
+        # fre and ger, or fr-FR and de, are the fra and deu of HandbrakeCLI and the preset
+        for ietf in (False, True):
+            hop = mkvprobe.probe(self.write('movie.mkv', mkvheader(audio=2, subtitles=8, ietf=ietf)))
+            self.assertEqual([a.language for a in hop.audio()], ['eng', 'fra'])
+            self.assertEqual([s.language for s in hop.subtitle()], ['eng', 'fra', 'deu', 'spa', 'ita', 'jpn', 'nld', 'pol'])
+        self.assertEqual(mkvprobe.getlanguage({}), 'eng')
+        self.assertEqual(mkvprobe.getlanguage({mkvprobe.LANGUAGE: 'und'}), 'und')
+        self.assertEqual(mkvprobe.getlanguage({mkvprobe.LANGUAGE: 'fre', mkvprobe.LANGUAGEIETF: 'fr-CA'}), 'fra')
+        self.assertEqual(mkvprobe.getlanguage({mkvprobe.LANGUAGE: 'chi', mkvprobe.LANGUAGEIETF: 'yue-Hant'}), 'yue')
+        self.assertEqual(mkvprobe.getlanguage({mkvprobe.LANGUAGE: 'ger', mkvprobe.LANGUAGEIETF: 'x-klingon'}), 'deu')
+
+    def test_chapters(self):
+        # Truncated like HandbrakeCLI's hh:mm:ss
+        hop = mkvprobe.probe(self.write('movie.mkv', mkvheader(chapters=12, duration=7200)))
+        self.assertEqual(hop.titles[0].chapters, [600] * 12)
+        edition = element(0x45B9, element(0xB6, element(0x91, 0)) + element(0xB6, element(0x91, 1999999999)))
+        self.assertEqual(mkvprobe.getchapters(edition, 4.5), [1, 2])
+
+    def test_min_duration(self):
+        hop = mkvprobe.probe(self.write('extra.mkv', mkvheader(duration=699)))
+        self.assertEqual(hop.titles, [])
+        self.assertEqual(hop.video(), None)
+
+    def test_not_ebml(self):
+        self.assertRaises(MkvError, mkvprobe.probe, self.write('movie.mkv', 'x' * 1000))
+        self.assertRaises(MkvError, mkvprobe.probe, self.write('empty.mkv'))
+
+    def test_truncated(self):
+        header = mkvheader()
+        self.assertRaises(MkvError, mkvprobe.probe, self.write('movie.mkv', header[:len(header) // 3]))
+
+    def test_dts(self):
+        self.assertEqual(mkvprobe.getdts('DTS-HD MA 7.1'), 'DTS-HD MA')
+        self.assertEqual(mkvprobe.getdts('DTS-HD Master Audio / 5.1'), 'DTS-HD MA')
+        self.assertEqual(mkvprobe.getdts('DTS-HD High Resolution Audio'), 'DTS-HD HRA')
+        self.assertEqual(mkvprobe.getdts('dts 5.1'), 'DTS')
+        self.assertRaises(MkvError, mkvprobe.getdts, 'DTS-HD 5.1')
+        self.assertRaises(MkvError, mkvprobe.getdts, 'English')
+        self.assertRaises(MkvError, mkvprobe.getdts, '')
+
+if __name__ == '__main__':
+    unittest.main()
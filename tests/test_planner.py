@@ -0,0 +1,81 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import sys, json, unittest
+from os import path
+from StringIO import StringIO
+from tests import TempTestCase
+from planner import Planner, getmakespan, getexisting, gethms
+from benchmarks.synthetic import makelibrary
+
+class PlannerTest(TempTestCase):
+
+    def plan(self, planner, jobs=2):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            planner.report(jobs)
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def test_totals(self):
+        planner = Planner()
+        planner.add('/a.mkv', '/dest/a.mkv', 3600, 1920, 1080, 'two-pass', 4000, 640, 1800)
+        planner.add('/b.mkv', '/dest/b.mkv', 1800, 1280, 720, 'remux', 3000, 640, None)
+        planner.add('/c.mkv', '/dest/c.mkv', 1800, 720, 576, 'two-pass', None, 640, None)
+        self.assertEqual([t['bytes'] for t in planner.titles], [4640 * 1000 / 8 * 3600, 3640 * 1000 / 8 * 1800, None])
+        totals = planner.gettotals(2)
+        self.assertEqual((totals['titles'], totals['duration'], totals['seconds'], totals['wall']), (3, 7200, 1800, 1800))
+        self.assertEqual((totals['remuxed'], totals['unknown_size'], totals['unknown_time']), (1, 1, 1))
+        output = self.plan(planner)
+        self.assertTrue('1 title(s) without size' in output and '1 title(s) without rip time' in output)
+
+    def test_unknown_time(self):
+        planner = Planner()
+        planner.add('/a.mkv', '/dest/a.mkv', 3600, 1920, 1080, 'two-pass', 4000, 640, None)
+        totals = planner.gettotals(1)
+        self.assertEqual((totals['seconds'], totals['wall']), (None, None))
+        self.assertTrue('Rip time : ?, about ? with 1 job(s)' in self.plan(planner, 1))
+
+    def test_makespan(self):
+        self.assertEqual(getmakespan([3, 3, 2], 2), 5)
+        self.assertEqual(getmakespan([5, 4, 3, 3, 2, 1], 2), 9)
+        self.assertEqual(getmakespan([5, 4], 0), 9)
+        self.assertEqual(gethms(3725.6), '1:02:06')
+
+    def test_destinations(self):
+        # Both folders will be created on the filesystem of self.tmp
+        planner = Planner()
+        planner.add('/a.mkv', path.join(self.tmp, 'a', 'x', 'a.mkv'), 3600, 1920, 1080, 'two-pass', 4000, 0, None)
+        planner.add('/b.mkv', path.join(self.tmp, 'b', 'b.mkv'), 7200, 1920, 1080, 'two-pass', 4000, 0, None)
+        self.assertEqual(getexisting(path.join(self.tmp, 'a', 'x')), self.tmp)
+        destinations = planner.getdestinations()
+        self.assertEqual([d['bytes'] for d in destinations], [1800000000, 3600000000])
+        self.assertEqual([d['filesystem_bytes'] for d in destinations], [5400000000] * 2)
+        free = destinations[0]['free']
+        for title in planner.titles:
+            title['bytes'] = int(free * 0.6)
+        destinations = planner.getdestinations()
+        self.assertEqual([d['enough'] for d in destinations], [False, False])
+        self.assertTrue('NOT ENOUGH SPACE' in self.plan(planner))
+
+class PlanRipTest(TempTestCase):
+
+    def test_plan(self):
+        sources = makelibrary(path.join(self.tmp, 'library'), bluray=2, dvd=1)
+        plan = path.join(self.tmp, 'plan.json')
+        dest = path.join(self.tmp, 'dest')
+        self.assertEqual(self.rip('--plan-json', plan, '-d', dest, path.join(self.tmp, 'library')), 0)
+        self.assertFalse(path.exists(dest))
+        with open(plan) as fhandler:
+            plan = json.load(fhandler)
+        self.assertEqual(sorted(t['source'] for t in plan['titles']), sorted(sources))
+        self.assertEqual(plan['totals']['titles'], 3)
+        self.assertTrue(all(t['bytes'] > 0 for t in plan['titles']))
+        self.assertEqual([d['folder'] for d in plan['destinations']], [dest])
+
+if __name__ == '__main__':
+    unittest.main()
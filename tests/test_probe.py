@@ -0,0 +1,55 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, time, unittest
+from os import path
+from tests import TempTestCase, FAKE
+from probe import ComplexityProbe
+from cache import ScanCache
+from handbrake import HandbrakeProcess, HandbrakeOutputParser
+from benchmarks.synthetic import scanoutput
+
+class Preset(object):
+
+    def getoptions(self):
+        return [('encoder', 'x264'), ('two-pass', None), ('vb', '2000')]
+
+class ProbeTest(TempTestCase):
+
+    def setUp(self):
+        TempTestCase.setUp(self)
+        self.home = os.environ.get('HOME')
+        os.environ['HOME'] = path.join(self.tmp, 'home')
+        self.handbrakecli = HandbrakeProcess.handbrakecli
+        HandbrakeProcess.setbinary(FAKE)
+        self.source = self.write('movie.mkv', 'data')
+        self.hop = HandbrakeOutputParser(scanoutput())
+        self.hop.parse()
+
+    def tearDown(self):
+        HandbrakeProcess.setbinary(self.handbrakecli)
+        os.environ['HOME'] = self.home
+        TempTestCase.tearDown(self)
+
+    def test_measure(self):
+        probe = ComplexityProbe(Preset())
+        self.assertEqual(probe.measure(self.source, self.hop), 1024 * 8 / 1000.0 / ComplexityProbe.length)
+        HandbrakeProcess.setbinary(path.join(self.tmp, 'nowhere'))
+        self.assertEqual(probe.measure(self.source, self.hop), 1024 * 8 / 1000.0 / ComplexityProbe.length)
+        self.assertEqual(ComplexityProbe(Preset(), cache=False).measure(self.source, self.hop), None)
+
+    def test_evict(self):
+        probe = ComplexityProbe(Preset())
+        self.assertEqual(probe.cache.directory, path.join(self.tmp, 'home', '.config', 'rippy', 'probes'))
+        sources = [self.write('movie%d.mkv' % i, 'data') for i in range(3)]
+        for i, source in enumerate(sources):
+            probe.cache.put(source, 1000.0 + i)
+            stale = time.time() - ScanCache.max_age - 3600 * (i - 1)
+            os.utime(probe.cache._entrypath(source), (stale, stale))
+        probe.evict()
+        self.assertEqual([probe.measure(source, HandbrakeOutputParser()) for source in sources], [1000.0, None, None])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, sys, json, unittest
+from os import path
+from tests import TempTestCase
+from remux import RemuxProcess, canremux
+from segments import SegmentGroup
+from handbrake import VideoStream
+
+# mkvmerge -J lists a video, three audio and two subtitle tracks, mkvmerge
+# --output writes its arguments into the output
+MKVMERGE = """#! %s
+import sys, json
+args = sys.argv[1:]
+if args[0] == '-J':
+    types = ['video', 'audio', 'subtitles', 'audio', 'audio', 'subtitles']
+    print(json.dumps({'tracks': [{'id': i, 'type': t} for i, t in enumerate(types)]}))
+    sys.exit(0)
+for percent in (0, 50, 100):
+    sys.stdout.write('Progress: %%d%%%%\\r' %% percent)
+with open(args[args.index('--output') + 1], 'w') as fhandler:
+    json.dump(args, fhandler)
+sys.exit(1 if 'warning' in args[-1] else 2 if 'error' in args[-1] else 0)
+"""
+
+class RemuxTest(TempTestCase):
+
+    def setUp(self):
+        TempTestCase.setUp(self)
+        self.mkvmerge = SegmentGroup.mkvmerge
+        SegmentGroup.setbinary(self.write('mkvmerge', MKVMERGE % sys.executable))
+        os.chmod(SegmentGroup.mkvmerge, 0o755)
+
+    def tearDown(self):
+        SegmentGroup.setbinary(self.mkvmerge)
+        TempTestCase.tearDown(self)
+
+    def remux(self, source, **options):
+        proc = RemuxProcess(source)
+        for k, v in options.items():
+            proc.setoption(k, v)
+        proc.setoutput(path.join(self.tmp, 'dest', 'movie.mkv'))
+        proc.setlogfile(path.join(self.tmp, 'movie.log'))
+        percents = []
+        proc.progress_handlers = [lambda progress: percents.append(progress.percent)]
+        proc.rip()
+        with open(proc.args['output']) as fhandler:
+            return json.load(fhandler), percents
+
+    def test_canremux(self):
+        def video(codec='h264', profile='High', bitrate=4000):
+            return VideoStream(width='1920', height='1080', fps='23.976', codec=codec, profile=profile, bitrate=bitrate)
+        self.assertTrue(canremux(video(), 4000))
+        self.assertTrue(canremux(video(profile='Constrained Baseline'), 5000))
+        self.assertFalse(canremux(video(), 3999))
+        self.assertFalse(canremux(video(profile='High 10'), 5000))
+        self.assertFalse(canremux(video(codec='hevc'), 5000))
+        self.assertFalse(canremux(video(bitrate=None), 5000))
+        self.assertFalse(canremux(video(), None))
+        self.assertFalse(canremux(None, 5000))
+
+    def test_gettracks(self):
+        self.assertEqual(RemuxProcess.gettracks('movie.mkv'), ([1, 3, 4], [2, 5]))
+
+    def test_tracks(self):
+        # HandbrakeCLI positions are mapped to mkvmerge ids
+        args, percents = self.remux(self.write('movie.mkv'), audio='3,1', subtitle='2', **{'srt-file': '/a/b.srt'})
+        self.assertEqual(args[args.index('--audio-tracks') + 1], '4,1')
+        self.assertEqual(args[args.index('--subtitle-tracks') + 1], '5')
+        self.assertEqual(args[-2:], [path.join(self.tmp, 'movie.mkv'), '/a/b.srt'])
+        self.assertEqual(percents, [0.0, 50.0, 100.0])
+        args, percents = self.remux(self.write('movie.mkv'))
+        self.assertTrue('--no-audio' in args and '--no-subtitles' in args)
+
+    def test_exit_code(self):
+        self.remux(self.write('warning.mkv'))
+        self.assertRaises(Exception, self.remux, self.write('error.mkv'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import unittest
+from os import path
+from tests import TempTestCase, ROOT
+from rules import Rules, escape
+
+class RulesTest(TempTestCase):
+
+    def test_example(self):
+        rules = Rules.load(path.join(ROOT, 'presets', 'rules.example.xml'))
+        self.assertEqual(rules.getbpf(720), 0.12)
+        self.assertEqual(rules.getbpf(1920), 0.09)
+        self.assertEqual(rules.getbpf(1920, False), None)
+        self.assertEqual(rules.getpriority('/media/urgent/Movie.mkv'), 10)
+        self.assertEqual(rules.getpriority('/media/Movie.mkv'), 0)
+
+    def test_escape(self):
+        self.assertEqual(escape('/a/Movie [1080p] *?.mkv'), '/a/Movie [[]1080p] [*][?].mkv')
+
+    def test_srt(self):
+        movie = self.write('Movie [1080p].mkv')
+        srt = [self.write('Movie [1080p].srt'), self.write('Movie [1080p].fr.srt')]
+        self.write('Movie 1.srt') # matched by the unescaped [1080p]
+        self.assertEqual(Rules().getsrt(movie), srt)
+
+    def test_srt_rule(self):
+        rules = self.write('rules.xml', '<rules><srt pattern="*/Series */*" path="{dir}/subs/{name}*.srt" /></rules>')
+        rules = Rules.load(rules)
+        episode = self.write('Series [HD]/E01?.mkv')
+        self.write('Series [HD]/subs/E01x.srt')
+        srt = self.write('Series [HD]/subs/E01?.en.srt')
+        self.assertEqual(rules.getsrt(episode), [srt])
+
+    def test_srt_disc(self):
+        disc = path.dirname(path.dirname(self.write('Movie (2010) [BD]/BDMV/index.bdmv')))
+        srt = self.write('Movie (2010) [BD].srt')
+        self.assertEqual(Rules().getsrt(disc), [srt])
+        self.assertEqual(Rules().getsrt(disc + '/'), [srt])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import unittest
+from scheduler import ScheduledQueue
+
+class Task:
+    def __init__(self, name, priority=None, cost=None):
+        self.name = name
+        self.priority = priority
+        self.cost = cost
+
+TASKS = [Task('a', cost=10), Task('b', 5, 1), Task('c', cost=30), Task('d', 5, 20), Task('e', -1, 100)]
+
+class ScheduledQueueTest(unittest.TestCase):
+
+    def order(self, policy):
+        queue = ScheduledQueue(policy)
+        for task in TASKS:
+            queue.put(task)
+        return ''.join(queue.get().name for task in TASKS)
+
+    def test_fifo(self):
+        self.assertEqual(self.order('fifo'), 'bdace')
+
+    def test_priority(self):
+        self.assertEqual(self.order('priority'), 'bdace')
+
+    def test_lpt(self):
+        self.assertEqual(self.order('lpt'), 'dbcae')
+
+    def test_spt(self):
+        self.assertEqual(self.order('spt'), 'bdace')
+
+    def test_keys(self):
+        queue = ScheduledQueue('fifo')
+        self.assertEqual(queue.key(Task('a')), (0,))
+        self.assertEqual(queue.key(Task('a', 3, 50)), (-3,))
+        queue.policy = 'lpt'
+        self.assertEqual(queue.key(Task('a', 3, 50)), (-3, -50))
+        queue.policy = 'spt'
+        self.assertEqual(queue.key(Task('a', None, None)), (0, 0))
+
+    def test_peek(self):
+        queue = ScheduledQueue('lpt')
+        for task in TASKS:
+            queue.put(task)
+        self.assertEqual([task.name for task in queue.peek(2)], ['d', 'b'])
+        self.assertEqual(queue.qsize(), len(TASKS))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, sys, unittest
+from os import path
+from tests import TempTestCase
+from segments import SegmentGroup, getboundaries
+from benchmarks.synthetic import makelibrary
+
+# Appends its parts like mkvmerge, or fails with FAKE_MKVMERGE_FAIL
+MKVMERGE = """#! %s
+import os, sys
+args = sys.argv[1:]
+output = args[args.index('--output') + 1]
+with open(output, 'wb') as fhandler:
+    fhandler.write('partial')
+    if os.environ.get('FAKE_MKVMERGE_FAIL'):
+        sys.exit(2)
+    for part in args[args.index('--output') + 2:]:
+        if part != '+':
+            with open(part, 'rb') as readhandler:
+                fhandler.write(readhandler.read())
+"""
+
+class SegmentGroupTest(TempTestCase):
+
+    def setUp(self):
+        TempTestCase.setUp(self)
+        self.mkvmerge = SegmentGroup.mkvmerge
+        SegmentGroup.setbinary(self.write('mkvmerge', MKVMERGE % sys.executable))
+        os.chmod(SegmentGroup.mkvmerge, 0o755)
+        self.group = SegmentGroup(path.join(self.tmp, 'movie.mkv'), 3)
+
+    def tearDown(self):
+        SegmentGroup.setbinary(self.mkvmerge)
+        os.environ.pop('FAKE_MKVMERGE_FAIL', None)
+        TempTestCase.tearDown(self)
+
+    def ripped(self, i):
+        with open(self.group.outputs[i], 'wb') as fhandler:
+            fhandler.write(str(i))
+
+    def test_outputs(self):
+        self.assertEqual(self.group.outputs, [path.join(self.tmp, 'movie.part%d.mkv' % i) for i in range(3)])
+
+    def test_done(self):
+        for i in range(3):
+            self.ripped(i)
+        self.assertFalse(self.group.done(None))
+        self.assertFalse(self.group.done(None))
+        self.assertTrue(self.group.done(None))
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['mkvmerge', 'movie.mkv'])
+        with open(self.group.output, 'rb') as fhandler:
+            self.assertEqual(fhandler.read(), 'partial012')
+
+    def test_failed(self):
+        self.ripped(0)
+        self.ripped(2)
+        self.assertFalse(self.group.done(None))
+        self.group.failed(None)
+        self.assertTrue(path.isfile(self.group.outputs[0])) # the last part is running
+        self.assertFalse(self.group.done(None))
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['mkvmerge'])
+
+    def test_failed_last(self):
+        self.ripped(0)
+        self.ripped(1)
+        self.assertFalse(self.group.done(None))
+        self.assertFalse(self.group.done(None))
+        self.group.failed(None)
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['mkvmerge'])
+
+    def test_mkvmerge_failed(self):
+        os.environ['FAKE_MKVMERGE_FAIL'] = '1'
+        for i in range(3):
+            self.ripped(i)
+        self.group.done(None)
+        self.group.done(None)
+        self.assertRaises(Exception, self.group.done, None)
+        self.assertFalse(path.isfile(self.group.output))
+        self.assertTrue(all(path.isfile(o) for o in self.group.outputs))
+
+    def test_no_mkvmerge(self):
+        SegmentGroup.setbinary(path.join(self.tmp, 'nowhere', 'mkvmerge'))
+        for i in range(3):
+            self.ripped(i)
+        self.group.done(None)
+        self.group.done(None)
+        self.assertRaises(Exception, self.group.done, None)
+        self.assertTrue(all(path.isfile(o) for o in self.group.outputs))
+
+    def test_boundaries(self):
+        boundaries = getboundaries(600, 25, 4)
+        self.assertEqual(len(boundaries), 4)
+        self.assertEqual(boundaries[0][0], 0)
+        self.assertEqual(boundaries[-1][1], None)
+        for (start, length), (following, _) in zip(boundaries, boundaries[1:]):
+            self.assertEqual(start + length, following)
+            self.assertEqual(following % SegmentGroup.keyint, 0)
+        self.assertEqual(getboundaries(5, 25, 4), [(0, None)])
+
+class SegmentsRipTest(TempTestCase):
+
+    def test_failed_segment(self):
+        sources = makelibrary(path.join(self.tmp, 'library'), mkv=2)
+        mkvmerge = self.write('mkvmerge', MKVMERGE % sys.executable)
+        os.chmod(mkvmerge, 0o755)
+        dest = path.join(self.tmp, 'dest')
+        self.assertEqual(self.rip('--segments', '3', '-j', '3', '--mkvmerge', mkvmerge, '-d', dest,
+                                  path.join(self.tmp, 'library'), FAIL='movie00001.part1'), 0)
+        # The title of the failed segment is failed, without its other parts
+        self.assertEqual(os.listdir(dest), ['movie00000.mkv'])
+        journal = self.getjournal()
+        self.assertEqual(journal.unfinished(), [sources[1]])
+        self.assertEqual(journal.records[sources[1]]['state'], 'failed')
+        journal.close()
+
+if __name__ == '__main__':
+    unittest.main()
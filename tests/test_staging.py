@@ -0,0 +1,128 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, time, struct, unittest
+from os import path
+from tests import TempTestCase
+from staging import Stager, getclips
+from scheduler import ScheduledQueue
+
+def mpls(clips, angles=False):
+    """A BluRay playlist playing clips"""
+    items = ''
+    for clip in clips:
+        item = clip + 'M2TS' + struct.pack('>H', 0x10 if angles else 0) + '\0' * 6
+        items += struct.pack('>H', len(item)) + item
+    playlist = struct.pack('>IHHH', len(items) + 6, 0, len(clips), 0) + items
+    return 'MPLS0200' + struct.pack('>II', 16, 0) + playlist
+
+class Task(object):
+    """The part of a HandbrakeProcess used by the stager"""
+
+    def __init__(self, filepath, playlist=None):
+        self.filepath = filepath
+        self.playlist = playlist
+        self.args = {'input': filepath}
+        self.priority = None
+        self.cost = None
+
+    def setoption(self, key, value):
+        self.args[key] = value
+
+class StagerTest(TempTestCase):
+
+    def setUp(self):
+        TempTestCase.setUp(self)
+        self.directory = path.join(self.tmp, 'stage')
+        self.stager = Stager(ScheduledQueue(), self.directory, 250)
+
+    def movie(self, name, size=100):
+        return self.write('library/%s.mkv' % name, 'x' * size)
+
+    def bluray(self):
+        disc = path.join(self.tmp, 'library', 'DISC')
+        self.write('library/DISC/BDMV/index.bdmv', 'INDX')
+        self.write('library/DISC/BDMV/PLAYLIST/00000.MPLS', mpls(['00001', '00002', '00001']))
+        self.write('library/DISC/BDMV/PLAYLIST/00001.MPLS', mpls(['00003']))
+        for clip in ['00001', '00002', '00003']:
+            self.write('library/DISC/BDMV/STREAM/%s.m2ts' % clip, clip * 10)
+        return disc
+
+    def test_clips(self):
+        disc = self.bluray()
+        self.assertEqual(getclips(path.join(disc, 'BDMV', 'PLAYLIST', '00000.MPLS')), ['00001', '00002'])
+        self.assertRaises(ValueError, getclips, self.write('angles.mpls', mpls(['00001'], True)))
+        self.assertRaises(ValueError, getclips, path.join(disc, 'BDMV', 'index.bdmv'))
+        files = [relative for relative, source in Stager.getfiles(disc, '00000.mpls')]
+        self.assertEqual(files, ['DISC/BDMV/index.bdmv', 'DISC/BDMV/PLAYLIST/00000.MPLS', 'DISC/BDMV/PLAYLIST/00001.MPLS',
+                                 'DISC/BDMV/STREAM/00001.m2ts', 'DISC/BDMV/STREAM/00002.m2ts'])
+        self.assertEqual(len(Stager.getfiles(disc)), 6) # no playlist, every clip
+
+    def test_claim(self):
+        task = Task(self.movie('a'))
+        self.stager.stage(task)
+        self.stager.claim(task)
+        staged = task.args['input']
+        self.assertTrue(staged.startswith(self.directory))
+        with open(staged) as fhandler:
+            self.assertEqual(fhandler.read(), 'x' * 100)
+        # A new stager keeps it
+        self.assertEqual(Stager(ScheduledQueue(), self.directory, 250).entries.keys(), [Stager.getkey(task.filepath)])
+        self.stager.release(task)
+        # The source changed, it is copied again
+        os.utime(task.filepath, (time.time() + 10, time.time() + 10))
+        other = Task(task.filepath)
+        self.stager.claim(other)
+        self.assertEqual(other.args['input'], task.filepath)
+        self.stager.stage(other)
+        self.stager.claim(other)
+        self.assertEqual(other.args['input'], staged)
+
+    def test_budget(self):
+        tasks = [Task(self.movie(name)) for name in 'abc']
+        self.stager.stage(tasks[0])
+        self.stager.stage(tasks[1])
+        self.stager.claim(tasks[0]) # pinned, and the most recently used
+        self.stager.stage(tasks[2])
+        self.assertEqual(sorted(self.stager.entries), sorted(Stager.getkey(t.filepath) for t in (tasks[0], tasks[2])))
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(self.stager.entries))
+        large = Task(self.movie('large', 300))
+        self.stager.stage(large)
+        self.assertEqual(self.stager.skipped, set([Stager.getkey(large.filepath)]))
+
+    def test_abandoned(self):
+        task = Task(self.movie('a'))
+        copy = self.stager.copy
+        def claimed(source, destination):
+            self.stager.claim(task) # the rip starts before the end of the copy
+            return copy(source, destination)
+        self.stager.copy = claimed
+        self.stager.stage(task)
+        self.assertEqual(task.args['input'], task.filepath)
+        self.assertEqual(self.stager.entries, {})
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_unfinished(self):
+        self.write('stage/.0123.tmp/a.mkv', 'x')
+        self.write('stage/4567/a.mkv', 'x') # no marker
+        self.assertEqual(Stager(ScheduledQueue(), self.directory, 250).entries, {})
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_ahead(self):
+        queue = ScheduledQueue()
+        stager = Stager(queue, self.directory, 1000, ahead=2)
+        stager.start()
+        tasks = [Task(self.movie(name)) for name in 'abcd']
+        for task in tasks:
+            queue.put(task)
+        for i in range(100):
+            if len(stager.entries) == 2 and stager.current is None:
+                break
+            time.sleep(0.05)
+        stager.stop()
+        self.assertEqual(sorted(stager.entries), sorted(Stager.getkey(t.filepath) for t in tasks[:2]))
+
+if __name__ == '__main__':
+    unittest.main()
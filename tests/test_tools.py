@@ -0,0 +1,42 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import unittest
+from tools import getbpf, getbitrate
+
+class GetbpfTest(unittest.TestCase):
+
+    def test_references(self):
+        self.assertEqual(getbpf(1920, 1080), 0.076)
+        self.assertEqual(getbpf(1280, 720), 0.092)
+        self.assertEqual(getbpf('1920', '1080'), 0.076)
+
+    def test_width_only(self):
+        self.assertEqual(getbpf(1920), 0.076)
+
+    def test_cropped(self):
+        # Scope and 4:3 pillarboxed 1080p are rated as 1080p
+        self.assertEqual(getbpf(1920, 800), 0.076)
+        self.assertEqual(getbpf(1440, 1080), 0.076)
+
+    def test_interpolated(self):
+        dvd = getbpf(720, 576)
+        uhd = getbpf(3840, 2160)
+        self.assertTrue(0.092 < dvd < 0.13)
+        self.assertTrue(0.04 < uhd < 0.076)
+        self.assertTrue(getbpf(720, 480) > dvd)
+
+    def test_out_of_range(self):
+        self.assertEqual(getbpf(480, 270), None)
+        self.assertEqual(getbpf(7680, 4320), None)
+        self.assertEqual(getbpf(1920, 0), None)
+
+    def test_bitrate(self):
+        self.assertEqual(getbitrate(1920, 1080, 25), int(round(0.076 * 1920 * 1080 * 25 / 1000.0)))
+        self.assertEqual(getbitrate(7680, 4320, 25), None)
+        self.assertEqual(getbitrate(7680, 4320, 25, bpf=0.04), int(round(0.04 * 7680 * 4320 * 25 / 1000.0)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, shutil, tempfile, hashlib, unittest
+from os import path
+from tests import TempTestCase
+import transfer
+from transfer import Transfer
+
+class TransferTest(TempTestCase):
+
+    def setUp(self):
+        TempTestCase.setUp(self)
+        self.fadvise = transfer.posix_fadvise
+        self.getchecksum = transfer.getchecksum
+        self.data = os.urandom(300000)
+        self.checksum = hashlib.sha1(self.data).hexdigest()
+        self.scratch = None # on another filesystem than self.tmp
+        if path.isdir('/dev/shm') and os.stat('/dev/shm').st_dev != os.stat(self.tmp).st_dev:
+            self.scratch = tempfile.mkdtemp(prefix='rippy-test-', dir='/dev/shm')
+
+    def tearDown(self):
+        transfer.posix_fadvise = self.fadvise
+        transfer.getchecksum = self.getchecksum
+        if self.scratch is not None:
+            shutil.rmtree(self.scratch)
+        TempTestCase.tearDown(self)
+
+    def getscratch(self):
+        if self.scratch is None:
+            self.skipTest('no other filesystem to copy from')
+        filepath = path.join(self.scratch, 'movie.mkv')
+        with open(filepath, 'wb') as fhandler:
+            fhandler.write(self.data)
+        return filepath
+
+    def test_rename(self):
+        source = self.write('scratch/movie.mkv', self.data)
+        inode = os.stat(source).st_ino
+        destination = path.join(self.tmp, 'dest', 'movie.mkv')
+        self.assertEqual(Transfer.move(source, destination), self.checksum)
+        self.assertFalse(path.exists(source))
+        self.assertEqual(os.stat(destination).st_ino, inode)
+
+    def test_copy(self):
+        source = self.getscratch()
+        advised = []
+        def fadvise(fd, offset, length, advice):
+            advised.append(advice)
+            self.fadvise(fd, offset, length, advice)
+        if self.fadvise is not None:
+            transfer.posix_fadvise = fadvise
+        destination = path.join(self.tmp, 'dest', 'movie.mkv')
+        self.assertEqual(Transfer.move(source, destination), self.checksum)
+        self.assertFalse(path.exists(source))
+        with open(destination, 'rb') as fhandler:
+            self.assertEqual(fhandler.read(), self.data)
+        self.assertEqual(os.listdir(path.dirname(destination)), ['movie.mkv'])
+        if self.fadvise is not None: # Read back from the device, not from the page cache
+            self.assertEqual(advised, [transfer.POSIX_FADV_DONTNEED])
+
+    def test_bad_copy(self):
+        source = self.getscratch()
+        transfer.getchecksum = lambda filepath, blocksize: 'bad'
+        destination = path.join(self.tmp, 'dest', 'movie.mkv')
+        self.assertRaises(IOError, Transfer.move, source, destination)
+        self.assertTrue(path.isfile(source))
+        self.assertEqual(os.listdir(path.dirname(destination)), [])
+
+    def test_queue(self):
+        moves = Transfer(2)
+        moves.start()
+        results = []
+        for i in range(4):
+            source = self.write('scratch/movie%d.mkv' % i, self.data)
+            moves.put(source, path.join(self.tmp, 'dest', 'movie%d.mkv' % i), results.append, results.append)
+        missing = path.join(self.tmp, 'scratch', 'missing.mkv')
+        moves.put(missing, path.join(self.tmp, 'dest', 'missing.mkv'), results.append, results.append)
+        moves.queue.join()
+        moves.stop()
+        self.assertEqual(sorted(results), sorted([self.checksum] * 4 + [missing]))
+        self.assertEqual(sorted(os.listdir(path.join(self.tmp, 'dest'))), ['movie%d.mkv' % i for i in range(4)])
+
+if __name__ == '__main__':
+    unittest.main()
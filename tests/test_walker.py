@@ -0,0 +1,86 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, unittest
+import cPickle as pickle
+from os import path
+from tests import TempTestCase
+import walker
+from walker import LibraryWalker, listdir
+
+class Entry(object):
+    """DirEntry of os.scandir, for Python versions without it"""
+
+    def __init__(self, directory, name):
+        self.name = name
+        self.path = path.join(directory, name)
+
+    def is_dir(self, follow_symlinks=True):
+        if not follow_symlinks and path.islink(self.path):
+            return False
+        return path.isdir(self.path)
+
+    def is_symlink(self):
+        return path.islink(self.path)
+
+def scandir(directory):
+    return [Entry(directory, name) for name in os.listdir(directory)]
+
+class WalkerTest(TempTestCase):
+
+    def setUp(self):
+        TempTestCase.setUp(self)
+        self.scandir = walker.scandir
+        self.root = path.join(self.tmp, 'library')
+        self.movie = self.write('library/a/movie.mkv')
+        self.write('library/a/movie.nfo')
+        self.write('library/b/DISC/BDMV/index.bdmv')
+        self.write('library/b/DISC/BDMV/STREAM/00000.m2ts')
+        self.write('library/c/DVD/VIDEO_TS/VIDEO_TS.BUP')
+        os.symlink('..', path.join(self.root, 'a', 'up'))
+        os.symlink(path.join(self.root, 'b'), path.join(self.root, 'c', 'b'))
+        os.symlink(self.movie, path.join(self.root, 'c', 'link.mkv'))
+        self.sources = [self.movie, path.join(self.root, 'b', 'DISC'), path.join(self.root, 'c', 'DVD', 'VIDEO_TS'),
+                        path.join(self.root, 'c', 'link.mkv')]
+
+    def tearDown(self):
+        walker.scandir = self.scandir
+        TempTestCase.tearDown(self)
+
+    def test_listdir(self):
+        for walker.scandir in (None, scandir):
+            files, dirs = listdir(path.join(self.root, 'c'))
+            self.assertEqual(sorted(files), ['link.mkv'])
+            self.assertEqual(sorted(dirs), ['DVD'])
+
+    def test_symlinks(self):
+        # Symlinks to folders are not followed, like os.walk
+        for walker.scandir in (None, scandir):
+            self.assertEqual(sorted(LibraryWalker().walk([self.root])), sorted(self.sources))
+
+    def test_index(self):
+        indexfile = path.join(self.tmp, 'walk.index')
+        self.assertEqual(sorted(LibraryWalker(indexfile).walk([self.root])), sorted(self.sources))
+        libwalker = LibraryWalker(indexfile)
+        self.assertEqual(sorted(libwalker.walk([self.root])), sorted(self.sources))
+        self.assertEqual(libwalker.listed, 0)
+        other = self.write('library/a/other.mkv')
+        self.assertEqual(sorted(libwalker.walk([self.root])), sorted(self.sources + [other]))
+        self.assertEqual(libwalker.listed, 1)
+
+    def test_former_index(self):
+        # The index of the first version followed symlinks to folders
+        indexfile = path.join(self.tmp, 'walk.index')
+        a = path.join(self.root, 'a')
+        with open(indexfile, 'wb') as fhandler:
+            pickle.dump({a: (os.stat(a).st_mtime, ['movie.mkv'], ['up'])}, fhandler)
+        self.assertEqual(sorted(LibraryWalker(indexfile).walk([self.root])), sorted(self.sources))
+
+    def test_filters(self):
+        self.assertEqual(list(LibraryWalker(include=['*.mkv'], exclude=['c']).walk([self.root])), [self.movie])
+        self.assertEqual(list(LibraryWalker(exclude=['*.mkv']).walk([self.movie])), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, time, unittest
+from os import path
+from threading import Thread
+from tests import TempTestCase
+import watcher
+from watcher import Watcher
+
+class WatcherTest(TempTestCase):
+
+    def setUp(self):
+        TempTestCase.setUp(self)
+        self.libc = watcher._libc
+        self.tick = Watcher.tick
+        Watcher.tick = 0.05
+        self.ingest = path.join(self.tmp, 'ingest')
+        self.existing = self.write('ingest/old.mkv', 'x')
+        self.found = []
+
+    def tearDown(self):
+        watcher._libc = self.libc
+        Watcher.tick = self.tick
+        TempTestCase.tearDown(self)
+
+    def start(self, **kwargs):
+        self.watcher = Watcher([self.ingest], self.found.append, settle=0.3, interval=0.1, **kwargs)
+        t_watcher = Thread(target=self.watcher.run)
+        t_watcher.daemon = True
+        t_watcher.start()
+        self.addCleanup(t_watcher.join, 5)
+        self.addCleanup(self.watcher.stop)
+
+    def waitfor(self, count, timeout=5):
+        deadline = time.time() + timeout
+        while len(self.found) < count and time.time() < deadline:
+            time.sleep(0.02)
+        return sorted(self.found)
+
+    def ingested(self):
+        self.start(exclude=['*.part'])
+        self.assertEqual(self.waitfor(1), [self.existing])
+        # Found once its copy settled
+        movie = path.join(self.ingest, 'new', 'movie.mkv')
+        os.makedirs(path.dirname(movie))
+        with open(movie, 'wb') as fhandler:
+            for i in range(5):
+                fhandler.write('x' * 1000)
+                fhandler.flush()
+                time.sleep(0.1)
+                self.assertEqual(self.found, [self.existing])
+        self.assertEqual(self.waitfor(2), sorted([self.existing, movie]))
+        # A disc is found once, when its files settled
+        disc = path.join(self.ingest, 'DISC')
+        self.write('ingest/DISC/BDMV/index.bdmv', 'x')
+        self.write('ingest/DISC/BDMV/STREAM/00000.m2ts', 'x' * 1000)
+        self.write('ingest/skipped.part', 'x')
+        self.assertEqual(self.waitfor(3), sorted([self.existing, movie, disc]))
+        # Replaced
+        time.sleep(0.05)
+        self.write('ingest/old.mkv', 'other')
+        self.assertEqual(self.waitfor(4), sorted([self.existing, self.existing, movie, disc]))
+        time.sleep(0.5)
+        self.assertEqual(len(self.found), 4)
+
+    def test_inotify(self):
+        if watcher._libc is None:
+            self.skipTest('no inotify')
+        self.ingested()
+        self.assertTrue(self.watcher.inotify is not None)
+
+    def test_poll(self):
+        watcher._libc = None
+        self.ingested()
+        self.assertEqual(self.watcher.inotify, None)
+
+    def test_getsource(self):
+        self.write('ingest/DVD/VIDEO_TS/VIDEO_TS.BUP')
+        ifo = self.write('ingest/DVD/VIDEO_TS/VTS_01_0.IFO')
+        self.write('ingest/DISC/BDMV/index.bdmv')
+        m2ts = self.write('ingest/DISC/BDMV/STREAM/00000.m2ts')
+        nfo = self.write('ingest/other/movie.nfo')
+        source = Watcher([self.ingest], None, exclude=['*.mkv'])
+        self.assertEqual(source.getsource(ifo), path.join(self.ingest, 'DVD', 'VIDEO_TS'))
+        self.assertEqual(source.getsource(m2ts), path.join(self.ingest, 'DISC'))
+        self.assertEqual(source.getsource(nfo), None)
+        self.assertEqual(source.getsource(self.existing), None) # excluded
+        self.assertEqual(Watcher.getstamp(path.join(self.ingest, 'DISC'))[2], 2)
+        self.assertEqual(Watcher.getstamp(path.join(self.ingest, 'gone.mkv')), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,41 +3,124 @@
 # vim:fenc=utf-8
 #
 # Distributed under terms of the MIT license.
-import fcntl
 import os
 import sys
-
-def non_block_read(output):
-    """read output (stdout or stderr), non-blocking way"""
-    fd = output.fileno()
-    fl = fcntl.fcntl(fd, fcntl.F_GETFL)
-    fcntl.fcntl(fd, fcntl.F_SETFL, fl | os.O_NONBLOCK)
-    try:
-        return output.read()
-    except:
-        return ''
+import errno
+import hashlib
+import math
+import time
+import ctypes, ctypes.util
+from multiprocessing import cpu_count
 
 def intduration(duration):
     """convert hh:mm:ss to integer"""
     hh, mm, ss, = duration.split(':')
     return int(hh) * 3600 + int(mm) * 60 + int(ss)
 
-def getbpf(width):
-    """get bits/(pixels*frame) from video width"""
+# bits/(pixels*frame) of 16:9 sizes, other sizes are interpolated
+BPF_REFERENCES = [(1920 * 1080, 0.076), (1280 * 720, 0.092)]
+BPF_RANGE = (640 * 360, 3840 * 2160) # pixels of the 16:9 sizes the interpolation holds for
+
+def getbpf(width, height=None):
+    """
+    get bits/(pixels*frame) from video size, interpolated on a log scale of
+    the pixels of the 16:9 size it belongs to (1920x800 and 1440x1080 are 1080p).
+    None outside BPF_RANGE, the bpf has then to be answered.
+    """
     width = int(width)
-    if width == 1920:
-        return 0.076
-    elif width == 1280:
-        return 0.092
-    return None
-
-def getbitrate(width, height, fps, bpf=None):
-    """return bitrate computed from width, height, FPS and Bits/(pixel*frame)"""
+    height = int(height) if height is not None else width * 9 // 16
+    if height <= 0:
+        return None
+    if float(width) / height >= 16.0 / 9: # letterboxed, the width gives the size
+        pixels = width * width * 9.0 / 16
+    else: # pillarboxed or 4:3, the height does
+        pixels = height * height * 16.0 / 9
+    if not BPF_RANGE[0] <= pixels <= BPF_RANGE[1]:
+        return None
+    (p1, bpf1), (p2, bpf2) = BPF_REFERENCES
+    slope = (bpf1 - bpf2) / (math.log(p1) - math.log(p2))
+    bpf = bpf1 + slope * (math.log(pixels) - math.log(p1))
+    return round(bpf, 3)
+
+def getbitrate(width, height, fps, bpf=None, complexity=None):
+    """
+    return bitrate computed from width, height, FPS and Bits/(pixel*frame),
+    complexity being a factor measured by probe encodes
+    """
     if bpf is None:
-        bpf = getbpf(width)
+        bpf = getbpf(width, height)
     if bpf is None:
         return None
+    if complexity is not None:
+        bpf = float(bpf) * complexity
     # Bits/Frame (bpf * width * height)
     bitsperframe = float(bpf) * float(width) * float(height)
     # Bitrate (Bits/Frame * fps / 1000)
     return int(round((bitsperframe * float(fps)) / 1000.0, 0))
+
+def getthreads(jobs):
+    """split available cores between concurrent jobs"""
+    try:
+        cores = cpu_count()
+    except NotImplementedError:
+        cores = 1
+    return max(1, cores // max(1, int(jobs)))
+
+def getconfigdir(subdir=None):
+    """return (and create) ~/.config/rippy or one of its subfolders"""
+    configdir = os.path.join(os.path.expanduser('~'), '.config', 'rippy')
+    if subdir is not None:
+        configdir = os.path.join(configdir, subdir)
+    try:
+        os.makedirs(configdir)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST or not os.path.isdir(configdir):
+            raise
+    return configdir
+
+def getsize(filepath):
+    """size of a file, or of all files of a folder"""
+    if not os.path.isdir(filepath):
+        return os.path.getsize(filepath) if os.path.isfile(filepath) else None
+    size = 0
+    for root, dirs, files in os.walk(filepath):
+        for name in files:
+            size += os.path.getsize(os.path.join(root, name))
+    return size
+
+def getchecksum(filepath, blocksize=1024 * 1024):
+    """sha1 of a file"""
+    sha1 = hashlib.sha1()
+    with open(filepath, 'rb') as fhandler:
+        block = fhandler.read(blocksize)
+        while block:
+            sha1.update(block)
+            block = fhandler.read(blocksize)
+    return sha1.hexdigest()
+
+def getreference(filepath):
+    """file whose size and mtime change with a source (index file of BluRay and DVD folders)"""
+    if os.path.isdir(filepath):
+        for index in [('BDMV', 'index.bdmv'), ('VIDEO_TS.IFO',), ('VIDEO_TS', 'VIDEO_TS.IFO')]:
+            candidate = os.path.join(filepath, *index)
+            if os.path.isfile(candidate):
+                return candidate
+    return filepath
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+try:
+    _clock_gettime = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'), use_errno=True).clock_gettime
+    _clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+except (OSError, AttributeError, TypeError):
+    _clock_gettime = None
+
+def getmonotonic():
+    """seconds of CLOCK_MONOTONIC, unaffected by clock changes (time.time() where it is missing)"""
+    if _clock_gettime is None:
+        return time.time()
+    ts = _timespec()
+    if _clock_gettime(1, ctypes.byref(ts)) != 0: # CLOCK_MONOTONIC
+        return time.time()
+    return ts.tv_sec + ts.tv_nsec * 1e-9
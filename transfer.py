@@ -0,0 +1,112 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, sys, hashlib, traceback
+from os import path
+from threading import Thread
+from Queue import Queue
+from tools import getchecksum
+
+try:
+    from os import posix_fadvise, POSIX_FADV_DONTNEED
+except ImportError:
+    try:
+        import ctypes, ctypes.util
+        _fadvise = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True).posix_fadvise64
+        _fadvise.argtypes = [ctypes.c_int, ctypes.c_int64, ctypes.c_int64, ctypes.c_int]
+        POSIX_FADV_DONTNEED = 4 # Linux
+        def posix_fadvise(fd, offset, length, advice):
+            error = _fadvise(fd, offset, length, advice) # returns the error, errno is not set
+            if error != 0:
+                raise OSError(error, os.strerror(error))
+    except (ImportError, OSError, AttributeError):
+        posix_fadvise = None
+
+class Transfer:
+    """
+    Moves files ripped in a local scratch folder to their destination in the
+    background, jobs of them at a time, while the next rips go on.
+    Each file is copied by large sequential blocks into a hidden file next to
+    its destination, read back and checked against the sha1 of the original,
+    then renamed over the destination, where it is never seen half written.
+    The copy is dropped from the page cache before it is read back, so that
+    the check reads the destination device (or NFS server), where
+    posix_fadvise is available; elsewhere it only checks the copy itself.
+    Files are simply renamed when the scratch folder and the destination are
+    on the same filesystem.
+    """
+
+    blocksize = 8 * 1024 * 1024
+
+    def __init__(self, jobs=1):
+        self.jobs = max(1, jobs)
+        self.queue = Queue()
+
+    def start(self):
+        for i in range(self.jobs):
+            t_transfer = Thread(target=self.worker)
+            t_transfer.start()
+
+    def stop(self):
+        """Ends the transfer threads once the queued files are moved"""
+        for i in range(self.jobs):
+            self.queue.put(None)
+
+    def put(self, source, destination, callback, errback=None):
+        """Moves source to destination, then calls callback(checksum) or errback(source)"""
+        self.queue.put((source, destination, callback, errback))
+
+    def worker(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                source, destination, callback, errback = item
+                try:
+                    checksum = Transfer.move(source, destination)
+                except Exception:
+                    sys.stderr.write('%s: transfer to %s failed, kept\n' % (source, destination))
+                    traceback.print_exc(file=sys.stderr)
+                    if errback is not None:
+                        errback(source)
+                    continue
+                callback(checksum)
+            finally:
+                self.queue.task_done()
+
+    @staticmethod
+    def move(source, destination):
+        """Copies, verifies and renames source to destination, returns its sha1"""
+        tmp = path.join(path.dirname(destination), '.%s.part' % path.basename(destination))
+        if not path.isdir(path.dirname(destination)):
+            os.makedirs(path.dirname(destination))
+        if os.stat(source).st_dev == os.stat(path.dirname(destination)).st_dev:
+            checksum = getchecksum(source, Transfer.blocksize)
+            os.rename(source, destination)
+            return checksum
+        sha1 = hashlib.sha1()
+        try:
+            with open(source, 'rb') as fsource:
+                with open(tmp, 'wb') as ftmp:
+                    block = fsource.read(Transfer.blocksize)
+                    while block:
+                        sha1.update(block)
+                        ftmp.write(block)
+                        block = fsource.read(Transfer.blocksize)
+                    ftmp.flush()
+                    os.fsync(ftmp.fileno())
+                    if posix_fadvise is not None:
+                        posix_fadvise(ftmp.fileno(), 0, 0, POSIX_FADV_DONTNEED)
+            checksum = sha1.hexdigest()
+            if getchecksum(tmp, Transfer.blocksize) != checksum:
+                raise IOError('%s differs from %s once copied' % (tmp, source))
+            os.rename(tmp, destination)
+        except BaseException:
+            if path.exists(tmp):
+                os.remove(tmp)
+            raise
+        os.remove(source)
+        return checksum
@@ -0,0 +1,165 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os
+import cPickle as pickle
+from os import path
+from fnmatch import fnmatch
+from threading import Thread
+from Queue import Queue
+from tools import getconfigdir
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir # https://pypi.python.org/pypi/scandir
+    except ImportError:
+        scandir = None
+
+def listdir(directory):
+    """Returns files and subfolders names of directory, symlinks to folders being neither, like os.walk"""
+    files = []
+    dirs = []
+    if scandir is not None:
+        for entry in scandir(directory):
+            if entry.is_dir(follow_symlinks=False):
+                dirs.append(entry.name)
+            elif not entry.is_dir():
+                files.append(entry.name)
+    else:
+        for name in os.listdir(directory):
+            filepath = path.join(directory, name)
+            if not path.isdir(filepath):
+                files.append(name)
+            elif not path.islink(filepath):
+                dirs.append(name)
+    return files, dirs
+
+class LibraryWalker:
+    """
+    Finds sources (mkv files, BluRay and DVD folders) under several roots,
+    listing folders in parallel.
+    The listing of each folder is kept in an index with its mtime, so that
+    folders which have not changed since the last walk are not listed again,
+    only their subfolders being checked.
+    """
+
+    extensions = ['mkv']
+    version = 2 # Bump when the listings of the index change
+
+    def __init__(self, indexfile=None, include=None, exclude=None, threads=4):
+        self.indexfile = indexfile
+        self.include = include or []
+        self.exclude = exclude or []
+        self.threads = max(1, threads)
+        self.index = {} # folder -> (mtime, sources, subfolders)
+        if indexfile is not None and path.isfile(indexfile):
+            try:
+                with open(indexfile, 'rb') as fhandler:
+                    version, index = pickle.load(fhandler)
+                if version == LibraryWalker.version:
+                    self.index = index
+            except Exception: # Unreadable, or written by another version
+                self.index = {}
+        self.visited = {}
+        self.listed = 0 # folders actually listed during the last walk
+
+    @staticmethod
+    def default(include=None, exclude=None, threads=4):
+        """A walker using ~/.config/rippy/walk.index"""
+        return LibraryWalker(path.join(getconfigdir(), 'walk.index'), include, exclude, threads)
+
+    def _excluded(self, filepath):
+        name = path.basename(filepath)
+        return any(fnmatch(filepath, p) or fnmatch(name, p) for p in self.exclude)
+
+    def _included(self, filepath):
+        if len(self.include) == 0:
+            return True
+        name = path.basename(filepath)
+        return any(fnmatch(filepath, p) or fnmatch(name, p) for p in self.include)
+
+    def _list(self, directory):
+        """Returns (sources, subfolders) of directory, from the index if it has not changed"""
+        mtime = os.stat(directory).st_mtime
+        entry = self.index.get(directory)
+        if entry is None or entry[0] != mtime:
+            files, dirs = listdir(directory)
+            self.listed += 1
+            sources = [name for name in files if '.' in name and name.rsplit('.', 1)[1].lower() in LibraryWalker.extensions]
+            if 'BDMV' in (adir.upper() for adir in dirs): # BluRay folder
+                sources.append('.')
+                dirs = [adir for adir in dirs if adir.upper() != 'BDMV']
+            if 'VIDEO_TS.BUP' in (afile.upper() for afile in files): # DVD folder
+                sources.append('.')
+            entry = (mtime, sources, dirs)
+        self.visited[directory] = entry
+        return entry[1], entry[2]
+
+    def _worker(self, folders, results):
+        while True:
+            directory = folders.get()
+            try:
+                if directory is None:
+                    return
+                sources, dirs = self._list(directory)
+                for name in sources:
+                    source = path.normpath(path.join(directory, name))
+                    if self._included(source) and not self._excluded(source):
+                        results.put(source)
+                for name in dirs:
+                    subdir = path.join(directory, name)
+                    if not self._excluded(subdir):
+                        folders.put(subdir)
+            except OSError:
+                pass # Folder removed during the walk, or unreadable
+            finally:
+                folders.task_done()
+
+    def walk(self, roots):
+        """Yields sources as soon as they are found"""
+        self.visited = {}
+        self.listed = 0
+        folders = Queue()
+        results = Queue()
+        walked = []
+        for root in roots:
+            root = path.abspath(root)
+            if path.isdir(root):
+                walked.append(root)
+                folders.put(root)
+            elif self._included(root) and not self._excluded(root):
+                results.put(root)
+        threads = [Thread(target=self._worker, args=(folders, results)) for i in range(self.threads)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        def done():
+            folders.join()
+            for t in threads:
+                folders.put(None)
+            results.put(None)
+        t_done = Thread(target=done)
+        t_done.daemon = True
+        t_done.start()
+        source = results.get()
+        while source is not None:
+            yield source
+            source = results.get()
+        self.save(walked)
+
+    def save(self, roots):
+        """Saves the index, forgetting folders under roots which were not visited"""
+        if self.indexfile is None:
+            return
+        prefixes = tuple(root.rstrip(os.sep) + os.sep for root in roots)
+        index = dict((d, e) for d, e in self.index.items() if d not in roots and not d.startswith(prefixes))
+        index.update(self.visited)
+        self.index = index
+        tmp = self.indexfile + '.tmp'
+        with open(tmp, 'wb') as fhandler:
+            pickle.dump((LibraryWalker.version, index), fhandler, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, self.indexfile)
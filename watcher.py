@@ -0,0 +1,218 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Distributed under terms of the MIT license.
+
+import os, sys, time, errno, select, struct, ctypes, ctypes.util
+from os import path
+from walker import LibraryWalker, listdir
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+EVENT = struct.Struct('iIII') # wd, mask, cookie, len, followed by the name
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    _libc.inotify_init1.argtypes = [ctypes.c_int]
+    _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+except (OSError, AttributeError, TypeError):
+    _libc = None # Not Linux, the folders are polled
+
+class Inotify:
+    """
+    Minimal inotify binding (ctypes), reporting files written, moved or
+    created in a tree of folders, new subfolders being watched as they appear.
+    """
+
+    mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self):
+        if _libc is None:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self.fd = _libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self.watches = {} # wd -> folder
+
+    def watch(self, directory):
+        """Watches directory and its subfolders, silently skipping the ones which vanished"""
+        wd = _libc.inotify_add_watch(self.fd, directory, Inotify.mask)
+        if wd < 0:
+            e = ctypes.get_errno()
+            if e in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                return
+            raise OSError(e, '%s: %s' % (directory, os.strerror(e)))
+        self.watches[wd] = directory
+        try:
+            files, dirs = listdir(directory)
+        except OSError:
+            return
+        for name in dirs:
+            self.watch(path.join(directory, name))
+
+    def read(self):
+        """
+        (path, isdir) of each pending event, None meaning events were lost
+        and the folders must be listed again
+        """
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        pos = 0
+        while pos + EVENT.size <= len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, pos)
+            name = data[pos + EVENT.size:pos + EVENT.size + length].rstrip('\0')
+            pos += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                events.append(None)
+            elif mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+            elif wd in self.watches:
+                events.append((path.join(self.watches[wd], name), bool(mask & IN_ISDIR)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+class Watcher:
+    """
+    Watches ingest folders and calls onsource(source) for every new source
+    (mkv file, BluRay or DVD folder) once its copy has settled: its size,
+    mtime and number of files unchanged for settle seconds.
+    Changes are notified by inotify, or else found by listing the folders
+    every interval seconds. Sources present at start are handled too.
+    """
+
+    tick = 1 # seconds between two checks of the sources being copied
+
+    def __init__(self, roots, onsource, settle=10, interval=10, include=None, exclude=None):
+        self.roots = [path.abspath(root) for root in roots]
+        self.onsource = onsource
+        self.settle = settle
+        self.interval = interval
+        self.walker = LibraryWalker(None, include, exclude)
+        self.pending = {} # source -> (stamp, time it was last seen changing)
+        self.handled = {} # source -> stamp when it was handled
+        self.inotify = None
+        self.stopped = False
+
+    def run(self):
+        """Watches until stop(), or until KeyboardInterrupt"""
+        try:
+            self.inotify = Inotify()
+            for root in self.roots:
+                self.inotify.watch(root)
+        except OSError as e:
+            sys.stderr.write('inotify unavailable (%s), folders are listed every %ds\n' % (e, self.interval))
+            self.inotify = None
+        self.poll()
+        polled = time.time()
+        try:
+            while not self.stopped:
+                if self.inotify is not None:
+                    readable = self._select()
+                    if readable:
+                        self.notify(self.inotify.read())
+                else:
+                    time.sleep(Watcher.tick)
+                    if time.time() - polled >= self.interval:
+                        self.poll()
+                        polled = time.time()
+                self.check()
+        finally:
+            if self.inotify is not None:
+                self.inotify.close()
+
+    def stop(self):
+        self.stopped = True
+
+    def _select(self):
+        try:
+            return select.select([self.inotify.fd], [], [], Watcher.tick)[0]
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            return []
+
+    def poll(self):
+        """Lists every root, sources not handled yet become pending"""
+        for source in self.walker.walk(self.roots):
+            self.see(source)
+
+    def notify(self, events):
+        for event in events:
+            if event is None: # Events lost, the roots are listed again
+                for root in self.roots:
+                    self.inotify.watch(root)
+                self.poll()
+                continue
+            filepath, isdir = event
+            if isdir:
+                # Created or moved in with its content, which has to be found
+                self.inotify.watch(filepath)
+                for source in self.walker.walk([filepath]):
+                    self.see(source)
+            source = self.getsource(filepath)
+            if source is not None:
+                self.see(source)
+
+    def see(self, source):
+        if source not in self.pending and source not in self.handled:
+            self.pending[source] = (None, time.time())
+        elif source in self.handled and Watcher.getstamp(source) != self.handled[source]:
+            # Replaced since it was handled
+            del self.handled[source]
+            self.pending[source] = (None, time.time())
+
+    def check(self):
+        """Hands sources whose copy has settled to onsource"""
+        now = time.time()
+        for source, (stamp, changed) in list(self.pending.items()):
+            current = Watcher.getstamp(source)
+            if current is None: # Removed
+                del self.pending[source]
+            elif current != stamp:
+                self.pending[source] = (current, now)
+            elif now - changed >= self.settle:
+                del self.pending[source]
+                self.handled[source] = current
+                self.onsource(source)
+
+    def getsource(self, filepath):
+        """The source filepath belongs to, or None"""
+        if path.isfile(filepath) and '.' in filepath and filepath.rsplit('.', 1)[1].lower() in LibraryWalker.extensions:
+            return filepath if self.walker._included(filepath) and not self.walker._excluded(filepath) else None
+        directory = filepath if path.isdir(filepath) else path.dirname(filepath)
+        while any(directory == root or directory.startswith(root.rstrip(os.sep) + os.sep) for root in self.roots):
+            try:
+                files, dirs = listdir(directory)
+            except OSError:
+                return None
+            if 'BDMV' in (d.upper() for d in dirs) or 'VIDEO_TS.BUP' in (f.upper() for f in files):
+                return directory if self.walker._included(directory) and not self.walker._excluded(directory) else None
+            if directory in self.roots:
+                return None
+            directory = path.dirname(directory)
+        return None
+
+    @staticmethod
+    def getstamp(source):
+        """(size, latest mtime, number of files) of a source, None if it was removed"""
+        try:
+            if not path.isdir(source):
+                st = os.stat(source)
+                return (st.st_size, st.st_mtime, 1)
+            size = mtime = count = 0
+            for root, dirs, files in os.walk(source):
+                for name in files:
+                    st = os.stat(path.join(root, name))
+                    size += st.st_size
+                    mtime = max(mtime, st.st_mtime)
+                    count += 1
+            return (size, mtime, count)
+        except OSError:
+            return None